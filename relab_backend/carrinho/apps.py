@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CarrinhoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'carrinho'
+
+    def ready(self):
+        from .visitante import verificar_cache
+        verificar_cache()
@@ -0,0 +1,130 @@
+# carrinho/management/commands/benchmark_carrinho.py
+
+import statistics
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, connection
+from carrinho.models import QUANTIDADE_MAXIMA, Carrinho, ItemCarrinho
+from produtos.models import Produto
+
+Usuario = get_user_model()
+
+
+def adicionar_antigo(usuario_id, produto_id, quantidade):
+    """Caminho anterior ao upsert: get_or_create do carrinho e da linha e soma em Python"""
+    produto = Produto.objects.get(id=produto_id, ativo=True)
+    if produto.estoque < quantidade:
+        return None
+    carrinho, _ = Carrinho.objects.get_or_create(usuario_id=usuario_id)
+    item, criado = ItemCarrinho.objects.get_or_create(
+        carrinho=carrinho,
+        produto=produto,
+        defaults={'quantidade': quantidade, 'preco_unitario': produto.preco}
+    )
+    if not criado:
+        nova_quantidade = item.quantidade + quantidade
+        if nova_quantidade > produto.estoque or nova_quantidade > QUANTIDADE_MAXIMA:
+            return None
+        item.quantidade = nova_quantidade
+        item.save()
+    return item.id
+
+
+def adicionar_upsert(usuario_id, produto_id, quantidade):
+    return ItemCarrinho.objects.adicionar(usuario_id, produto_id, quantidade).item_id
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara o POST /carrinho/adicionar/ anterior (get_or_create + save) com o upsert de '
+        'ItemCarrinho.objects.adicionar: latência sequencial e incrementos perdidos com cliques simultâneos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=500, help='Adições sequenciais por caminho')
+        parser.add_argument('--threads', type=int, default=8, help='Cliques simultâneos no mesmo produto')
+        parser.add_argument('--cliques', type=int, default=10, help='Cliques por thread (cada um soma 1 unidade)')
+
+    def handle(self, *args, **options):
+        usuario = Usuario.objects.create_user(
+            username='benchmark-carrinho',
+            email='benchmark-carrinho@relab.co',
+            password=None,
+            cpf='00000000191',
+            telefone='11900000000',
+        )
+        produto = Produto.objects.create(
+            nome='Produto benchmark carrinho',
+            preco=Decimal('10.00'),
+            estoque=1_000_000
+        )
+        caminhos = [('get_or_create', adicionar_antigo), ('upsert', adicionar_upsert)]
+        try:
+            self.stdout.write(self.style.HTTP_INFO(f'📦 {options["repeticoes"]} adições sequenciais'))
+            for nome, adicionar in caminhos:
+                self.sequencial(nome, adicionar, usuario.id, produto.id, options['repeticoes'])
+
+            total = options['threads'] * options['cliques']
+            self.stdout.write('')
+            self.stdout.write(self.style.HTTP_INFO(
+                f'📦 {options["threads"]} threads x {options["cliques"]} cliques no mesmo produto ({total} unidades)'
+            ))
+            for nome, adicionar in caminhos:
+                self.concorrente(nome, adicionar, usuario.id, produto.id, options['threads'], options['cliques'])
+        finally:
+            produto.delete()
+            usuario.delete()
+            self.stdout.write(self.style.WARNING('🗑️  Usuário e produto sintéticos apagados'))
+
+    def sequencial(self, nome, adicionar, usuario_id, produto_id, repeticoes):
+        """Cada rodada cria a linha e a incrementa (1 unidade por vez) até o limite por produto"""
+        tempos = []
+        for i in range(repeticoes):
+            if i % QUANTIDADE_MAXIMA == 0:
+                ItemCarrinho.objects.filter(carrinho__usuario_id=usuario_id).delete()
+            inicio = time.perf_counter()
+            adicionar(usuario_id, produto_id, 1)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        tempos.sort()
+        p95 = tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))]
+        self.stdout.write(
+            f'  {nome:<14} média {statistics.mean(tempos):6.3f} ms | '
+            f'p50 {statistics.median(tempos):6.3f} ms | p95 {p95:6.3f} ms'
+        )
+
+    def concorrente(self, nome, adicionar, usuario_id, produto_id, threads, cliques):
+        Carrinho.objects.filter(usuario_id=usuario_id).delete()
+        barreira = threading.Barrier(threads)
+        erros = []
+
+        def trabalhador():
+            barreira.wait()
+            try:
+                for _ in range(cliques):
+                    try:
+                        adicionar(usuario_id, produto_id, 1)
+                    except IntegrityError as erro:
+                        erros.append(erro)
+            finally:
+                connection.close()
+
+        lista = [threading.Thread(target=trabalhador) for _ in range(threads)]
+        inicio = time.perf_counter()
+        for thread in lista:
+            thread.start()
+        for thread in lista:
+            thread.join()
+        duracao = time.perf_counter() - inicio
+
+        # Cliques além do limite por produto são recusados pelos dois caminhos
+        gravado = ItemCarrinho.objects.filter(carrinho__usuario_id=usuario_id).values_list('quantidade', flat=True).first() or 0
+        esperado = min(threads * cliques, QUANTIDADE_MAXIMA)
+        linha = (
+            f'  {nome:<14} {duracao:6.2f}s | quantidade final {gravado} (esperado {esperado}) | '
+            f'{len(erros)} IntegrityError(s)'
+        )
+        self.stdout.write(self.style.SUCCESS(linha) if gravado == esperado and not erros else self.style.WARNING(linha))
@@ -0,0 +1,53 @@
+# carrinho/management/commands/purgar_carrinhos.py
+
+from datetime import timedelta
+
+from django.utils import timezone
+from carrinho.models import Carrinho, ItemCarrinho
+from produtos.models import ReservaEstoque
+from usuarios.purga import ComandoPurga
+
+# Carrinhos da faixa sem alteração (nem no carrinho nem nas linhas) desde o
+# limite, com as linhas e reservas deles. SKIP LOCKED pula o carrinho que um
+# adicionar/sincronizar está usando agora.
+APAGAR = """
+    WITH alvo AS (
+        SELECT carrinho.id FROM {carrinhos} carrinho
+        WHERE carrinho.id >= %(de)s AND carrinho.id < %(ate)s AND carrinho.atualizado_em < %(limite)s
+          AND NOT EXISTS (
+              SELECT 1 FROM {itens} item WHERE item.carrinho_id = carrinho.id AND item.atualizado_em >= %(limite)s
+          )
+        FOR UPDATE SKIP LOCKED
+    ),
+    itens AS (
+        DELETE FROM {itens} WHERE carrinho_id IN (SELECT id FROM alvo) RETURNING 1
+    ),
+    reservas AS (
+        DELETE FROM {reservas} WHERE dono_tipo = 'carrinho' AND dono_id IN (SELECT id FROM alvo)
+    ),
+    carrinhos AS (
+        DELETE FROM {carrinhos} WHERE id IN (SELECT id FROM alvo) RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM carrinhos), (SELECT COUNT(*) FROM itens)
+"""
+
+
+class Command(ComandoPurga):
+    help = 'Apaga, em faixas de id, os carrinhos abandonados (sem alteração há mais de --dias dias) e seus itens'
+    modelo = Carrinho
+    sql = APAGAR
+    rotulos = ('carrinho(s)', 'item(ns)')
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--dias', type=int, default=60, help='Dias sem alteração para o carrinho ser apagado')
+
+    def tabelas(self):
+        return {
+            'carrinhos': Carrinho._meta.db_table,
+            'itens': ItemCarrinho._meta.db_table,
+            'reservas': ReservaEstoque._meta.db_table,
+        }
+
+    def parametros(self, options):
+        return {'limite': timezone.now() - timedelta(days=options['dias'])}
@@ -1,6 +1,173 @@
-from django.db import models
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, models, transaction
+from django.db.models import F, OuterRef, Prefetch, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
-from produtos.models import Produto
+from django.utils import timezone
+from produtos.models import Produto, ReservaEstoque
+
+# Limite de unidades de um mesmo produto no carrinho
+QUANTIDADE_MAXIMA = 99
+
+# Operações aceitas por ItemCarrinho.objects.sincronizar()
+DEFINIR, ADICIONAR_UNIDADES, REMOVER = 'definir', 'adicionar', 'remover'
+
+# Resultado de ItemCarrinho.objects.adicionar(): item_id None quando a quantidade passou do limite
+Adicao = namedtuple('Adicao', 'item_id quantidade criado estoque quantidade_anterior')
+
+# Upsert do carrinho e da linha num único statement. O ON CONFLICT trava a
+# linha existente e soma sobre a versão mais recente dela, então cliques
+# simultâneos não perdem incrementos nem esbarram no unique (carrinho, produto).
+# O limite é o estoque disponível: descontadas as reservas ativas dos outros
+# carrinhos (mesma conta de ProdutoQuerySet.com_estoque_disponivel).
+ADICIONAR = """
+    WITH produto AS (
+        SELECT id, preco, estoque - COALESCE((
+            SELECT SUM(reserva.quantidade) FROM {reservas} reserva
+            WHERE reserva.produto_id = %(produto)s AND reserva.dono_tipo = 'carrinho'
+              AND reserva.expira_em > %(agora)s
+              AND reserva.dono_id IS DISTINCT FROM (SELECT id FROM {carrinhos} WHERE usuario_id = %(usuario)s)
+        ), 0) AS estoque
+        FROM {produtos} WHERE id = %(produto)s AND ativo
+    ),
+    carrinho AS (
+        INSERT INTO {carrinhos} (usuario_id, criado_em, atualizado_em) VALUES (%(usuario)s, %(agora)s, %(agora)s)
+        ON CONFLICT (usuario_id) DO UPDATE SET atualizado_em = EXCLUDED.atualizado_em
+        RETURNING id
+    ),
+    linha AS (
+        INSERT INTO {itens} AS item (carrinho_id, produto_id, quantidade, preco_unitario, criado_em, atualizado_em)
+        SELECT carrinho.id, produto.id, %(quantidade)s, produto.preco, %(agora)s, %(agora)s
+        FROM carrinho, produto
+        WHERE %(quantidade)s <= LEAST(produto.estoque, %(maximo)s)
+        ON CONFLICT (carrinho_id, produto_id) DO UPDATE SET
+            quantidade = item.quantidade + EXCLUDED.quantidade,
+            atualizado_em = EXCLUDED.atualizado_em
+        WHERE item.quantidade + EXCLUDED.quantidade <= LEAST((SELECT estoque FROM produto), %(maximo)s)
+        RETURNING item.id, item.quantidade, item.xmax = 0 AS criado
+    )
+    SELECT linha.id, linha.quantidade, linha.criado, produto.estoque,
+           (SELECT quantidade FROM {itens} WHERE carrinho_id = (SELECT id FROM carrinho) AND produto_id = produto.id)
+    FROM produto LEFT JOIN linha ON true
+"""
+
+# Reservas do carrinho do usuário iguais às linhas dele (ver ReservaEstoque):
+# cria/atualiza uma por produto com o prazo renovado e apaga as que sobraram.
+RESERVAR = """
+    WITH carrinho AS (
+        SELECT id FROM {carrinhos} WHERE usuario_id = %(usuario)s
+    ),
+    linhas AS (
+        SELECT produto_id, quantidade FROM {itens} WHERE carrinho_id = (SELECT id FROM carrinho)
+    ),
+    sobras AS (
+        DELETE FROM {reservas} reserva USING carrinho
+        WHERE reserva.dono_tipo = 'carrinho' AND reserva.dono_id = carrinho.id
+          AND reserva.produto_id NOT IN (SELECT produto_id FROM linhas)
+    )
+    INSERT INTO {reservas} AS reserva (produto_id, quantidade, dono_tipo, dono_id, expira_em, criado_em)
+    SELECT linhas.produto_id, linhas.quantidade, 'carrinho', carrinho.id, %(expira)s, %(agora)s
+    FROM carrinho, linhas
+    ON CONFLICT (dono_tipo, dono_id, produto_id) DO UPDATE SET
+        quantidade = EXCLUDED.quantidade,
+        expira_em = EXCLUDED.expira_em
+"""
+
+# Carrinho de visitante somado ao do usuário no login (ver carrinho/visitante.py).
+# O limite é o estoque disponível, como em ADICIONAR: descontadas as reservas
+# ativas dos outros carrinhos. Uma linha que já existia nunca diminui, mesmo
+# se o estoque caiu depois.
+MESCLAR = """
+    WITH carrinho AS (
+        INSERT INTO {carrinhos} (usuario_id, criado_em, atualizado_em) VALUES (%(usuario)s, %(agora)s, %(agora)s)
+        ON CONFLICT (usuario_id) DO UPDATE SET atualizado_em = EXCLUDED.atualizado_em
+        RETURNING id
+    ),
+    disponivel AS (
+        SELECT produto.id, produto.estoque - COALESCE((
+            SELECT SUM(reserva.quantidade) FROM {reservas} reserva
+            WHERE reserva.produto_id = produto.id AND reserva.dono_tipo = 'carrinho'
+              AND reserva.expira_em > %(agora)s
+              AND reserva.dono_id IS DISTINCT FROM (SELECT id FROM carrinho)
+        ), 0) AS estoque
+        FROM {produtos} produto WHERE produto.id = ANY(%(produtos)s::bigint[]) AND produto.ativo
+    )
+    INSERT INTO {itens} AS item (carrinho_id, produto_id, quantidade, preco_unitario, criado_em, atualizado_em)
+    SELECT carrinho.id, disponivel.id, LEAST(visitante.quantidade, disponivel.estoque, %(maximo)s),
+           visitante.preco_unitario, %(agora)s, %(agora)s
+    FROM carrinho
+    CROSS JOIN unnest(%(produtos)s::bigint[], %(quantidades)s::integer[], %(precos)s::numeric[])
+        AS visitante (produto_id, quantidade, preco_unitario)
+    JOIN disponivel ON disponivel.id = visitante.produto_id
+    WHERE disponivel.estoque > 0
+    ON CONFLICT (carrinho_id, produto_id) DO UPDATE SET
+        quantidade = GREATEST(item.quantidade, LEAST(
+            item.quantidade + EXCLUDED.quantidade,
+            (SELECT estoque FROM disponivel WHERE id = EXCLUDED.produto_id),
+            %(maximo)s
+        )),
+        atualizado_em = EXCLUDED.atualizado_em
+"""
+
+
+def aplicar_operacoes(atuais, operacoes, produtos):
+    """
+    Quantidades finais ({produto_id: quantidade}) depois de aplicar
+    `operacoes` em ordem sobre `atuais`, e os erros ({produto_id: mensagem})
+    das linhas alteradas, conferidas com `produtos` ({id: {'ativo', 'estoque'}}).
+    Só o resultado final de cada produto é validado.
+    """
+    finais = dict(atuais)
+    for operacao in operacoes:
+        produto_id = operacao['produto_id']
+        if operacao['acao'] == DEFINIR:
+            finais[produto_id] = operacao['quantidade']
+        elif operacao['acao'] == ADICIONAR_UNIDADES:
+            finais[produto_id] += operacao['quantidade']
+        else:
+            finais[produto_id] = 0
+
+    erros = {}
+    for produto_id, quantidade in finais.items():
+        produto = produtos.get(produto_id)
+        if quantidade == atuais[produto_id] or quantidade == 0:
+            continue
+        if produto is None:
+            erros[produto_id] = 'Produto não encontrado.'
+        elif not produto['ativo']:
+            erros[produto_id] = 'Este produto não está mais disponível.'
+        elif quantidade > produto['estoque']:
+            erros[produto_id] = f'Estoque insuficiente. Disponível: {produto["estoque"]}'
+        elif quantidade > QUANTIDADE_MAXIMA:
+            erros[produto_id] = f'Quantidade máxima por produto é {QUANTIDADE_MAXIMA}'
+    return finais, erros
+
+
+class CarrinhoQuerySet(models.QuerySet):
+
+    def snapshot(self, itens=True):
+        """
+        Carrinho pronto para serialização: totais calculados no banco e itens
+        com produto e categoria numa única consulta (2 queries no total,
+        independente da quantidade de itens). Com itens=False (ex.: só os
+        totais, ?fields=total_itens,total), os itens não são carregados.
+        """
+        queryset = self.annotate(
+            total_itens_calculado=Coalesce(Sum('itens__quantidade'), 0),
+            subtotal_calculado=Coalesce(
+                Sum(F('itens__quantidade') * F('itens__preco_unitario')),
+                Value(Decimal('0.00')),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2)
+            ),
+        )
+        if not itens:
+            return queryset
+
+        itens = ItemCarrinho.objects.select_related('produto__categoria').defer('produto__busca')
+        return queryset.prefetch_related(Prefetch('itens', queryset=itens))
 
 
 class Carrinho(models.Model):
@@ -13,6 +180,8 @@ class Carrinho(models.Model):
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_em = models.DateTimeField(auto_now=True)
 
+    objects = CarrinhoQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Carrinho'
         verbose_name_plural = 'Carrinhos'
@@ -24,11 +193,15 @@ class Carrinho(models.Model):
     @property
     def total_itens(self):
         """Quantidade total de itens no carrinho"""
+        if hasattr(self, 'total_itens_calculado'):
+            return self.total_itens_calculado
         return sum(item.quantidade for item in self.itens.all())
 
     @property
     def subtotal(self):
         """Valor total dos produtos (sem frete)"""
+        if hasattr(self, 'subtotal_calculado'):
+            return self.subtotal_calculado
         return sum(item.subtotal for item in self.itens.all())
 
     @property
@@ -41,6 +214,146 @@ class Carrinho(models.Model):
         self.itens.all().delete()
 
 
+class ItemCarrinhoQuerySet(models.QuerySet):
+
+    def adicionar(self, usuario_id, produto_id, quantidade):
+        """
+        Soma `quantidade` do produto ao carrinho do usuário (criando o carrinho
+        e a linha se preciso) num único statement, respeitando o estoque e
+        QUANTIDADE_MAXIMA. Retorna Adicao (item_id None se passou do limite,
+        com o estoque e a quantidade anterior para a mensagem) ou None se o
+        produto não existe ou está inativo.
+        """
+        if not 0 < produto_id < 2 ** 63:
+            return None
+        sql = ADICIONAR.format(
+            produtos=Produto._meta.db_table,
+            carrinhos=Carrinho._meta.db_table,
+            itens=self.model._meta.db_table,
+            reservas=ReservaEstoque._meta.db_table,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'usuario': usuario_id,
+                'produto': produto_id,
+                'quantidade': quantidade,
+                'maximo': QUANTIDADE_MAXIMA,
+                'agora': timezone.now(),
+            })
+            linha = cursor.fetchone()
+        if linha is None:
+            return None
+        adicao = Adicao(*linha)
+        if adicao.item_id is not None:
+            self.reservar(usuario_id)
+        return adicao
+
+    def reservar(self, usuario_id):
+        """
+        Renova as reservas de estoque do carrinho do usuário (um statement):
+        uma por linha, com a quantidade atual e prazo de
+        RESERVA_CARRINHO_MINUTOS; reservas de produtos que saíram são apagadas.
+        """
+        agora = timezone.now()
+        sql = RESERVAR.format(
+            carrinhos=Carrinho._meta.db_table,
+            itens=self.model._meta.db_table,
+            reservas=ReservaEstoque._meta.db_table,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'usuario': usuario_id,
+                'agora': agora,
+                'expira': agora + timedelta(minutes=settings.RESERVA_CARRINHO_MINUTOS),
+            })
+
+    def sincronizar(self, usuario, operacoes):
+        """
+        Aplica uma lista de operações {acao, produto_id, quantidade} ao
+        carrinho do usuário numa transação, na ordem recebida. O carrinho fica
+        travado durante a aplicação; produtos, estoque e quantidades atuais
+        vêm numa única consulta e o resultado é gravado com um DELETE e um
+        INSERT ... ON CONFLICT, independente da quantidade de linhas.
+        Retorna {produto_id: erro} (vazio se aplicou); com qualquer erro nada
+        é gravado.
+        """
+        with transaction.atomic():
+            # Upsert do carrinho: trava a linha até o fim da transação (como em adicionar())
+            carrinho, = Carrinho.objects.bulk_create(
+                [Carrinho(usuario=usuario)],
+                update_conflicts=True,
+                unique_fields=['usuario'],
+                update_fields=['atualizado_em'],
+            )
+            ids = {operacao['produto_id'] for operacao in operacoes}
+            no_carrinho = self.filter(carrinho=carrinho, produto=OuterRef('pk')).order_by().values('quantidade')
+            produtos = {
+                produto['id']: dict(produto, estoque=produto['estoque_disponivel'])
+                for produto in Produto.objects.filter(id__in=ids).com_estoque_disponivel(carrinho.id).annotate(
+                    no_carrinho=Subquery(no_carrinho)
+                ).order_by().values('id', 'preco', 'estoque_disponivel', 'ativo', 'no_carrinho')
+            }
+
+            atuais = dict.fromkeys(ids, 0)
+            atuais.update({produto_id: produto['no_carrinho'] or 0 for produto_id, produto in produtos.items()})
+            finais, erros = aplicar_operacoes(atuais, operacoes, produtos)
+            if erros:
+                # Desfaz também o upsert: sem isso sobra um carrinho vazio para quem não tinha
+                transaction.set_rollback(True)
+                return erros
+
+            removidos = [produto_id for produto_id, quantidade in finais.items() if quantidade == 0 and atuais[produto_id]]
+            if removidos:
+                self.filter(carrinho=carrinho, produto_id__in=removidos).delete()
+            gravados = [
+                self.model(
+                    carrinho=carrinho,
+                    produto_id=produto_id,
+                    quantidade=quantidade,
+                    preco_unitario=produtos[produto_id]['preco'],
+                )
+                for produto_id, quantidade in finais.items()
+                if quantidade and quantidade != atuais[produto_id]
+            ]
+            if gravados:
+                # Linhas existentes mantêm o preço do momento em que foram adicionadas
+                self.bulk_create(
+                    gravados,
+                    update_conflicts=True,
+                    unique_fields=['carrinho', 'produto'],
+                    update_fields=['quantidade', 'atualizado_em'],
+                )
+            self.reservar(usuario.id)
+        return {}
+
+    def mesclar(self, usuario_id, itens):
+        """
+        Soma os itens de um carrinho de visitante ({produto_id: (quantidade,
+        preco_unitario)}) ao carrinho do usuário num único upsert. Aqui não há
+        a quem responder com erro: a quantidade é limitada ao estoque
+        disponível e a QUANTIDADE_MAXIMA e produtos inativos ou esgotados são
+        ignorados.
+        """
+        if not itens:
+            return
+        sql = MESCLAR.format(
+            produtos=Produto._meta.db_table,
+            carrinhos=Carrinho._meta.db_table,
+            itens=self.model._meta.db_table,
+            reservas=ReservaEstoque._meta.db_table,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'usuario': usuario_id,
+                'produtos': list(itens),
+                'quantidades': [quantidade for quantidade, _ in itens.values()],
+                'precos': [preco_unitario for _, preco_unitario in itens.values()],
+                'maximo': QUANTIDADE_MAXIMA,
+                'agora': timezone.now(),
+            })
+        self.reservar(usuario_id)
+
+
 class ItemCarrinho(models.Model):
     """Item individual do carrinho"""
     carrinho = models.ForeignKey(
@@ -61,6 +374,8 @@ class ItemCarrinho(models.Model):
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_em = models.DateTimeField(auto_now=True)
 
+    objects = ItemCarrinhoQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Item do Carrinho'
         verbose_name_plural = 'Itens do Carrinho'
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Carrinho, ItemCarrinho
+from produtos.campos import CamposDinamicosMixin
+from .models import ADICIONAR_UNIDADES, DEFINIR, QUANTIDADE_MAXIMA, REMOVER, Carrinho, ItemCarrinho
 
 
 class ProdutoCarrinhoSerializer(serializers.Serializer):
@@ -76,7 +77,7 @@ class ItemCarrinhoSerializer(serializers.ModelSerializer):
 class AdicionarItemSerializer(serializers.Serializer):
     """Serializer para adicionar item ao carrinho"""
     produto_id = serializers.IntegerField()
-    quantidade = serializers.IntegerField(default=1, min_value=1, max_value=99)
+    quantidade = serializers.IntegerField(default=1, min_value=1, max_value=QUANTIDADE_MAXIMA)
 
 
 class AtualizarQuantidadeSerializer(serializers.Serializer):
@@ -84,7 +85,25 @@ class AtualizarQuantidadeSerializer(serializers.Serializer):
     quantidade = serializers.IntegerField(min_value=1, max_value=99)
 
 
-class CarrinhoSerializer(serializers.ModelSerializer):
+class OperacaoCarrinhoSerializer(serializers.Serializer):
+    """Uma operação de POST /carrinho/sincronizar/"""
+    acao = serializers.ChoiceField(choices=[DEFINIR, ADICIONAR_UNIDADES, REMOVER])
+    produto_id = serializers.IntegerField(min_value=1, max_value=2 ** 63 - 1)
+    quantidade = serializers.IntegerField(required=False, min_value=1, max_value=QUANTIDADE_MAXIMA)
+
+    def validate(self, data):
+        if data['acao'] == DEFINIR and 'quantidade' not in data:
+            raise serializers.ValidationError({'quantidade': 'Obrigatória para "definir".'})
+        data.setdefault('quantidade', 1)
+        return data
+
+
+class SincronizarCarrinhoSerializer(serializers.Serializer):
+    """Serializer para aplicar várias operações ao carrinho de uma vez"""
+    operacoes = OperacaoCarrinhoSerializer(many=True, allow_empty=False, max_length=100)
+
+
+class CarrinhoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer completo do carrinho"""
     itens = ItemCarrinhoSerializer(many=True, read_only=True)
     total_itens = serializers.IntegerField(read_only=True)
@@ -1,3 +1,482 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
+
+from produtos.models import Categoria, Produto, ReservaEstoque
+from .models import Carrinho, ItemCarrinho
+from .visitante import CABECALHO, verificar_cache
+
+Usuario = get_user_model()
+
+
+class CarrinhoQueryCountTests(APITestCase):
+    """
+    Cada ação do carrinho deve executar um número constante de queries,
+    independente da quantidade de itens (carrinho com 1 ou 30 linhas).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(
+            username='cliente',
+            email='cliente@relab.co',
+            password='senha-forte-123',
+            cpf='12345678901',
+            telefone='11987654321',
+        )
+        cls.categorias = [Categoria.objects.create(nome=f'Categoria {i}') for i in range(3)]
+        cls.produtos = [
+            Produto.objects.create(
+                nome=f'Produto {i}',
+                categoria=cls.categorias[i % 3],
+                preco=Decimal('10.00') + i,
+                estoque=100,
+            )
+            for i in range(31)
+        ]
+
+    def setUp(self):
+        self.client.force_authenticate(self.usuario)
+
+    def preencher_carrinho(self, linhas):
+        carrinho, _ = Carrinho.objects.get_or_create(usuario=self.usuario)
+        for produto in self.produtos[:linhas]:
+            ItemCarrinho.objects.create(
+                carrinho=carrinho,
+                produto=produto,
+                quantidade=2,
+                preco_unitario=produto.preco,
+            )
+        return carrinho
+
+    def assertQueriesConstantes(self, queries, requisicao):
+        for linhas in (1, 30):
+            with self.subTest(linhas=linhas):
+                ItemCarrinho.objects.all().delete()
+                carrinho = self.preencher_carrinho(linhas)
+                item = carrinho.itens.first()
+                with self.assertNumQueries(queries):
+                    response = requisicao(item)
+                self.assertLess(response.status_code, 300, response.data)
+
+    def test_list(self):
+        self.assertQueriesConstantes(2, lambda item: self.client.get('/api/v1/carrinho/'))
+
+    def test_adicionar(self):
+        produto = self.produtos[30]
+        self.assertQueriesConstantes(4, lambda item: self.client.post(
+            '/api/v1/carrinho/adicionar/',
+            {'produto_id': produto.id, 'quantidade': 1},
+            format='json'
+        ))
+
+    def test_atualizar(self):
+        self.assertQueriesConstantes(6, lambda item: self.client.patch(
+            f'/api/v1/carrinho/{item.id}/atualizar/',
+            {'quantidade': 3},
+            format='json'
+        ))
+
+    def test_remover(self):
+        self.assertQueriesConstantes(5, lambda item: self.client.delete(
+            f'/api/v1/carrinho/{item.id}/remover/'
+        ))
+
+    def test_limpar(self):
+        self.assertQueriesConstantes(4, lambda item: self.client.delete('/api/v1/carrinho/limpar/'))
+
+    def test_sincronizar(self):
+        self.assertQueriesConstantes(9, lambda item: self.client.post(
+            '/api/v1/carrinho/sincronizar/',
+            {'operacoes': [
+                {'acao': 'remover', 'produto_id': self.produtos[0].id},
+                {'acao': 'adicionar', 'produto_id': self.produtos[30].id, 'quantidade': 2},
+                {'acao': 'definir', 'produto_id': self.produtos[29].id, 'quantidade': 4},
+            ] + [
+                {'acao': 'definir', 'produto_id': produto.id, 'quantidade': 5} for produto in self.produtos[10:20]
+            ]},
+            format='json'
+        ))
+
+    def test_sincronizar_aplica_em_ordem(self):
+        carrinho = self.preencher_carrinho(2)
+        a, b, c = self.produtos[:3]
+
+        response = self.client.post('/api/v1/carrinho/sincronizar/', {'operacoes': [
+            {'acao': 'adicionar', 'produto_id': a.id, 'quantidade': 3},
+            {'acao': 'remover', 'produto_id': b.id},
+            {'acao': 'adicionar', 'produto_id': c.id},
+            {'acao': 'definir', 'produto_id': c.id, 'quantidade': 7},
+            {'acao': 'adicionar', 'produto_id': c.id, 'quantidade': 1},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            dict(carrinho.itens.values_list('produto_id', 'quantidade')),
+            {a.id: 5, c.id: 8}
+        )
+        self.assertEqual(response.data['total_itens'], 13)
+
+    def test_sincronizar_tudo_ou_nada(self):
+        carrinho = self.preencher_carrinho(1)
+        produto = self.produtos[1]
+        Produto.objects.filter(pk=produto.pk).update(estoque=4)
+
+        response = self.client.post('/api/v1/carrinho/sincronizar/', {'operacoes': [
+            {'acao': 'remover', 'produto_id': self.produtos[0].id},
+            {'acao': 'definir', 'produto_id': produto.id, 'quantidade': 5},
+            {'acao': 'adicionar', 'produto_id': 10 ** 9},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['produtos'], {
+            produto.id: 'Estoque insuficiente. Disponível: 4',
+            10 ** 9: 'Produto não encontrado.',
+        })
+        self.assertEqual(list(carrinho.itens.values_list('produto_id', flat=True)), [self.produtos[0].id])
+
+        response = self.client.post('/api/v1/carrinho/sincronizar/', {'operacoes': [
+            {'acao': 'definir', 'produto_id': produto.id},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_sincronizar_com_erro_nao_cria_carrinho(self):
+        response = self.client.post('/api/v1/carrinho/sincronizar/', {'operacoes': [
+            {'acao': 'adicionar', 'produto_id': self.produtos[0].id},
+            {'acao': 'adicionar', 'produto_id': 10 ** 9},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Carrinho.objects.filter(usuario=self.usuario).exists())
+
+    def test_snapshot_totais(self):
+        self.preencher_carrinho(3)
+        response = self.client.get('/api/v1/carrinho/')
+
+        esperado = sum((produto.preco * 2 for produto in self.produtos[:3]), Decimal('0.00'))
+        self.assertEqual(response.data['total_itens'], 6)
+        self.assertEqual(Decimal(response.data['subtotal']), esperado)
+        self.assertEqual(Decimal(response.data['total']), esperado)
+        self.assertEqual(len(response.data['itens']), 3)
+        self.assertIsNotNone(response.data['itens'][0]['produto_detalhes']['categoria_nome'])
+
+
+class CarrinhoVisitanteTests(APITestCase):
+    """
+    Sem login o carrinho fica só no cache (cabeçalho X-Carrinho) e é somado
+    ao carrinho do usuário no login. Nada é gravado no banco antes disso.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(
+            username='visitante',
+            email='visitante@relab.co',
+            password='senha-forte-123',
+            cpf='11122233344',
+            telefone='11987654321',
+        )
+        cls.produtos = [
+            Produto.objects.create(nome=f'Produto {i}', preco=Decimal('10.00') + i, estoque=10) for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cache_local_e_recusado(self):
+        for backend in ('locmem.LocMemCache', 'dummy.DummyCache'):
+            caches = {
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'carrinhos': {'BACKEND': f'django.core.cache.backends.{backend}'},
+            }
+            with self.subTest(backend=backend), override_settings(CACHES=caches):
+                with self.assertRaises(ImproperlyConfigured):
+                    verificar_cache()
+        verificar_cache()
+
+    def adicionar(self, produto, quantidade=1, token=None):
+        cabecalhos = {CABECALHO: token} if token else {}
+        return self.client.post(
+            '/api/v1/carrinho/adicionar/',
+            {'produto_id': produto.id, 'quantidade': quantidade},
+            format='json',
+            headers=cabecalhos
+        )
+
+    def test_carrinho_so_no_cache(self):
+        response = self.client.get('/api/v1/carrinho/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_itens'], 0)
+        self.assertNotIn(CABECALHO, response)
+
+        response = self.adicionar(self.produtos[0], 2)
+        self.assertEqual(response.status_code, 201)
+        token = response[CABECALHO]
+
+        response = self.adicionar(self.produtos[0], 1, token)
+        self.assertEqual(response.status_code, 200)
+        response = self.adicionar(self.produtos[1], 1, token)
+        self.assertEqual(response.data['total_itens'], 4)
+        self.assertEqual(Decimal(response.data['subtotal']), Decimal('41.00'))
+        self.assertEqual(response.data['itens'][0]['produto_detalhes']['nome'], 'Produto 1')
+
+        response = self.adicionar(self.produtos[0], 8, token)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['erro'], 'Estoque insuficiente. Disponível: 10')
+
+        headers = {CABECALHO: token}
+        item_id = self.produtos[0].id
+        response = self.client.patch(f'/api/v1/carrinho/{item_id}/atualizar/', {'quantidade': 5}, headers=headers)
+        self.assertEqual(response.data['total_itens'], 6)
+        response = self.client.delete(f'/api/v1/carrinho/{self.produtos[1].id}/remover/', headers=headers)
+        self.assertEqual([item['id'] for item in response.data['itens']], [item_id])
+        response = self.client.delete(f'/api/v1/carrinho/{self.produtos[2].id}/remover/', headers=headers)
+        self.assertEqual(response.status_code, 404)
+
+        # Só a leitura do cache (que no padrão é uma tabela do banco), nenhuma de produto
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/carrinho/?fields=total_itens,total', headers=headers)
+        self.assertEqual(response.data, {'total_itens': 5, 'total': '50.00'})
+        self.assertEqual([query['sql'] for query in queries if 'carrinho_visitante_cache' not in query['sql']], [])
+
+        self.assertFalse(Carrinho.objects.exists())
+        self.assertFalse(ItemCarrinho.objects.exists())
+
+    def test_token_adulterado_vale_como_carrinho_vazio(self):
+        token = self.adicionar(self.produtos[0])[CABECALHO]
+
+        response = self.client.get('/api/v1/carrinho/', headers={CABECALHO: token[:-1] + 'x'})
+        self.assertEqual(response.data['total_itens'], 0)
+
+    def test_usuario_sem_carrinho_nao_grava_no_banco(self):
+        self.client.force_authenticate(self.usuario)
+
+        for requisicao in [
+            lambda: self.client.get('/api/v1/carrinho/'),
+            lambda: self.client.delete('/api/v1/carrinho/limpar/'),
+            lambda: self.client.delete('/api/v1/carrinho/1/remover/'),
+        ]:
+            requisicao()
+        response = self.client.get('/api/v1/carrinho/')
+
+        self.assertEqual(response.data['total_itens'], 0)
+        self.assertEqual(response.data['usuario'], self.usuario.id)
+        self.assertFalse(Carrinho.objects.exists())
+
+    def test_login_soma_carrinho_de_visitante(self):
+        a, b, c = self.produtos
+        carrinho = Carrinho.objects.create(usuario=self.usuario)
+        ItemCarrinho.objects.create(carrinho=carrinho, produto=a, quantidade=4, preco_unitario=a.preco)
+
+        token = self.adicionar(a, 3)[CABECALHO]
+        self.adicionar(b, 2, token)
+        self.adicionar(c, 6, token)
+        Produto.objects.filter(pk=c.pk).update(estoque=2)
+
+        response = self.client.post(
+            '/api/v1/usuarios/auth/login/',
+            {'email': 'visitante@relab.co', 'password': 'senha-forte-123'},
+            format='json',
+            headers={CABECALHO: token}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(dict(carrinho.itens.values_list('produto_id', 'quantidade')), {a.id: 7, b.id: 2, c.id: 2})
+        # O carrinho de visitante é apagado depois de somado
+        response = self.client.get('/api/v1/carrinho/', headers={CABECALHO: token})
+        self.assertEqual(response.data['total_itens'], 0)
+
+    def test_login_respeita_reservas_de_outros_carrinhos(self):
+        a, b, _ = self.produtos
+        carrinho = Carrinho.objects.create(usuario=self.usuario)
+        ItemCarrinho.objects.create(carrinho=carrinho, produto=a, quantidade=2, preco_unitario=a.preco)
+
+        token = self.adicionar(a, 5)[CABECALHO]
+        self.adicionar(b, 5, token)
+        # Outro cliente reserva depois que o visitante montou o carrinho (visitante não reserva)
+        outro = Usuario.objects.create_user(
+            username='outro', email='outro@relab.co', password=None, cpf='55566677788', telefone='11987654321'
+        )
+        ItemCarrinho.objects.adicionar(outro.id, a.id, 6)
+        ItemCarrinho.objects.adicionar(outro.id, b.id, 7)
+
+        response = self.client.post(
+            '/api/v1/usuarios/auth/login/',
+            {'email': 'visitante@relab.co', 'password': 'senha-forte-123'},
+            format='json',
+            headers={CABECALHO: token}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        # Linha existente (2 + 5, limitada a 10 - 6) e linha nova (5, limitada a 10 - 7)
+        self.assertEqual(dict(carrinho.itens.values_list('produto_id', 'quantidade')), {a.id: 4, b.id: 3})
+        self.assertEqual(
+            dict(ReservaEstoque.objects.filter(dono_tipo=ReservaEstoque.CARRINHO, dono_id=carrinho.id).values_list('produto_id', 'quantidade')),
+            {a.id: 4, b.id: 3}
+        )
+
+
+class AdicionarConcorrenteTests(TransactionTestCase):
+    """
+    Cliques simultâneos em "adicionar" no mesmo produto: nenhum incremento
+    pode se perder, nenhum pode estourar o unique (carrinho, produto) e o
+    estoque e o limite de 99 unidades valem mesmo sob disputa.
+    """
+    CLIQUES = 16
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(
+            username='apressado',
+            email='apressado@relab.co',
+            password=None,
+            cpf='98765432100',
+            telefone='11987654321',
+        )
+
+    def clicar(self, produto, quantidade, respostas, barreira):
+        client = APIClient()
+        client.force_authenticate(self.usuario)
+        barreira.wait()
+        try:
+            response = client.post(
+                '/api/v1/carrinho/adicionar/',
+                {'produto_id': produto.id, 'quantidade': quantidade},
+                format='json'
+            )
+            respostas.append(response.status_code)
+        finally:
+            connection.close()
+
+    def disputar(self, produto, quantidade=1):
+        respostas = []
+        barreira = threading.Barrier(self.CLIQUES)
+        threads = [
+            threading.Thread(target=self.clicar, args=(produto, quantidade, respostas, barreira))
+            for _ in range(self.CLIQUES)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return respostas
+
+    def quantidade_no_carrinho(self, produto):
+        return ItemCarrinho.objects.filter(carrinho__usuario=self.usuario, produto=produto).values_list(
+            'quantidade', flat=True
+        ).first()
+
+    def test_cliques_simultaneos_somam_todos(self):
+        produto = Produto.objects.create(nome='Produto disputado', preco=Decimal('20.00'), estoque=500)
+
+        respostas = self.disputar(produto)
+
+        self.assertEqual(len(respostas), self.CLIQUES)
+        self.assertEqual(respostas.count(201), 1)
+        self.assertEqual(respostas.count(200), self.CLIQUES - 1)
+        self.assertEqual(self.quantidade_no_carrinho(produto), self.CLIQUES)
+        self.assertEqual(Carrinho.objects.filter(usuario=self.usuario).count(), 1)
+
+    def test_estoque_vale_sob_disputa(self):
+        produto = Produto.objects.create(nome='Últimas unidades', preco=Decimal('20.00'), estoque=5)
+
+        respostas = self.disputar(produto)
+
+        self.assertEqual(respostas.count(201) + respostas.count(200), 5)
+        self.assertEqual(respostas.count(400), self.CLIQUES - 5)
+        self.assertEqual(self.quantidade_no_carrinho(produto), 5)
+
+    def test_limite_por_produto_vale_sob_disputa(self):
+        produto = Produto.objects.create(nome='Muito estoque', preco=Decimal('20.00'), estoque=1000)
+
+        respostas = self.disputar(produto, quantidade=10)
+
+        self.assertEqual(respostas.count(201) + respostas.count(200), 9)
+        self.assertEqual(self.quantidade_no_carrinho(produto), 90)
+
+        client = APIClient()
+        client.force_authenticate(self.usuario)
+        response = client.post('/api/v1/carrinho/adicionar/', {'produto_id': produto.id, 'quantidade': 10}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['erro'], 'Quantidade máxima por produto é 99')
+
+    def test_produto_inativo_ou_inexistente(self):
+        produto = Produto.objects.create(nome='Fora de linha', preco=Decimal('20.00'), estoque=5, ativo=False)
+        client = APIClient()
+        client.force_authenticate(self.usuario)
+
+        for produto_id in (produto.id, produto.id + 1000, 2 ** 70):
+            response = client.post('/api/v1/carrinho/adicionar/', {'produto_id': produto_id}, format='json')
+            self.assertEqual(response.status_code, 404)
+        self.assertFalse(ItemCarrinho.objects.exists())
+
+
+    def test_cliques_simultaneos_do_visitante_somam_todos(self):
+        produto = Produto.objects.create(nome='Produto disputado', preco=Decimal('20.00'), estoque=500)
+        url = '/api/v1/carrinho/adicionar/'
+        token = APIClient().post(url, {'produto_id': produto.id}, format='json')[CABECALHO]
+
+        respostas = []
+        barreira = threading.Barrier(self.CLIQUES)
+
+        def clicar():
+            barreira.wait()
+            try:
+                response = APIClient().post(url, {'produto_id': produto.id}, format='json', headers={CABECALHO: token})
+                respostas.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=clicar) for _ in range(self.CLIQUES)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(respostas, [200] * self.CLIQUES)
+        carrinho = APIClient().get('/api/v1/carrinho/', headers={CABECALHO: token}).data
+        self.assertEqual(carrinho['total_itens'], self.CLIQUES + 1)
+
+
+class PurgarCarrinhosTests(TestCase):
+    """purgar_carrinhos apaga só os carrinhos sem nenhuma alteração recente, com linhas e reservas"""
+
+    def test_apaga_carrinhos_abandonados(self):
+        produto = Produto.objects.create(nome='Produto', preco=Decimal('10.00'), estoque=100)
+        antigo = timezone.now() - timedelta(days=90)
+        carrinhos = []
+        for i in range(5):
+            usuario = Usuario.objects.create_user(
+                username=f'purga{i}',
+                email=f'purga{i}@relab.co',
+                password=None,
+                cpf=f'7{i:010d}',
+                telefone='11987654321',
+            )
+            ItemCarrinho.objects.adicionar(usuario.id, produto.id, 1)
+            carrinhos.append(Carrinho.objects.get(usuario=usuario))
+        # 0 e 1 abandonados; 2 com o carrinho recente; 3 com uma linha alterada há pouco; 4 intacto
+        Carrinho.objects.filter(pk__in=[carrinhos[0].pk, carrinhos[1].pk, carrinhos[3].pk]).update(atualizado_em=antigo)
+        ItemCarrinho.objects.filter(carrinho__in=carrinhos[:3]).update(atualizado_em=antigo)
+
+        saida = StringIO()
+        call_command('purgar_carrinhos', dias=60, lote=2, pausa=0, stdout=saida)
+
+        self.assertIn('2 carrinho(s), 2 item(ns)', saida.getvalue())
+        self.assertEqual(
+            set(Carrinho.objects.values_list('pk', flat=True)), {carrinho.pk for carrinho in carrinhos[2:]}
+        )
+        self.assertEqual(ItemCarrinho.objects.count(), 3)
+        self.assertEqual(
+            set(ReservaEstoque.objects.values_list('dono_id', flat=True)), {carrinho.pk for carrinho in carrinhos[2:]}
+        )
@@ -15,6 +15,7 @@ urlpatterns = [
 # URLs geradas com @action decorators no ViewSet:
 # GET    /api/v1/carrinho/                    - Ver carrinho
 # POST   /api/v1/carrinho/adicionar/          - Adicionar item
+# POST   /api/v1/carrinho/sincronizar/        - Várias operações de uma vez
 # PATCH  /api/v1/carrinho/{id}/atualizar/     - Atualizar quantidade
 # DELETE /api/v1/carrinho/{id}/remover/       - Remover item
 # DELETE /api/v1/carrinho/limpar/             - Limpar carrinho
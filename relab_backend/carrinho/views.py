@@ -1,21 +1,21 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from django.apps import apps
+from produtos.campos import validar_campos
+from produtos.models import Produto
 
-from .models import Carrinho, ItemCarrinho
+from .models import DEFINIR, QUANTIDADE_MAXIMA, REMOVER, Carrinho, ItemCarrinho
 from .serializers import (
     CarrinhoSerializer,
     ItemCarrinhoSerializer,
     AdicionarItemSerializer,
-    AtualizarQuantidadeSerializer
+    AtualizarQuantidadeSerializer,
+    SincronizarCarrinhoSerializer
 )
-
-# Lazy import para evitar circular import
-Produto = apps.get_model('produtos', 'Produto')
-
+from .visitante import CABECALHO, CarrinhoVisitante, carrinho_vazio
 
 class CarrinhoViewSet(viewsets.ViewSet):
     """
@@ -25,23 +25,61 @@ class CarrinhoViewSet(viewsets.ViewSet):
     - POST /api/carrinho/adicionar/ - Adicionar item
     - PATCH /api/carrinho/atualizar/{item_id}/ - Atualizar quantidade
     - DELETE /api/carrinho/remover/{item_id}/ - Remover item
+    - POST /api/carrinho/sincronizar/ - Várias operações de uma vez
     - DELETE /api/carrinho/limpar/ - Limpar carrinho
-    """
-    permission_classes = [IsAuthenticated]
 
-    def get_or_create_carrinho(self, usuario):
-        """Obtém ou cria o carrinho do usuário"""
-        carrinho, created = Carrinho.objects.get_or_create(usuario=usuario)
-        return carrinho
+    Todas as respostas aceitam ?fields= (ex.: ?fields=total_itens,total para o
+    contador do cabeçalho, sem carregar os itens)
+
+    Sem login, o carrinho é de visitante: fica no cache, identificado pelo
+    cabeçalho X-Carrinho (ver carrinho/visitante.py), e é somado ao carrinho
+    do usuário no login. O Carrinho no banco só é criado na primeira alteração.
+    """
+    permission_classes = [AllowAny]
+    visitante = None
+
+    def get_snapshot(self, usuario, itens=True):
+        """Carrinho com itens, produtos, categorias e totais carregados (ver CarrinhoQuerySet.snapshot)"""
+        if self.visitante is not None:
+            return self.visitante.snapshot(itens)
+        carrinho = Carrinho.objects.snapshot(itens).filter(usuario=usuario).first()
+        return carrinho if carrinho is not None else carrinho_vazio(usuario)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Valida ?fields= antes de qualquer alteração no carrinho
+        self.campos_pedidos = validar_campos(request, CarrinhoSerializer(context={}).fields)
+        if not request.user.is_authenticated:
+            self.visitante = CarrinhoVisitante.da_requisicao(request)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.visitante is not None and self.visitante.token:
+            response[CABECALHO] = self.visitante.token
+        return response
+
+    def serializar_carrinho(self, request):
+        """Carrinho atualizado do usuário, só com os campos de ?fields= (e só carrega os itens se pedidos)"""
+        campos, expandir = self.campos_pedidos
+        carrinho = self.get_snapshot(request.user, itens=campos is None or 'itens' in campos)
+        return CarrinhoSerializer(carrinho, context={'campos': campos, 'expandir': expandir}).data
+
+    def id_visitante(self, pk):
+        """No carrinho de visitante o id do item é o id do produto"""
+        try:
+            produto_id = int(pk)
+        except (TypeError, ValueError):
+            raise Http404
+        if produto_id not in self.visitante:
+            raise Http404
+        return produto_id
 
     def list(self, request):
         """
         GET /api/carrinho/
         Retorna o carrinho do usuário
         """
-        carrinho = self.get_or_create_carrinho(request.user)
-        serializer = CarrinhoSerializer(carrinho)
-        return Response(serializer.data)
+        return Response(self.serializar_carrinho(request))
 
     @action(detail=False, methods=['post'])
     def adicionar(self, request):
@@ -54,54 +92,58 @@ class CarrinhoViewSet(viewsets.ViewSet):
         serializer = AdicionarItemSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        produto_id = serializer.validated_data['produto_id']
         quantidade = serializer.validated_data['quantidade']
 
-        # Verifica se o produto existe
-        produto = get_object_or_404(Produto, id=produto_id, ativo=True)
-
-        # Verifica estoque
-        if produto.estoque < quantidade:
-            return Response(
-                {'erro': f'Estoque insuficiente. Disponível: {produto.estoque}'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Obtém ou cria o carrinho
-        carrinho = self.get_or_create_carrinho(request.user)
+        # Carrinho e linha num único upsert (ver ItemCarrinhoQuerySet.adicionar)
+        produto_id = serializer.validated_data['produto_id']
+        if self.visitante is not None:
+            adicao = self.visitante.adicionar(produto_id, quantidade)
+        else:
+            adicao = ItemCarrinho.objects.adicionar(request.user.id, produto_id, quantidade)
+        if adicao is None:
+            raise Http404
+
+        if adicao.item_id is None:
+            if (adicao.quantidade_anterior or 0) + quantidade > adicao.estoque:
+                erro = f'Estoque insuficiente. Disponível: {adicao.estoque}'
+            else:
+                erro = f'Quantidade máxima por produto é {QUANTIDADE_MAXIMA}'
+            return Response({'erro': erro}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Verifica se o produto já está no carrinho
-        item, created = ItemCarrinho.objects.get_or_create(
-            carrinho=carrinho,
-            produto=produto,
-            defaults={'quantidade': quantidade, 'preco_unitario': produto.preco}
+        # Retorna o carrinho atualizado
+        return Response(
+            self.serializar_carrinho(request),
+            status=status.HTTP_201_CREATED if adicao.criado else status.HTTP_200_OK
         )
 
-        if not created:
-            # Se já existe, incrementa a quantidade
-            nova_quantidade = item.quantidade + quantidade
-
-            if nova_quantidade > produto.estoque:
-                return Response(
-                    {'erro': f'Estoque insuficiente. Disponível: {produto.estoque}'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+    @action(detail=False, methods=['post'])
+    def sincronizar(self, request):
+        """
+        POST /api/carrinho/sincronizar/
+        Body: {"operacoes": [
+            {"acao": "definir", "produto_id": 1, "quantidade": 3},
+            {"acao": "adicionar", "produto_id": 2, "quantidade": 1},
+            {"acao": "remover", "produto_id": 5}
+        ]}
+
+        Aplica as operações na ordem, numa transação (todas ou nenhuma), e
+        retorna o carrinho uma única vez (ver ItemCarrinhoQuerySet.sincronizar)
+        """
+        serializer = SincronizarCarrinhoSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-            if nova_quantidade > 99:
-                return Response(
-                    {'erro': 'Quantidade máxima por produto é 99'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+        operacoes = serializer.validated_data['operacoes']
+        if self.visitante is not None:
+            erros = self.visitante.sincronizar(operacoes)
+        else:
+            erros = ItemCarrinho.objects.sincronizar(request.user, operacoes)
+        if erros:
+            return Response(
+                {'erro': 'Nenhuma operação foi aplicada', 'produtos': erros},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-            item.quantidade = nova_quantidade
-            item.save()
-
-        # Retorna o carrinho atualizado
-        carrinho_serializer = CarrinhoSerializer(carrinho)
-        return Response(
-            carrinho_serializer.data,
-            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
-        )
+        return Response(self.serializar_carrinho(request))
 
     @action(detail=True, methods=['patch'])
     def atualizar(self, request, pk=None):
@@ -114,26 +156,36 @@ class CarrinhoViewSet(viewsets.ViewSet):
         serializer = AtualizarQuantidadeSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        carrinho = self.get_or_create_carrinho(request.user)
+        nova_quantidade = serializer.validated_data['quantidade']
 
-        # Busca o item no carrinho do usuário
-        item = get_object_or_404(ItemCarrinho, id=pk, carrinho=carrinho)
+        if self.visitante is not None:
+            produto_id = self.id_visitante(pk)
+            erros = self.visitante.sincronizar([
+                {'acao': DEFINIR, 'produto_id': produto_id, 'quantidade': nova_quantidade}
+            ])
+            if erros:
+                return Response({'erro': erros[produto_id]}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(self.serializar_carrinho(request))
 
-        nova_quantidade = serializer.validated_data['quantidade']
+        # Busca o item no carrinho do usuário
+        item = get_object_or_404(ItemCarrinho, id=pk, carrinho__usuario=request.user)
 
-        # Verifica estoque
-        if item.produto.estoque < nova_quantidade:
+        # Verifica estoque (descontadas as reservas dos outros carrinhos)
+        disponivel = Produto.objects.com_estoque_disponivel(item.carrinho_id).values_list(
+            'estoque_disponivel', flat=True
+        ).get(pk=item.produto_id)
+        if disponivel < nova_quantidade:
             return Response(
-                {'erro': f'Estoque insuficiente. Disponível: {item.produto.estoque}'},
+                {'erro': f'Estoque insuficiente. Disponível: {disponivel}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         item.quantidade = nova_quantidade
         item.save()
+        ItemCarrinho.objects.reservar(request.user.id)
 
         # Retorna o carrinho atualizado
-        carrinho_serializer = CarrinhoSerializer(carrinho)
-        return Response(carrinho_serializer.data)
+        return Response(self.serializar_carrinho(request))
 
     @action(detail=True, methods=['delete'])
     def remover(self, request, pk=None):
@@ -142,13 +194,15 @@ class CarrinhoViewSet(viewsets.ViewSet):
 
         Remove um item específico do carrinho
         """
-        carrinho = self.get_or_create_carrinho(request.user)
-        item = get_object_or_404(ItemCarrinho, id=pk, carrinho=carrinho)
-        item.delete()
+        if self.visitante is not None:
+            self.visitante.sincronizar([{'acao': REMOVER, 'produto_id': self.id_visitante(pk)}])
+        else:
+            item = get_object_or_404(ItemCarrinho, id=pk, carrinho__usuario=request.user)
+            item.delete()
+            ItemCarrinho.objects.reservar(request.user.id)
 
         # Retorna o carrinho atualizado
-        carrinho_serializer = CarrinhoSerializer(carrinho)
-        return Response(carrinho_serializer.data)
+        return Response(self.serializar_carrinho(request))
 
     @action(detail=False, methods=['delete'])
     def limpar(self, request):
@@ -157,8 +211,10 @@ class CarrinhoViewSet(viewsets.ViewSet):
 
         Remove todos os itens do carrinho
         """
-        carrinho = self.get_or_create_carrinho(request.user)
-        carrinho.limpar()
+        if self.visitante is not None:
+            self.visitante.limpar()
+        else:
+            if ItemCarrinho.objects.filter(carrinho__usuario=request.user).delete()[0]:
+                ItemCarrinho.objects.reservar(request.user.id)
 
-        carrinho_serializer = CarrinhoSerializer(carrinho)
-        return Response(carrinho_serializer.data)
\ No newline at end of file
+        return Response(self.serializar_carrinho(request))
\ No newline at end of file
@@ -0,0 +1,219 @@
+# carrinho/visitante.py
+"""
+Carrinho de visitante (usuário não autenticado).
+
+Fica só no cache CACHES['carrinhos'], nunca nas tabelas do carrinho: a chave
+é um uuid assinado (django.core.signing) que a API devolve no cabeçalho
+X-Carrinho e o frontend reenvia no mesmo cabeçalho. O cache precisa ser
+compartilhado entre os workers e persistente (memória local é recusada na
+inicialização, ver verificar_cache). Cada alteração renova o TTL
+(CARRINHO_VISITANTE_TTL) e roda com uma trava (add numa chave ao lado,
+atômico em todos os backends) que relê o carrinho antes de alterar: dois
+cliques simultâneos não perdem um ao outro. Um token adulterado ou expirado
+vale como carrinho vazio. Sem banco, o visitante não reserva estoque, mas
+respeita as reservas dos carrinhos (ReservaEstoque). No login
+(CustomTokenObtainPairView) os itens são somados ao Carrinho do usuário com
+um único upsert (ItemCarrinho.objects.mesclar) e a chave é apagada.
+
+As respostas têm o mesmo formato do carrinho do banco; o id de cada item é o
+id do produto, que é o {id} usado em atualizar/remover.
+"""
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from produtos.models import Produto
+
+from .models import QUANTIDADE_MAXIMA, Adicao, ItemCarrinho, aplicar_operacoes
+
+CABECALHO = 'X-Carrinho'
+SAL = 'carrinho.visitante'
+CACHE = 'carrinhos'
+
+# Segundos até a trava de uma alteração expirar sozinha (worker que morreu no meio)
+TRAVA_TTL = 5
+
+# Carrinho lido pelo CarrinhoSerializer sem passar pelo banco (visitante, ou usuário que ainda não tem Carrinho)
+CarrinhoEmMemoria = namedtuple(
+    'CarrinhoEmMemoria', 'id usuario itens total_itens subtotal total criado_em atualizado_em'
+)
+
+
+def carrinho_vazio(usuario=None):
+    return CarrinhoEmMemoria(None, usuario, [], 0, Decimal('0.00'), Decimal('0.00'), None, None)
+
+
+def verificar_cache():
+    """Chamada no ready() do app: em cache local o carrinho some entre os workers e no corte de entradas"""
+    if isinstance(caches[CACHE], (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(
+            f"CACHES['{CACHE}'] guarda os carrinhos de visitante: use um backend compartilhado e "
+            f"persistente (banco ou Redis), não {type(caches[CACHE]).__name__}"
+        )
+
+
+class CarrinhoVisitante:
+    """Itens do visitante: {produto_id: {'quantidade', 'preco_unitario', 'criado_em', 'atualizado_em'}}"""
+
+    def __init__(self, token=None):
+        self.token = None
+        self.chave = None
+        dados = None
+        if token:
+            try:
+                self.chave = f'carrinho:visitante:{signing.Signer(salt=SAL).unsign(token)}'
+                self.token = token
+                dados = caches[CACHE].get(self.chave)
+            except signing.BadSignature:
+                pass
+        self.dados = dados or self.vazio()
+
+    @classmethod
+    def da_requisicao(cls, request):
+        return cls(request.headers.get(CABECALHO))
+
+    @staticmethod
+    def vazio():
+        return {'itens': {}, 'criado_em': None, 'atualizado_em': None}
+
+    @property
+    def itens(self):
+        return self.dados['itens']
+
+    def __contains__(self, produto_id):
+        return produto_id in self.itens
+
+    @contextmanager
+    def alterando(self):
+        """
+        Trava o carrinho e relê os dados; o bloco altera e chama salvar() antes
+        de a trava ser solta. Sem token ainda não há concorrência: o token só
+        existe depois da primeira gravação.
+        """
+        if self.chave is None:
+            yield
+            return
+        trava = f'{self.chave}:trava'
+        while not caches[CACHE].add(trava, 1, timeout=TRAVA_TTL):
+            time.sleep(0.01)
+        try:
+            self.dados = caches[CACHE].get(self.chave) or self.vazio()
+            yield
+        finally:
+            caches[CACHE].delete(trava)
+
+    def salvar(self):
+        """Grava no cache (renovando o TTL), criando o token na primeira alteração"""
+        if self.chave is None:
+            identificador = uuid.uuid4().hex
+            self.token = signing.Signer(salt=SAL).sign(identificador)
+            self.chave = f'carrinho:visitante:{identificador}'
+        agora = timezone.now()
+        self.dados['criado_em'] = self.dados['criado_em'] or agora
+        self.dados['atualizado_em'] = agora
+        caches[CACHE].set(self.chave, self.dados, timeout=settings.CARRINHO_VISITANTE_TTL)
+
+    def adicionar(self, produto_id, quantidade):
+        """Mesmo contrato de ItemCarrinho.objects.adicionar()"""
+        produto = Produto.objects.filter(id=produto_id, ativo=True).com_estoque_disponivel().values(
+            'preco', 'estoque_disponivel'
+        ).first()
+        if produto is None:
+            return None
+        produto['estoque'] = produto['estoque_disponivel']
+        with self.alterando():
+            item = self.itens.get(produto_id)
+            anterior = item['quantidade'] if item else None
+            nova_quantidade = (anterior or 0) + quantidade
+            if nova_quantidade > min(produto['estoque'], QUANTIDADE_MAXIMA):
+                return Adicao(None, None, False, produto['estoque'], anterior)
+
+            agora = timezone.now()
+            if item is None:
+                self.itens[produto_id] = {
+                    'quantidade': nova_quantidade,
+                    'preco_unitario': produto['preco'],
+                    'criado_em': agora,
+                    'atualizado_em': agora,
+                }
+            else:
+                item.update(quantidade=nova_quantidade, atualizado_em=agora)
+            self.salvar()
+        return Adicao(produto_id, nova_quantidade, item is None, produto['estoque'], anterior)
+
+    def sincronizar(self, operacoes):
+        """Mesmo contrato de ItemCarrinho.objects.sincronizar()"""
+        ids = {operacao['produto_id'] for operacao in operacoes}
+        produtos = {
+            produto['id']: dict(produto, estoque=produto['estoque_disponivel'])
+            for produto in Produto.objects.filter(id__in=ids).com_estoque_disponivel().values(
+                'id', 'preco', 'ativo', 'estoque_disponivel'
+            )
+        }
+        with self.alterando():
+            atuais = {produto_id: self.itens[produto_id]['quantidade'] if produto_id in self else 0 for produto_id in ids}
+            finais, erros = aplicar_operacoes(atuais, operacoes, produtos)
+            if erros:
+                return erros
+
+            agora = timezone.now()
+            for produto_id, quantidade in finais.items():
+                if quantidade == atuais[produto_id]:
+                    continue
+                if quantidade == 0:
+                    del self.itens[produto_id]
+                elif produto_id in self:
+                    self.itens[produto_id].update(quantidade=quantidade, atualizado_em=agora)
+                else:
+                    self.itens[produto_id] = {
+                        'quantidade': quantidade,
+                        'preco_unitario': produtos[produto_id]['preco'],
+                        'criado_em': agora,
+                        'atualizado_em': agora,
+                    }
+            self.salvar()
+        return {}
+
+    def limpar(self):
+        with self.alterando():
+            if self.itens:
+                self.itens.clear()
+                self.salvar()
+
+    def snapshot(self, itens=True):
+        """CarrinhoEmMemoria com os produtos (e categorias) numa única consulta; com itens=False, nenhuma"""
+        total_itens = sum(item['quantidade'] for item in self.itens.values())
+        subtotal = sum(
+            (item['quantidade'] * item['preco_unitario'] for item in self.itens.values()), Decimal('0.00')
+        )
+        linhas = []
+        if itens and self.itens:
+            produtos = Produto.objects.select_related('categoria').defer('busca').in_bulk(list(self.itens))
+            linhas = [
+                ItemCarrinho(id=produto_id, produto=produtos[produto_id], **item)
+                for produto_id, item in self.itens.items()
+                if produto_id in produtos
+            ]
+            linhas.sort(key=lambda linha: linha.criado_em, reverse=True)
+        return CarrinhoEmMemoria(
+            None, None, linhas, total_itens, subtotal, subtotal, self.dados['criado_em'], self.dados['atualizado_em']
+        )
+
+    def mesclar(self, usuario):
+        """Soma os itens ao carrinho do usuário e apaga o carrinho de visitante"""
+        if self.chave is None:
+            return
+        with self.alterando():
+            ItemCarrinho.objects.mesclar(usuario.id, {
+                produto_id: (item['quantidade'], item['preco_unitario']) for produto_id, item in self.itens.items()
+            })
+            caches[CACHE].delete(self.chave)
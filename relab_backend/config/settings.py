@@ -13,6 +13,7 @@ from pathlib import Path
 import os
 from datetime import timedelta
 from decouple import config
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -39,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Terceiros
     'rest_framework',
@@ -130,11 +132,69 @@ USE_TZ = True
 # Credenciais Mercado Pago
 MERCADO_PAGO_ACCESS_TOKEN = os.getenv('MERCADO_PAGO_ACCESS_TOKEN', '')
 MERCADO_PAGO_PUBLIC_KEY = os.getenv('MERCADO_PAGO_PUBLIC_KEY', '')
+MERCADO_PAGO_WEBHOOK_SECRET = os.getenv('MERCADO_PAGO_WEBHOOK_SECRET', '')
 
 
 # URLs do site (para retorno do pagamento)
 SITE_URL = os.getenv('SITE_URL', 'http://localhost:8000')
 
+# Cache (em produção, apontar para um backend compartilhado entre os workers, ex.: Redis)
+# 'carrinhos' guarda os carrinhos de visitante (ver carrinho/visitante.py): precisa ser compartilhado e
+# persistente, então nunca em memória local. O padrão usa o banco (python manage.py createcachetable)
+CARRINHOS_CACHE_BACKEND = config('CARRINHOS_CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache')
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='relab'),
+    },
+    'carrinhos': {
+        'BACKEND': CARRINHOS_CACHE_BACKEND,
+        'LOCATION': config('CARRINHOS_CACHE_LOCATION', default='carrinho_visitante_cache'),
+        # O DatabaseCache corta entradas acima de MAX_ENTRIES (300 por padrão)
+        'OPTIONS': {'MAX_ENTRIES': 10_000_000} if CARRINHOS_CACHE_BACKEND.endswith('DatabaseCache') else {},
+    },
+}
+
+# Segundos que as coleções da vitrine (destaques, promoções...) ficam em cache
+COLECOES_CACHE_TTL = config('COLECOES_CACHE_TTL', default=300, cast=int)
+
+# Contador de visualizações: segundos entre gravações em lote (0 = grava a cada visualização)
+VISUALIZACOES_INTERVALO_FLUSH = config('VISUALIZACOES_INTERVALO_FLUSH', default=10, cast=int)
+
+# Limites (em R$) das faixas de preço do endpoint de facetas
+FACETAS_FAIXAS_PRECO = config(
+    'FACETAS_FAIXAS_PRECO',
+    default='50,100,200,500,1000',
+    cast=lambda valor: [int(limite) for limite in valor.split(',') if limite.strip()]
+)
+
+# Miniaturas das imagens de produto: larguras (px) geradas em WebP e JPEG
+IMAGENS_LARGURAS = [160, 320, 640, 1024]
+# False gera os derivados durante o save (útil em testes e scripts)
+IMAGENS_DERIVADOS_ASSINCRONO = config('IMAGENS_DERIVADOS_ASSINCRONO', default=True, cast=bool)
+
+# Meia-vida (em horas) do peso de visualizações e vendas na tendência dos produtos
+TENDENCIA_MEIA_VIDA_HORAS = config('TENDENCIA_MEIA_VIDA_HORAS', default=24, cast=float)
+
+# Sitemap e feed de produtos (ver produtos/feed.py): URL da página do produto e produtos por shard
+FEED_URL_PRODUTO = config('FEED_URL_PRODUTO', default=f'{SITE_URL}/produtos/{{slug}}')
+FEED_PRODUTOS_POR_SHARD = config('FEED_PRODUTOS_POR_SHARD', default=20000, cast=int)
+
+# Listagem de produtos pelo catálogo em memória (NumPy, ver produtos/colunar.py) e intervalo de atualização (s)
+CATALOGO_COLUNAR = config('CATALOGO_COLUNAR', default=False, cast=bool)
+CATALOGO_COLUNAR_INTERVALO = config('CATALOGO_COLUNAR_INTERVALO', default=5, cast=float)
+
+# Segundos que um carrinho de visitante (só no cache, ver carrinho/visitante.py) sobrevive sem alterações
+CARRINHO_VISITANTE_TTL = config('CARRINHO_VISITANTE_TTL', default=30 * 24 * 3600, cast=int)
+
+# Reservas de estoque (ver ReservaEstoque): minutos que as linhas de um carrinho seguram o estoque desde a
+# última alteração, e horas que um pedido aguardando pagamento tem antes de ser cancelado por varrer_reservas
+RESERVA_CARRINHO_MINUTOS = config('RESERVA_CARRINHO_MINUTOS', default=30, cast=int)
+RESERVA_PEDIDO_HORAS = config('RESERVA_PEDIDO_HORAS', default=72, cast=int)
+
+# Listagens de produtos/categorias com a serialização compilada + orjson (ver produtos/serializacao.py)
+SERIALIZACAO_COMPILADA = config('SERIALIZACAO_COMPILADA', default=True, cast=bool)
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 STATIC_URL = 'static/'
@@ -157,6 +217,9 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
 ]
 CORS_ALLOW_CREDENTIALS = True
+# Token do carrinho de visitante, enviado e devolvido em cabeçalho
+CORS_ALLOW_HEADERS = (*default_headers, 'x-carrinho')
+CORS_EXPOSE_HEADERS = ['X-Carrinho']
 
 # REST Framework
 REST_FRAMEWORK = {
@@ -3,6 +3,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from produtos.views import sitemap_indice, sitemap_produtos
 
 # URLs da API
 api_v1_patterns = [
@@ -20,6 +21,10 @@ urlpatterns = [
     # API v1
     path('api/v1/', include(api_v1_patterns)),
 
+    # Sitemaps dos produtos (gerados em streaming)
+    path('sitemap.xml', sitemap_indice, name='sitemap'),
+    path('sitemap-produtos-<int:shard>.xml', sitemap_produtos, name='sitemap-produtos'),
+
     # Futura API v2 (quando precisar)
     # path('api/v2/', include(api_v2_patterns)),
 ]
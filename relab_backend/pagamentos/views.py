@@ -3,13 +3,15 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.conf import settings
+from django.db import transaction
 import mercadopago
 import hmac
 import hashlib
 
 from .models import Pagamento
 from .serializers import PagamentoSerializer, CriarPagamentoSerializer
-from pedidos.models import Pedido
+from pedidos.models import Pedido, StatusPedido
+from pedidos.reservas import liberar_pedidos
 
 
 class PagamentoViewSet(viewsets.ModelViewSet):
@@ -160,40 +162,56 @@ class PagamentoViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            pedido = Pedido.objects.get(id=pedido_id)
+            with transaction.atomic():
+                # Trava o pedido: varrer_reservas e /cancelar/ esperam o webhook terminar (e vice-versa)
+                pedido = Pedido.objects.select_for_update().get(id=pedido_id)
 
-            # CORREÇÃO: Buscar pagamento corretamente
-            try:
-                pagamento = Pagamento.objects.get(pedido=pedido)
-            except Pagamento.DoesNotExist:
-                return Response(
-                    {'error': 'Pagamento não encontrado'},
-                    status=status.HTTP_404_NOT_FOUND
-                )
+                # CORREÇÃO: Buscar pagamento corretamente
+                try:
+                    pagamento = Pagamento.objects.get(pedido=pedido)
+                except Pagamento.DoesNotExist:
+                    return Response(
+                        {'error': 'Pagamento não encontrado'},
+                        status=status.HTTP_404_NOT_FOUND
+                    )
+
+                ja_aprovado = pagamento.status == 'approved'
+
+                # Atualizar dados do pagamento
+                pagamento.payment_id = payment_id
+                pagamento.status = payment_data['status']
+                pagamento.tipo = payment_data.get('payment_type_id', '')
+                pagamento.dados_mercadopago = payment_data
+                pagamento.save()
 
-            # Atualizar dados do pagamento
-            pagamento.payment_id = payment_id
-            pagamento.status = payment_data['status']
-            pagamento.tipo = payment_data.get('payment_type_id', '')
-            pagamento.dados_mercadopago = payment_data
-            pagamento.save()
-
-            # Atualizar status do pedido baseado no pagamento
-            if payment_data['status'] == 'approved':
-                pedido.status = 'confirmado'
-                pedido.save()
-
-                # TODO: Enviar email de confirmação
-                # from .tasks import enviar_email_confirmacao
-                # enviar_email_confirmacao.delay(pedido.id)
-
-            elif payment_data['status'] == 'rejected':
-                pedido.status = 'pagamento_rejeitado'
-                pedido.save()
-
-            elif payment_data['status'] in ['pending', 'in_process']:
-                pedido.status = 'aguardando_pagamento'
-                pedido.save()
+                if pedido.status == 'cancelado':
+                    # O estoque já voltou à venda (cancelamento ou reserva vencida): o pedido
+                    # não é reaberto e o pagamento aprovado fica no histórico para estorno
+                    if payment_data['status'] == 'approved' and not ja_aprovado:
+                        StatusPedido.objects.create(
+                            pedido=pedido,
+                            status='cancelado',
+                            observacao=f'Pagamento {payment_id} aprovado após o cancelamento: estornar'
+                        )
+                    return Response({'status': 'pedido_cancelado'}, status=status.HTTP_200_OK)
+
+                # Atualizar status do pedido baseado no pagamento
+                if payment_data['status'] == 'approved':
+                    pedido.status = 'confirmado'
+                    pedido.save()
+                    liberar_pedidos([pedido.id])
+
+                    # TODO: Enviar email de confirmação
+                    # from .tasks import enviar_email_confirmacao
+                    # enviar_email_confirmacao.delay(pedido.id)
+
+                elif payment_data['status'] == 'rejected':
+                    pedido.status = 'pagamento_rejeitado'
+                    pedido.save()
+
+                elif payment_data['status'] in ['pending', 'in_process']:
+                    pedido.status = 'aguardando_pagamento'
+                    pedido.save()
 
             return Response({'status': 'ok'}, status=status.HTTP_200_OK)
 
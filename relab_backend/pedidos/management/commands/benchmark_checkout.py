@@ -0,0 +1,121 @@
+# pedidos/management/commands/benchmark_checkout.py
+
+import threading
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.exceptions import ValidationError
+from carrinho.models import Carrinho, ItemCarrinho
+from pedidos.models import Pedido
+from pedidos.serializers import PedidoFromCarrinhoSerializer
+from produtos.models import Produto, ReservaEstoque
+from usuarios.models import Endereco
+
+Usuario = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Vazão do checkout pelo carrinho (PedidoFromCarrinhoSerializer) com clientes simultâneos '
+        'disputando o mesmo estoque: pedidos/s, recusas por estoque e erros (deadlocks)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=50, help='Checkouts simultâneos (um por cliente)')
+        parser.add_argument('--produtos', type=int, default=3, help='Produtos em cada carrinho (1 unidade de cada)')
+        parser.add_argument('--estoque', type=int, default=30, help='Estoque inicial de cada produto')
+
+    def handle(self, *args, **options):
+        clientes, estoque = options['clientes'], options['estoque']
+        produtos = [
+            Produto.objects.create(nome=f'Produto benchmark checkout {i}', preco=Decimal('50.00'), estoque=estoque)
+            for i in range(options['produtos'])
+        ]
+        clientes_enderecos = []
+        try:
+            for i in range(clientes):
+                usuario = Usuario.objects.create_user(
+                    username=f'benchmark-checkout-{i}',
+                    email=f'benchmark-checkout-{i}@relab.co',
+                    password=None,
+                    cpf=f'000{i:08d}',
+                    telefone='11900000000',
+                )
+                endereco = Endereco.objects.create(
+                    usuario=usuario, titulo='Casa', cep='01001000', logradouro='Praça da Sé',
+                    numero='1', bairro='Sé', cidade='São Paulo', estado='SP',
+                )
+                carrinho = Carrinho.objects.create(usuario=usuario)
+                # Ordem invertida em metade dos carrinhos: o checkout trava por id, não pela ordem do carrinho
+                for produto in (produtos if i % 2 else produtos[::-1]):
+                    ItemCarrinho.objects.create(
+                        carrinho=carrinho, produto=produto, quantidade=1, preco_unitario=produto.preco
+                    )
+                clientes_enderecos.append((usuario, endereco.id))
+
+            self.stdout.write(self.style.HTTP_INFO(
+                f'📦 {clientes} checkouts simultâneos, {len(produtos)} produto(s) com {estoque} unidade(s) cada'
+            ))
+            self.disputar(clientes_enderecos, produtos, estoque)
+        finally:
+            usuarios = [usuario.pk for usuario, _ in clientes_enderecos]
+            pedidos = Pedido.objects.filter(usuario__in=usuarios)
+            ReservaEstoque.objects.liberar(ReservaEstoque.PEDIDO, pedidos.values_list('id', flat=True))
+            pedidos.delete()
+            Usuario.objects.filter(pk__in=usuarios).delete()
+            Produto.objects.filter(pk__in=[produto.pk for produto in produtos]).delete()
+            self.stdout.write(self.style.WARNING('🗑️  Clientes, pedidos e produtos sintéticos apagados'))
+
+    def disputar(self, clientes, produtos, estoque):
+        barreira = threading.Barrier(len(clientes))
+        resultados = {'pedidos': 0, 'recusados': 0, 'erros': []}
+        trava = threading.Lock()
+
+        def finalizar(usuario, endereco_id):
+            barreira.wait()
+            try:
+                serializer = PedidoFromCarrinhoSerializer(
+                    data={'endereco_id': endereco_id, 'forma_pagamento': 'pix'},
+                    context={'request': SimpleNamespace(user=usuario)}
+                )
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+                resultado = 'pedidos'
+            except ValidationError:
+                resultado = 'recusados'
+            except Exception as erro:
+                resultado = erro
+            finally:
+                connection.close()
+            with trava:
+                if isinstance(resultado, Exception):
+                    resultados['erros'].append(resultado)
+                else:
+                    resultados[resultado] += 1
+
+        threads = [threading.Thread(target=finalizar, args=cliente) for cliente in clientes]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duracao = time.perf_counter() - inicio
+
+        esperado = min(len(clientes), estoque)
+        finais = list(Produto.objects.filter(pk__in=[produto.pk for produto in produtos]).values_list('estoque', flat=True))
+        correto = (
+            resultados['pedidos'] == esperado and not resultados['erros']
+            and finais == [estoque - esperado] * len(produtos)
+        )
+        linha = (
+            f'  {resultados["pedidos"]} pedidos em {duracao:.3f}s ({resultados["pedidos"] / duracao:.1f} pedidos/s) | '
+            f'{resultados["recusados"]} recusado(s) por estoque | {len(resultados["erros"])} erro(s) | '
+            f'estoque final {finais}'
+        )
+        self.stdout.write(self.style.SUCCESS(linha) if correto else self.style.WARNING(linha))
+        for erro in resultados['erros'][:5]:
+            self.stderr.write(f'  ⚠️  {type(erro).__name__}: {erro}')
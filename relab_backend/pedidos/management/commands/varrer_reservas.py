@@ -0,0 +1,51 @@
+# pedidos/management/commands/varrer_reservas.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from pedidos.reservas import cancelar_expirados
+from produtos.cache import invalidar_colecoes
+from produtos.models import ReservaEstoque
+
+
+class Command(BaseCommand):
+    help = (
+        'Apaga as reservas vencidas dos carrinhos e cancela os pedidos cujo prazo de pagamento expirou '
+        '(devolvendo o estoque), em lotes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Reservas (ou pedidos) por transação')
+        parser.add_argument('--pausa', type=float, default=0.0, help='Segundos de espera entre lotes')
+
+    def handle(self, *args, **options):
+        lote, pausa = options['lote'], options['pausa']
+        inicio = time.perf_counter()
+
+        # Carrinhos: a reserva só deixa de contar; o carrinho em si fica intacto
+        carrinhos = 0
+        while True:
+            apagadas = ReservaEstoque.objects.apagar_expiradas(ReservaEstoque.CARRINHO, lote)
+            carrinhos += apagadas
+            if apagadas < lote:
+                break
+            time.sleep(pausa)
+
+        # Pedidos: cursor por id, para um pedido pago no meio do caminho não voltar ao lote seguinte
+        cancelados = reservas_pedidos = 0
+        ultimo = 0
+        while True:
+            ultimo, lote_cancelados, apagadas = cancelar_expirados(lote, depois_de=ultimo)
+            if ultimo is None:
+                break
+            cancelados += lote_cancelados
+            reservas_pedidos += apagadas
+            time.sleep(pausa)
+
+        if cancelados:
+            invalidar_colecoes()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {carrinhos} reserva(s) de carrinho expirada(s), {cancelados} pedido(s) cancelado(s) '
+            f'({reservas_pedidos} reserva(s)) em {time.perf_counter() - inicio:.1f}s'
+        ))
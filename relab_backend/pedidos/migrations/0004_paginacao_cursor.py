@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-18 02:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0003_alter_pedido_numero'),
+        ('usuarios', '0004_alter_endereco_cep'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='pedido',
+            name='pedidos_ped_usuario_a4eb82_idx',
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['usuario', '-criado_em', '-id'], name='pedidos_ped_usuario_cursor'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['-criado_em', '-id'], name='pedidos_ped_criado_cursor'),
+        ),
+    ]
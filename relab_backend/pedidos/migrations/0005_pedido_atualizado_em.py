@@ -0,0 +1,20 @@
+# Generated by Django 5.0.1 on 2026-10-18 03:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0004_paginacao_cursor'),
+        ('usuarios', '0004_alter_endereco_cep'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['atualizado_em'], name='pedidos_ped_atualizado'),
+        ),
+    ]
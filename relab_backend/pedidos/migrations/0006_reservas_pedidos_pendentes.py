@@ -0,0 +1,27 @@
+from django.db import migrations
+
+# Pedidos que já aguardavam pagamento ganham a reserva com o prazo padrão (72h a partir da migração)
+RESERVAR_PENDENTES = """
+    INSERT INTO produtos_reservaestoque (produto_id, quantidade, dono_tipo, dono_id, expira_em, criado_em)
+    SELECT item.produto_id, SUM(item.quantidade), 'pedido', pedido.id, now() + interval '72 hours', now()
+    FROM pedidos_pedido AS pedido
+    JOIN pedidos_itempedido AS item ON item.pedido_id = pedido.id
+    WHERE pedido.status = 'aguardando_pagamento' AND item.produto_id IS NOT NULL
+    GROUP BY pedido.id, item.produto_id
+    ON CONFLICT DO NOTHING
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0005_pedido_atualizado_em'),
+        ('produtos', '0014_reservas_estoque'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            RESERVAR_PENDENTES,
+            reverse_sql="DELETE FROM produtos_reservaestoque WHERE dono_tipo = 'pedido'",
+        ),
+    ]
@@ -138,8 +138,11 @@ class Pedido(models.Model):
         ordering = ['-criado_em']
         indexes = [
             models.Index(fields=['numero']),
-            models.Index(fields=['usuario', '-criado_em']),
+            models.Index(fields=['usuario', '-criado_em', '-id'], name='pedidos_ped_usuario_cursor'),
+            models.Index(fields=['-criado_em', '-id'], name='pedidos_ped_criado_cursor'),
             models.Index(fields=['status']),
+            # Pedidos alterados desde a última atualização das vendas diárias (produtos/vendas.py)
+            models.Index(fields=['atualizado_em'], name='pedidos_ped_atualizado'),
         ]
 
     def __str__(self):
@@ -162,6 +165,8 @@ class Pedido(models.Model):
     @property
     def quantidade_itens(self):
         """Retorna a quantidade total de itens do pedido"""
+        if hasattr(self, 'quantidade_itens_calculada'):
+            return self.quantidade_itens_calculada
         return sum(item.quantidade for item in self.itens.all())
 
 
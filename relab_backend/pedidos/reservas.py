@@ -0,0 +1,96 @@
+# pedidos/reservas.py
+"""
+Reservas de estoque dos pedidos aguardando pagamento (ver ReservaEstoque).
+
+O checkout continua baixando o estoque na hora (baixar_estoque) e converte as
+reservas do carrinho numa reserva do pedido com prazo de
+RESERVA_PEDIDO_HORAS. Pagamento, mudança de status pelo admin e cancelamento
+liberam a reserva. A que vencer com o pedido ainda aguardando pagamento faz o
+comando varrer_reservas cancelar o pedido e devolver as unidades, em lotes,
+sem depender de alguém chamar /cancelar/.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from produtos.models import ReservaEstoque
+
+from .models import Pedido, StatusPedido
+from .serializers import devolver_estoque
+
+# Troca as reservas do carrinho pelas do pedido num único statement
+CONVERTER = """
+    WITH carrinho AS (
+        DELETE FROM {reservas} WHERE dono_tipo = 'carrinho' AND dono_id = %(carrinho)s
+    )
+    INSERT INTO {reservas} (produto_id, quantidade, dono_tipo, dono_id, expira_em, criado_em)
+    SELECT produto_id, quantidade, 'pedido', %(pedido)s, %(expira)s, %(agora)s
+    FROM unnest(%(produtos)s::bigint[], %(quantidades)s::integer[]) AS itens (produto_id, quantidade)
+"""
+
+
+def reservar_pedido(pedido_id, quantidades, carrinho_id=None):
+    """
+    Reserva do pedido recém-criado ({produto_id: quantidade}), no lugar das
+    reservas do carrinho de onde ele veio (se houver)
+    """
+    agora = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(CONVERTER.format(reservas=ReservaEstoque._meta.db_table), {
+            'carrinho': carrinho_id,
+            'pedido': pedido_id,
+            'produtos': list(quantidades),
+            'quantidades': list(quantidades.values()),
+            'expira': agora + timedelta(hours=settings.RESERVA_PEDIDO_HORAS),
+            'agora': agora,
+        })
+
+
+def liberar_pedidos(pedido_ids):
+    """Pedido pago, despachado ou cancelado: a reserva deixa de valer"""
+    return ReservaEstoque.objects.liberar(ReservaEstoque.PEDIDO, pedido_ids)
+
+
+def cancelar_expirados(lote, depois_de=0):
+    """
+    Um lote de pedidos com reserva vencida (ids > `depois_de`, em ordem): os
+    que ainda aguardam pagamento são cancelados e as unidades voltam ao
+    estoque com um único UPDATE; as reservas do lote são apagadas. Retorna
+    (último id do lote ou None, pedidos cancelados, reservas apagadas).
+    """
+    with transaction.atomic():
+        pedido_ids = list(
+            ReservaEstoque.objects.expiradas().filter(dono_tipo=ReservaEstoque.PEDIDO, dono_id__gt=depois_de)
+            .order_by('dono_id').values_list('dono_id', flat=True).distinct()[:lote]
+        )
+        if not pedido_ids:
+            return None, 0, 0
+
+        # Trava em ordem de id; um /cancelar/ ou pagamento simultâneo termina antes
+        cancelados = list(
+            Pedido.objects.select_for_update().filter(id__in=pedido_ids, status='aguardando_pagamento')
+            .order_by('id').values_list('id', flat=True)
+        )
+        if cancelados:
+            quantidades = dict(
+                ReservaEstoque.objects.filter(dono_tipo=ReservaEstoque.PEDIDO, dono_id__in=cancelados)
+                .order_by().values('produto').annotate(total=Sum('quantidade')).values_list('produto', 'total')
+            )
+            devolver_estoque(quantidades)
+
+            agora = timezone.now()
+            Pedido.objects.filter(id__in=cancelados).update(
+                status='cancelado', cancelado_em=agora, atualizado_em=agora
+            )
+            StatusPedido.objects.bulk_create([
+                StatusPedido(
+                    pedido_id=pedido_id,
+                    status='cancelado',
+                    observacao='Cancelado automaticamente: prazo de pagamento expirado'
+                )
+                for pedido_id in cancelados
+            ])
+        apagadas = liberar_pedidos(pedido_ids)
+    return pedido_ids[-1], len(cancelados), apagadas
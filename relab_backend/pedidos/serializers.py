@@ -1,9 +1,51 @@
 # pedidos/serializers.py
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Pedido, ItemPedido, StatusPedido
+from produtos.campos import CamposDinamicosMixin
 from produtos.models import Produto
 
 
+def baixar_estoque(quantidades):
+    """
+    Decrementa `estoque` e incrementa `vendas` de vários produtos com um único
+    UPDATE condicional (só altera linhas com estoque suficiente).
+    `quantidades` é {produto_id: quantidade}. Deve rodar dentro de uma transação:
+    se algum produto não tiver estoque, levanta ValidationError e nada é aplicado.
+    """
+    quantidade = Case(
+        *[When(id=produto_id, then=Value(qtd)) for produto_id, qtd in quantidades.items()],
+        output_field=IntegerField()
+    )
+    com_estoque = Q()
+    for produto_id, qtd in quantidades.items():
+        com_estoque |= Q(id=produto_id, estoque__gte=qtd)
+
+    atualizados = Produto.objects.filter(com_estoque).update(
+        estoque=F('estoque') - quantidade,
+        vendas=F('vendas') + quantidade,
+        atualizado_em=timezone.now()
+    )
+    if atualizados != len(quantidades):
+        raise serializers.ValidationError("Estoque insuficiente para um ou mais produtos.")
+
+
+def devolver_estoque(quantidades):
+    """Inverso de baixar_estoque (cancelamento): devolve o estoque e desconta `vendas`"""
+    quantidade = Case(
+        *[When(id=produto_id, then=Value(qtd)) for produto_id, qtd in quantidades.items()],
+        output_field=IntegerField()
+    )
+    Produto.objects.filter(id__in=list(quantidades)).update(
+        estoque=F('estoque') + quantidade,
+        vendas=Greatest(F('vendas') - quantidade, Value(0)),
+        atualizado_em=timezone.now()
+    )
+
+
 class ItemPedidoSerializer(serializers.ModelSerializer):
     produto_nome = serializers.CharField(source='produto.nome', read_only=True)
     produto_imagem = serializers.ImageField(source='produto.imagem', read_only=True)
@@ -41,10 +83,13 @@ class ItemPedidoCreateSerializer(serializers.Serializer):
             raise serializers.ValidationError("Produto não encontrado.")
 
     def validate(self, data):
-        produto = Produto.objects.get(id=data['produto_id'])
-        if produto.estoque < data['quantidade']:
+        # Descontadas as unidades reservadas nos carrinhos
+        disponivel = Produto.objects.com_estoque_disponivel().values_list(
+            'estoque_disponivel', flat=True
+        ).get(id=data['produto_id'])
+        if disponivel < data['quantidade']:
             raise serializers.ValidationError(
-                f"Estoque insuficiente. Disponível: {produto.estoque}"
+                f"Estoque insuficiente. Disponível: {max(disponivel, 0)}"
             )
         return data
 
@@ -67,7 +112,7 @@ class StatusPedidoSerializer(serializers.ModelSerializer):
         ]
 
 
-class PedidoSerializer(serializers.ModelSerializer):
+class PedidoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     itens = ItemPedidoSerializer(many=True, read_only=True)
     historico_status = StatusPedidoSerializer(many=True, read_only=True)
     cliente_nome = serializers.CharField(source='usuario.get_full_name', read_only=True)
@@ -109,6 +154,8 @@ class PedidoSerializer(serializers.ModelSerializer):
             'entregue_em',
             'cancelado_em',
         ]
+        # quantidade_itens vem da anotação do queryset da view (ver Pedido.quantidade_itens)
+        dependencias = {'quantidade_itens': []}
         read_only_fields = [
             'numero',
             'subtotal',
@@ -145,46 +192,71 @@ class PedidoCreateSerializer(serializers.Serializer):
     def create(self, validated_data):
         from decimal import Decimal
         from django.utils import timezone
+        from .reservas import reservar_pedido
 
         usuario = self.context['request'].user
         itens_data = validated_data.pop('itens')
 
-        # Calcula subtotal
-        subtotal = Decimal('0.00')
-        for item_data in itens_data:
-            produto = Produto.objects.get(id=item_data['produto_id'])
-            subtotal += produto.preco_final * item_data['quantidade']
-
-        # Cria o pedido
-        pedido = Pedido.objects.create(
-            usuario=usuario,
-            endereco_id=validated_data['endereco_id'],
-            forma_pagamento=validated_data['forma_pagamento'],
-            subtotal=subtotal,
-            observacao=validated_data.get('observacao', ''),
-            frete=Decimal('0.00'),
-            desconto=Decimal('0.00'),
-        )
-
-        # Cria os itens do pedido
+        quantidades = {}
         for item_data in itens_data:
-            produto = Produto.objects.get(id=item_data['produto_id'])
-            ItemPedido.objects.create(
-                pedido=pedido,
-                produto=produto,
-                quantidade=item_data['quantidade']
+            quantidades[item_data['produto_id']] = quantidades.get(item_data['produto_id'], 0) + item_data['quantidade']
+
+        with transaction.atomic():
+            # Trava os produtos em ordem de id e valida como o checkout pelo carrinho:
+            # descontadas as reservas ativas dos carrinhos
+            produtos = {
+                produto.id: produto
+                for produto in Produto.objects.select_for_update().filter(
+                    id__in=list(quantidades)
+                ).com_estoque_disponivel().order_by('id')
+            }
+            for produto_id, quantidade in quantidades.items():
+                produto = produtos[produto_id]
+                if not produto.disponivel_venda:
+                    raise serializers.ValidationError(
+                        f"Produto '{produto.nome}' não está disponível."
+                    )
+                if produto.estoque_disponivel < quantidade:
+                    raise serializers.ValidationError(
+                        f"Estoque insuficiente para '{produto.nome}'. "
+                        f"Disponível: {max(produto.estoque_disponivel, 0)}"
+                    )
+
+            # Calcula subtotal
+            subtotal = sum(
+                (produtos[item_data['produto_id']].preco_final * item_data['quantidade'] for item_data in itens_data),
+                Decimal('0.00')
             )
 
-            # Atualiza estoque
-            produto.estoque -= item_data['quantidade']
-            produto.save()
+            # Cria o pedido
+            pedido = Pedido.objects.create(
+                usuario=usuario,
+                endereco_id=validated_data['endereco_id'],
+                forma_pagamento=validated_data['forma_pagamento'],
+                subtotal=subtotal,
+                observacao=validated_data.get('observacao', ''),
+                frete=Decimal('0.00'),
+                desconto=Decimal('0.00'),
+            )
 
-        # Cria registro no histórico
-        StatusPedido.objects.create(
-            pedido=pedido,
-            status='aguardando_pagamento',
-            criado_por=usuario
-        )
+            # Cria os itens do pedido
+            for item_data in itens_data:
+                ItemPedido.objects.create(
+                    pedido=pedido,
+                    produto=produtos[item_data['produto_id']],
+                    quantidade=item_data['quantidade']
+                )
+
+            # Atualiza estoque e vendas (mesmo caminho do checkout pelo carrinho)
+            baixar_estoque(quantidades)
+            reservar_pedido(pedido.id, quantidades)
+
+            # Cria registro no histórico
+            StatusPedido.objects.create(
+                pedido=pedido,
+                status='aguardando_pagamento',
+                criado_por=usuario
+            )
 
         return pedido
 
@@ -205,70 +277,88 @@ class PedidoFromCarrinhoSerializer(serializers.Serializer):
 
     def create(self, validated_data):
         from decimal import Decimal
-        from django.utils import timezone
         from carrinho.models import Carrinho
+        from .reservas import reservar_pedido
 
         usuario = self.context['request'].user
 
-        # Busca o carrinho do usuário
-        try:
-            carrinho = Carrinho.objects.get(usuario=usuario)
-        except Carrinho.DoesNotExist:
-            raise serializers.ValidationError("Carrinho vazio ou não encontrado.")
+        with transaction.atomic():
+            # Trava o carrinho (evita dois checkouts simultâneos do mesmo usuário)
+            try:
+                carrinho = Carrinho.objects.select_for_update().get(usuario=usuario)
+            except Carrinho.DoesNotExist:
+                raise serializers.ValidationError("Carrinho vazio ou não encontrado.")
+
+            itens_carrinho = list(carrinho.itens.values_list('produto_id', 'quantidade', 'preco_unitario'))
+
+            # Verifica se tem itens
+            if not itens_carrinho:
+                raise serializers.ValidationError("Carrinho está vazio.")
+
+            # Trava os produtos sempre em ordem de id para evitar deadlocks entre checkouts
+            produtos = {
+                produto.id: produto
+                for produto in Produto.objects.select_for_update().filter(
+                    id__in=[produto_id for produto_id, _, _ in itens_carrinho]
+                ).com_estoque_disponivel(carrinho.id).order_by('id').only('id', 'nome', 'estoque', 'ativo', 'disponivel')
+            }
+
+            # Valida estoque de todos os itens (com as linhas travadas), descontadas as reservas de outros carrinhos
+            for produto_id, quantidade, _ in itens_carrinho:
+                produto = produtos[produto_id]
+                if not produto.disponivel_venda:
+                    raise serializers.ValidationError(
+                        f"Produto '{produto.nome}' não está disponível."
+                    )
+                if produto.estoque_disponivel < quantidade:
+                    raise serializers.ValidationError(
+                        f"Estoque insuficiente para '{produto.nome}'. "
+                        f"Disponível: {max(produto.estoque_disponivel, 0)}"
+                    )
+
+            # Calcula subtotal do carrinho
+            subtotal = sum(
+                (quantidade * preco_unitario for _, quantidade, preco_unitario in itens_carrinho),
+                Decimal('0.00')
+            )
 
-        # Verifica se tem itens
-        if not carrinho.itens.exists():
-            raise serializers.ValidationError("Carrinho está vazio.")
+            # Cria o pedido
+            pedido = Pedido.objects.create(
+                usuario=usuario,
+                endereco_id=validated_data['endereco_id'],
+                forma_pagamento=validated_data['forma_pagamento'],
+                subtotal=subtotal,
+                observacao=validated_data.get('observacao', ''),
+                frete=Decimal('0.00'),
+                desconto=Decimal('0.00'),
+            )
 
-        # Valida estoque de todos os itens
-        for item in carrinho.itens.all():
-            if not item.produto.disponivel_venda:
-                raise serializers.ValidationError(
-                    f"Produto '{item.produto.nome}' não está disponível."
-                )
-            if item.produto.estoque < item.quantidade:
-                raise serializers.ValidationError(
-                    f"Estoque insuficiente para '{item.produto.nome}'. "
-                    f"Disponível: {item.produto.estoque}"
+            # Cria os itens do pedido a partir do carrinho (bulk_create não chama save())
+            ItemPedido.objects.bulk_create([
+                ItemPedido(
+                    pedido=pedido,
+                    produto_id=produto_id,
+                    nome_produto=produtos[produto_id].nome,
+                    quantidade=quantidade,
+                    preco_unitario=preco_unitario,
+                    subtotal=preco_unitario * quantidade
                 )
+                for produto_id, quantidade, preco_unitario in itens_carrinho
+            ])
+
+            # Atualiza estoque e vendas; as reservas do carrinho passam para o pedido
+            quantidades = {produto_id: quantidade for produto_id, quantidade, _ in itens_carrinho}
+            baixar_estoque(quantidades)
+            reservar_pedido(pedido.id, quantidades, carrinho_id=carrinho.id)
 
-        # Calcula subtotal do carrinho
-        subtotal = carrinho.subtotal
-
-        # Cria o pedido
-        pedido = Pedido.objects.create(
-            usuario=usuario,
-            endereco_id=validated_data['endereco_id'],
-            forma_pagamento=validated_data['forma_pagamento'],
-            subtotal=subtotal,
-            observacao=validated_data.get('observacao', ''),
-            frete=Decimal('0.00'),
-            desconto=Decimal('0.00'),
-        )
-
-        # Cria os itens do pedido a partir do carrinho
-        for item_carrinho in carrinho.itens.all():
-            ItemPedido.objects.create(
+            # Cria registro no histórico
+            StatusPedido.objects.create(
                 pedido=pedido,
-                produto=item_carrinho.produto,
-                quantidade=item_carrinho.quantidade,
-                preco_unitario=item_carrinho.preco_unitario
+                status='aguardando_pagamento',
+                criado_por=usuario
             )
 
-            # Atualiza estoque e vendas
-            produto = item_carrinho.produto
-            produto.estoque -= item_carrinho.quantidade
-            produto.vendas += item_carrinho.quantidade
-            produto.save()
+            # LIMPA O CARRINHO
+            carrinho.limpar()
 
-        # Cria registro no histórico
-        StatusPedido.objects.create(
-            pedido=pedido,
-            status='aguardando_pagamento',
-            criado_por=usuario
-        )
-
-        # LIMPA O CARRINHO
-        carrinho.limpar()
-
-        return pedido
\ No newline at end of file
+        return pedido
@@ -1,3 +1,395 @@
-from django.test import TestCase
+import random
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
+
+from carrinho.models import Carrinho, ItemCarrinho
+from pagamentos.models import Pagamento
+from produtos.models import Produto, ReservaEstoque
+from usuarios.models import Endereco
+from .models import Pedido, ItemPedido, StatusPedido
+
+Usuario = get_user_model()
+
+
+class CheckoutConcorrenteTests(TransactionTestCase):
+    """
+    Vários clientes finalizam o carrinho ao mesmo tempo disputando o mesmo
+    estoque. Nenhum produto pode ficar com estoque negativo nem vender mais
+    do que tinha, e carrinhos com os mesmos produtos em ordens diferentes
+    não podem travar (deadlock). A vazão (pedidos/s) é medida pelo comando
+    benchmark_checkout.
+    """
+    CLIENTES = 24
+    ESTOQUE = 10
+
+    def setUp(self):
+        self.produtos = [
+            Produto.objects.create(nome=f'Produto disputado {i}', preco=Decimal('50.00'), estoque=self.ESTOQUE)
+            for i in range(2)
+        ]
+        self.clientes = []
+        rng = random.Random(7)
+        for i in range(self.CLIENTES):
+            usuario = Usuario.objects.create_user(
+                username=f'cliente{i}',
+                email=f'cliente{i}@relab.co',
+                password=None,
+                cpf=f'{i:011d}',
+                telefone='11987654321',
+            )
+            endereco = Endereco.objects.create(
+                usuario=usuario,
+                titulo='Casa',
+                cep='01001000',
+                logradouro='Praça da Sé',
+                numero='1',
+                bairro='Sé',
+                cidade='São Paulo',
+                estado='SP',
+            )
+            carrinho = Carrinho.objects.create(usuario=usuario)
+            # Ordem de inserção aleatória: o checkout precisa travar por id, não pela ordem do carrinho
+            for produto in rng.sample(self.produtos, len(self.produtos)):
+                ItemCarrinho.objects.create(
+                    carrinho=carrinho,
+                    produto=produto,
+                    quantidade=1,
+                    preco_unitario=produto.preco,
+                )
+            self.clientes.append((usuario, endereco))
+
+    def finalizar(self, usuario, endereco, respostas, barreira):
+        client = APIClient()
+        client.force_authenticate(usuario)
+        barreira.wait()
+        try:
+            response = client.post(
+                '/api/v1/pedidos/criar_do_carrinho/',
+                {'endereco_id': endereco.id, 'forma_pagamento': 'pix'},
+                format='json'
+            )
+            respostas.append(response.status_code)
+        finally:
+            connection.close()
+
+    def test_checkout_concorrente_nao_vende_alem_do_estoque(self):
+        respostas = []
+        barreira = threading.Barrier(self.CLIENTES)
+        threads = [
+            threading.Thread(target=self.finalizar, args=(usuario, endereco, respostas, barreira))
+            for usuario, endereco in self.clientes
+        ]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        sucesso = respostas.count(201)
+        self.assertEqual(len(respostas), self.CLIENTES)
+        self.assertEqual(sucesso, self.ESTOQUE)
+        self.assertEqual(respostas.count(400), self.CLIENTES - self.ESTOQUE)
+        self.assertEqual(Pedido.objects.count(), self.ESTOQUE)
+
+        for produto in self.produtos:
+            produto.refresh_from_db()
+            vendidos = sum(ItemPedido.objects.filter(produto=produto).values_list('quantidade', flat=True))
+            self.assertEqual(produto.estoque, 0)
+            self.assertEqual(produto.vendas, self.ESTOQUE)
+            self.assertEqual(vendidos, self.ESTOQUE)
+
+    def test_checkout_sem_estoque_nao_altera_nada(self):
+        usuario, endereco = self.clientes[0]
+        Produto.objects.filter(pk=self.produtos[1].pk).update(estoque=0)
+
+        client = APIClient()
+        client.force_authenticate(usuario)
+        response = client.post(
+            '/api/v1/pedidos/criar_do_carrinho/',
+            {'endereco_id': endereco.id, 'forma_pagamento': 'pix'},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Pedido.objects.exists())
+        self.assertEqual(Produto.objects.get(pk=self.produtos[0].pk).estoque, self.ESTOQUE)
+        self.assertEqual(ItemCarrinho.objects.filter(carrinho__usuario=usuario).count(), 2)
+
+    def test_cancelar_devolve_estoque_e_vendas(self):
+        usuario, endereco = self.clientes[0]
+        client = APIClient()
+        client.force_authenticate(usuario)
+        response = client.post(
+            '/api/v1/pedidos/criar_do_carrinho/',
+            {'endereco_id': endereco.id, 'forma_pagamento': 'pix'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        pedido = Pedido.objects.get(usuario=usuario)
+
+        response = client.post(f'/api/v1/pedidos/{pedido.pk}/cancelar/', format='json')
+        self.assertEqual(response.status_code, 200)
+        # Segundo cancelamento é recusado e não devolve o estoque de novo
+        response = client.post(f'/api/v1/pedidos/{pedido.pk}/cancelar/', format='json')
+        self.assertEqual(response.status_code, 400)
+
+        for produto in self.produtos:
+            produto.refresh_from_db()
+            self.assertEqual(produto.estoque, self.ESTOQUE)
+            self.assertEqual(produto.vendas, 0)
+
+
+class ReservasEstoqueTests(APITestCase):
+    """
+    Reservas com prazo: o carrinho segura as unidades para os outros clientes,
+    o checkout passa a reserva para o pedido e varrer_reservas cancela o
+    pedido que não foi pago no prazo.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.produto = Produto.objects.create(nome='Produto reservado', preco=Decimal('20.00'), estoque=5)
+        cls.clientes = []
+        for i in range(2):
+            usuario = Usuario.objects.create_user(
+                username=f'reserva{i}',
+                email=f'reserva{i}@relab.co',
+                password=None,
+                cpf=f'9{i:010d}',
+                telefone='11987654321',
+            )
+            endereco = Endereco.objects.create(
+                usuario=usuario,
+                titulo='Casa',
+                cep='01001000',
+                logradouro='Praça da Sé',
+                numero='1',
+                bairro='Sé',
+                cidade='São Paulo',
+                estado='SP',
+            )
+            cls.clientes.append((usuario, endereco))
+
+    def adicionar(self, usuario, quantidade):
+        self.client.force_authenticate(usuario)
+        return self.client.post(
+            '/api/v1/carrinho/adicionar/',
+            {'produto_id': self.produto.id, 'quantidade': quantidade},
+            format='json'
+        )
+
+    def finalizar(self, usuario, endereco):
+        self.client.force_authenticate(usuario)
+        return self.client.post(
+            '/api/v1/pedidos/criar_do_carrinho/',
+            {'endereco_id': endereco.id, 'forma_pagamento': 'pix'},
+            format='json'
+        )
+
+    def varrer(self):
+        call_command('varrer_reservas', lote=1, stdout=StringIO())
+
+    def test_reserva_de_outro_carrinho_limita_adicionar(self):
+        (primeiro, _), (segundo, _) = self.clientes
+        self.assertEqual(self.adicionar(primeiro, 4).status_code, 201)
+        reserva = ReservaEstoque.objects.get(dono_tipo=ReservaEstoque.CARRINHO)
+        self.assertEqual(reserva.quantidade, 4)
+
+        self.assertEqual(self.adicionar(segundo, 2).status_code, 400)
+        self.assertEqual(self.adicionar(segundo, 1).status_code, 201)
+
+        # Reserva vencida deixa de contar, mesmo antes da varredura
+        ReservaEstoque.objects.filter(pk=reserva.pk).update(expira_em=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.adicionar(segundo, 3).status_code, 200)
+
+    def test_checkout_converte_reserva_e_cancelar_libera(self):
+        usuario, endereco = self.clientes[0]
+        self.adicionar(usuario, 3)
+        self.assertEqual(self.finalizar(usuario, endereco).status_code, 201)
+
+        pedido = Pedido.objects.get(usuario=usuario)
+        reserva = ReservaEstoque.objects.get()
+        self.assertEqual(
+            (reserva.dono_tipo, reserva.dono_id, reserva.quantidade), (ReservaEstoque.PEDIDO, pedido.id, 3)
+        )
+
+        self.assertEqual(self.client.post(f'/api/v1/pedidos/{pedido.pk}/cancelar/').status_code, 200)
+        self.assertFalse(ReservaEstoque.objects.exists())
+
+    def test_varredura_cancela_pedido_expirado(self):
+        (primeiro, endereco), (segundo, outro_endereco) = self.clientes
+        for usuario, destino in self.clientes:
+            self.adicionar(usuario, 2)
+            self.finalizar(usuario, destino)
+        pago = Pedido.objects.get(usuario=segundo)
+        Pedido.objects.filter(pk=pago.pk).update(status='pago')
+        ReservaEstoque.objects.update(expira_em=timezone.now() - timedelta(minutes=1))
+
+        # Carrinho com reserva vencida: a varredura apaga a reserva, não o item
+        self.adicionar(primeiro, 1)
+        ReservaEstoque.objects.filter(dono_tipo=ReservaEstoque.CARRINHO).update(
+            expira_em=timezone.now() - timedelta(minutes=1)
+        )
+
+        self.varrer()
+
+        pedido = Pedido.objects.get(usuario=primeiro)
+        self.assertEqual(pedido.status, 'cancelado')
+        self.assertEqual(pedido.historico_status.get(status='cancelado').observacao,
+                         'Cancelado automaticamente: prazo de pagamento expirado')
+        self.assertEqual(Pedido.objects.get(pk=pago.pk).status, 'pago')
+        self.assertFalse(ReservaEstoque.objects.exists())
+        self.assertTrue(ItemCarrinho.objects.filter(carrinho__usuario=primeiro).exists())
+
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque, 3)
+        self.assertEqual(self.produto.vendas, 2)
+
+    def test_pedido_manual_desconta_reservas_dos_carrinhos(self):
+        (primeiro, _), (segundo, endereco) = self.clientes
+        self.adicionar(primeiro, 2)
+
+        # Cada linha passa sozinha (3 disponíveis), o total de 4 não
+        self.client.force_authenticate(segundo)
+        dados = {
+            'endereco_id': endereco.id, 'forma_pagamento': 'pix',
+            'itens': [{'produto_id': self.produto.id, 'quantidade': 2}] * 2,
+        }
+        self.assertEqual(self.client.post('/api/v1/pedidos/', dados, format='json').status_code, 400)
+        self.assertFalse(Pedido.objects.exists())
+
+        dados['itens'] = [{'produto_id': self.produto.id, 'quantidade': 3}]
+        self.assertEqual(self.client.post('/api/v1/pedidos/', dados, format='json').status_code, 201)
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque, 2)
+
+    def test_admin_cancelando_devolve_o_estoque(self):
+        usuario, endereco = self.clientes[0]
+        self.adicionar(usuario, 2)
+        self.finalizar(usuario, endereco)
+        pedido = Pedido.objects.get(usuario=usuario)
+
+        admin = Usuario.objects.create_user(
+            username='admin', email='admin@relab.co', password=None, cpf='80000000000',
+            telefone='11987654321', is_staff=True
+        )
+        self.client.force_authenticate(admin)
+        url = f'/api/v1/pedidos/{pedido.pk}/atualizar_status/'
+        self.assertEqual(self.client.post(url, {'status': 'cancelado'}, format='json').status_code, 200)
+        # Pedido cancelado não muda mais de status nem devolve de novo
+        self.assertEqual(self.client.post(url, {'status': 'cancelado'}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'status': 'pago'}, format='json').status_code, 400)
+
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.status, 'cancelado')
+        self.assertIsNotNone(pedido.cancelado_em)
+        self.assertFalse(ReservaEstoque.objects.exists())
+        self.produto.refresh_from_db()
+        self.assertEqual((self.produto.estoque, self.produto.vendas), (5, 0))
+
+    def webhook(self, pedido, status_mp):
+        pagamento = {'status': status_mp, 'external_reference': str(pedido.id), 'payment_type_id': 'pix'}
+        with mock.patch('pagamentos.views.mercadopago.SDK') as sdk:
+            sdk.return_value.payment.return_value.get.return_value = {'response': pagamento}
+            return self.client.post('/api/v1/pagamentos/webhook/?data.id=123', format='json')
+
+    def test_pagamento_aprovado_libera_a_reserva(self):
+        usuario, endereco = self.clientes[0]
+        self.adicionar(usuario, 2)
+        self.finalizar(usuario, endereco)
+        pedido = Pedido.objects.get(usuario=usuario)
+        Pagamento.objects.create(pedido=pedido, valor=pedido.total)
+
+        self.assertEqual(self.webhook(pedido, 'approved').status_code, 200)
+        self.assertEqual(Pedido.objects.get(pk=pedido.pk).status, 'confirmado')
+        self.assertFalse(ReservaEstoque.objects.exists())
+
+        # Reserva liberada: a varredura não cancela o pedido pago
+        self.varrer()
+        self.assertEqual(Pedido.objects.get(pk=pedido.pk).status, 'confirmado')
+
+    def test_pagamento_aprovado_depois_da_varredura_nao_reabre_o_pedido(self):
+        usuario, endereco = self.clientes[0]
+        self.adicionar(usuario, 2)
+        self.finalizar(usuario, endereco)
+        pedido = Pedido.objects.get(usuario=usuario)
+        Pagamento.objects.create(pedido=pedido, valor=pedido.total)
+        ReservaEstoque.objects.update(expira_em=timezone.now() - timedelta(minutes=1))
+        self.varrer()
+
+        for _ in range(2):
+            response = self.webhook(pedido, 'approved')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, {'status': 'pedido_cancelado'})
+
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.status, 'cancelado')
+        self.assertEqual(pedido.pagamento.status, 'approved')
+        # Sinalizado uma vez para estorno, mesmo com o webhook repetido
+        self.assertEqual(
+            list(pedido.historico_status.filter(observacao__contains='estornar').values_list('status', flat=True)),
+            ['cancelado']
+        )
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque, 5)
+
+
+class CamposPedidoTests(APITestCase):
+    """?fields= só reduz o payload: sem ele, listagem e detalhe vêm completos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(
+            username='campos', email='campos@relab.co', password=None, cpf='71234567890', telefone='11987654321'
+        )
+        endereco = Endereco.objects.create(
+            usuario=cls.usuario, titulo='Casa', cep='01001000', logradouro='Praça da Sé',
+            numero='1', bairro='Sé', cidade='São Paulo', estado='SP',
+        )
+        produto = Produto.objects.create(nome='Produto pedido', preco=Decimal('15.00'), estoque=5)
+        cls.pedido = Pedido.objects.create(
+            usuario=cls.usuario, endereco=endereco, forma_pagamento='pix', subtotal=Decimal('30.00')
+        )
+        ItemPedido.objects.create(pedido=cls.pedido, produto=produto, quantidade=2)
+        StatusPedido.objects.create(pedido=cls.pedido, status='aguardando_pagamento')
+
+    def setUp(self):
+        self.client.force_authenticate(self.usuario)
+
+    def listar(self, parametros=''):
+        return self.client.get(f'/api/v1/pedidos/{parametros}')
+
+    def test_listagem_padrao_completa(self):
+        pedido, = self.listar().data['results']
+        self.assertEqual(len(pedido['itens']), 1)
+        self.assertEqual(len(pedido['historico_status']), 1)
+        self.assertEqual(pedido['quantidade_itens'], 2)
+
+    def test_fields_reduz_o_payload(self):
+        pedido, = self.listar('?fields=id,numero,quantidade_itens').data['results']
+        self.assertEqual(set(pedido), {'id', 'numero', 'quantidade_itens'})
+        self.assertEqual(pedido['quantidade_itens'], 2)
+
+        response = self.client.get(f'/api/v1/pedidos/{self.pedido.id}/?fields=id,itens')
+        self.assertEqual(set(response.data), {'id', 'itens'})
+        self.assertEqual(response.data['itens'][0]['quantidade'], 2)
+
+    def test_campo_desconhecido(self):
+        response = self.listar('?fields=id,inexistente')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['fields'], ['Campo(s) inválido(s): inexistente'])
+
+        # Pedidos não têm relações opcionais: ?expand= de qualquer coisa é erro
+        response = self.listar('?expand=itens')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('expand', response.data)
@@ -5,20 +5,28 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from produtos.campos import CamposDinamicosViewMixin
+from produtos.pagination import PaginacaoHibrida
 
-from .models import Pedido, StatusPedido
+from .models import Pedido, ItemPedido, StatusPedido
+from .reservas import liberar_pedidos
 from .serializers import (
     PedidoSerializer,
     PedidoCreateSerializer,
     PedidoFromCarrinhoSerializer,  # 🔥 ADICIONE ESTE IMPORT
-    StatusPedidoSerializer
+    StatusPedidoSerializer,
+    devolver_estoque
 )
 
 
-class PedidoViewSet(viewsets.ModelViewSet):
+class PedidoViewSet(CamposDinamicosViewMixin, viewsets.ModelViewSet):
     """
     ViewSet para gerenciar pedidos
+    - ?fields= nas listagens e no detalhe: o padrão é o payload completo (ver produtos/campos.py)
     """
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
@@ -26,7 +34,9 @@ class PedidoViewSet(viewsets.ModelViewSet):
     search_fields = ['numero', 'usuario__email', 'usuario__first_name']
     ordering_fields = ['criado_em', 'total']
     ordering = ['-criado_em']
+    pagination_class = PaginacaoHibrida
     queryset = Pedido.objects.all()
+    acoes_campos_dinamicos = ('list', 'retrieve', 'meus_pedidos')
 
     def get_queryset(self):
         """
@@ -35,15 +45,22 @@ class PedidoViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
 
-        if user.is_staff or user.tipo_usuario == 'admin':
-            return Pedido.objects.all().select_related(
-                'usuario', 'endereco'
-            ).prefetch_related('itens', 'historico_status')
-
-        return Pedido.objects.filter(usuario=user).select_related(
+        # Total de unidades calculado no banco (evita carregar os itens só para somar).
+        # Subquery em vez de JOIN + GROUP BY: mantém a ordenação padrão e o COUNT simples
+        quantidade_itens = ItemPedido.objects.filter(pedido=OuterRef('pk')).values('pedido').annotate(
+            total=Sum('quantidade')
+        ).values('total')
+        pedidos = Pedido.objects.annotate(
+            quantidade_itens_calculada=Coalesce(Subquery(quantidade_itens), 0)
+        ).select_related(
             'usuario', 'endereco'
         ).prefetch_related('itens', 'historico_status')
 
+        if user.is_staff or user.tipo_usuario == 'admin':
+            return pedidos
+
+        return pedidos.filter(usuario=user)
+
     def get_serializer_class(self):
         if self.action == 'create':
             return PedidoCreateSerializer
@@ -114,31 +131,57 @@ class PedidoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        pedido.status = novo_status
-
-        if novo_status == 'pago' and not pedido.pago_em:
-            pedido.pago_em = timezone.now()
-        elif novo_status == 'enviado' and not pedido.enviado_em:
-            pedido.enviado_em = timezone.now()
-        elif novo_status == 'entregue' and not pedido.entregue_em:
-            pedido.entregue_em = timezone.now()
-        elif novo_status == 'cancelado' and not pedido.cancelado_em:
-            pedido.cancelado_em = timezone.now()
-
-        pedido.save()
-
-        StatusPedido.objects.create(
-            pedido=pedido,
-            status=novo_status,
-            observacao=observacao,
-            criado_por=request.user
-        )
+        with transaction.atomic():
+            # Trava o pedido (como /cancelar/ e o webhook de pagamento)
+            pedido = Pedido.objects.select_for_update().get(pk=pedido.pk)
+            if pedido.status == 'cancelado':
+                return Response(
+                    {'error': 'Pedido cancelado: o estoque já foi devolvido'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            if novo_status == 'cancelado':
+                self.devolver_e_cancelar(pedido)
+            else:
+                pedido.status = novo_status
+
+                # Fora de "aguardando pagamento" o pedido não expira mais (ver pedidos/reservas.py)
+                if novo_status != 'aguardando_pagamento':
+                    liberar_pedidos([pedido.id])
+
+                if novo_status == 'pago' and not pedido.pago_em:
+                    pedido.pago_em = timezone.now()
+                elif novo_status == 'enviado' and not pedido.enviado_em:
+                    pedido.enviado_em = timezone.now()
+                elif novo_status == 'entregue' and not pedido.entregue_em:
+                    pedido.entregue_em = timezone.now()
+
+                pedido.save()
+
+            StatusPedido.objects.create(
+                pedido=pedido,
+                status=novo_status,
+                observacao=observacao,
+                criado_por=request.user
+            )
 
         return Response(
             PedidoSerializer(pedido).data,
             status=status.HTTP_200_OK
         )
 
+    def devolver_e_cancelar(self, pedido):
+        """Cancela o pedido travado: devolve o estoque, desconta as vendas e libera a reserva"""
+        quantidades = {}
+        for produto_id, quantidade in pedido.itens.values_list('produto_id', 'quantidade'):
+            quantidades[produto_id] = quantidades.get(produto_id, 0) + quantidade
+        devolver_estoque(quantidades)
+        liberar_pedidos([pedido.id])
+
+        pedido.status = 'cancelado'
+        pedido.cancelado_em = timezone.now()
+        pedido.save()
+
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
     def adicionar_rastreio(self, request, pk=None):
         """
@@ -181,29 +224,24 @@ class PedidoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        if pedido.status != 'aguardando_pagamento':
-            return Response(
-                {'error': 'Só é possível cancelar pedidos aguardando pagamento'},
-                status=status.HTTP_400_BAD_REQUEST
+        with transaction.atomic():
+            # Trava o pedido: dois cancelamentos simultâneos não devolvem o estoque duas vezes
+            pedido = Pedido.objects.select_for_update().get(pk=pedido.pk)
+            if pedido.status != 'aguardando_pagamento':
+                return Response(
+                    {'error': 'Só é possível cancelar pedidos aguardando pagamento'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            self.devolver_e_cancelar(pedido)
+
+            StatusPedido.objects.create(
+                pedido=pedido,
+                status='cancelado',
+                observacao=request.data.get('observacao', 'Cancelado pelo cliente'),
+                criado_por=request.user
             )
 
-        # Devolve estoque
-        for item in pedido.itens.all():
-            produto = item.produto
-            produto.estoque += item.quantidade
-            produto.save()
-
-        pedido.status = 'cancelado'
-        pedido.cancelado_em = timezone.now()
-        pedido.save()
-
-        StatusPedido.objects.create(
-            pedido=pedido,
-            status='cancelado',
-            observacao=request.data.get('observacao', 'Cancelado pelo cliente'),
-            criado_por=request.user
-        )
-
         return Response(
             PedidoSerializer(pedido).data,
             status=status.HTTP_200_OK
@@ -212,7 +250,7 @@ class PedidoViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def meus_pedidos(self, request):
         """Lista os pedidos do usuário autenticado"""
-        pedidos = self.get_queryset()
+        pedidos = self.aplicar_campos(self.get_queryset())
         page = self.paginate_queryset(pedidos)
 
         if page is not None:
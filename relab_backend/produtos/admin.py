@@ -1,7 +1,10 @@
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
-from django.db.models import Count, Q
-from .models import Categoria, Produto, ImagemProduto
+from .models import Categoria, Produto, ImagemProduto, PrecoProduto
+from .cache import invalidar_colecoes
+from .precos import encerrar_campanha, recalcular
+from .imagens import url_derivado
 
 
 class ImagemProdutoInline(admin.TabularInline):
@@ -16,39 +19,46 @@ class CategoriaAdmin(admin.ModelAdmin):
     list_display = [
         'nome',
         'slug',
+        'pai',
         'quantidade_produtos',
         'ordem',
         'ativo',
         'criado_em'
     ]
-    list_filter = ['ativo', 'criado_em']
+    list_filter = ['ativo', ('pai', admin.EmptyFieldListFilter), 'criado_em']
     search_fields = ['nome', 'descricao']
     prepopulated_fields = {'slug': ('nome',)}
     list_editable = ['ordem', 'ativo']
-    readonly_fields = ['criado_em', 'atualizado_em', 'quantidade_produtos']
+    readonly_fields = [
+        'criado_em',
+        'atualizado_em',
+        'quantidade_produtos',
+        'produtos_disponiveis',
+        'produtos_em_estoque'
+    ]
 
     fieldsets = (
         ('Informações Básicas', {
-            'fields': ('nome', 'slug', 'descricao', 'imagem')
+            'fields': ('nome', 'slug', 'pai', 'descricao', 'imagem')
         }),
         ('Configurações', {
             'fields': ('ordem', 'ativo')
         }),
         ('Estatísticas', {
-            'fields': ('quantidade_produtos', 'criado_em', 'atualizado_em'),
+            'fields': (
+                'quantidade_produtos',
+                'produtos_disponiveis',
+                'produtos_em_estoque',
+                'criado_em',
+                'atualizado_em'
+            ),
             'classes': ('collapse',)
         }),
     )
 
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.annotate(
-            produtos_count=Count('produtos', filter=Q(produtos__ativo=True))
-        )
-
-    @admin.display(description='Produtos', ordering='produtos_count')
+    @admin.display(description='Produtos', ordering='produtos_ativos')
     def quantidade_produtos(self, obj):
-        count = obj.produtos_count
+        count = obj.produtos_ativos
         return format_html(
             '<span style="color: {};">{} produto{}</span>',
             'green' if count > 0 else 'red',
@@ -79,7 +89,7 @@ class ProdutoAdmin(admin.ModelAdmin):
         'categoria',
         'criado_em'
     ]
-    search_fields = ['nome', 'descricao', 'slug']
+    search_fields = ['nome', 'descricao', 'slug', 'sku']
     prepopulated_fields = {'slug': ('nome',)}
     list_editable = ['ativo', 'em_destaque']
     readonly_fields = [
@@ -96,6 +106,7 @@ class ProdutoAdmin(admin.ModelAdmin):
             'fields': (
                 'nome',
                 'slug',
+                'sku',
                 'descricao_curta',
                 'descricao',
                 'categoria'
@@ -149,9 +160,10 @@ class ProdutoAdmin(admin.ModelAdmin):
     @admin.display(description='Imagem')
     def imagem_thumb(self, obj):
         if obj.imagem:
+            # Miniatura gerada (a original pode ter vários MB); a original enquanto não existir
             return format_html(
                 '<img src="{}" width="50" height="50" style="object-fit: cover; border-radius: 5px;" />',
-                obj.imagem.url
+                url_derivado(obj.imagem_derivados, 100) or obj.imagem.url
             )
         return '-'
 
@@ -160,7 +172,7 @@ class ProdutoAdmin(admin.ModelAdmin):
         if obj.imagem:
             return format_html(
                 '<img src="{}" style="max-width: 300px; border-radius: 8px;" />',
-                obj.imagem.url
+                url_derivado(obj.imagem_derivados, 600) or obj.imagem.url
             )
         return 'Sem imagem'
 
@@ -208,21 +220,25 @@ class ProdutoAdmin(admin.ModelAdmin):
     @admin.action(description='✅ Ativar produtos selecionados')
     def ativar_produtos(self, request, queryset):
         updated = queryset.update(ativo=True)
+        transaction.on_commit(invalidar_colecoes)
         self.message_user(request, f'{updated} produto(s) ativado(s) com sucesso.')
 
     @admin.action(description='❌ Desativar produtos selecionados')
     def desativar_produtos(self, request, queryset):
         updated = queryset.update(ativo=False)
+        transaction.on_commit(invalidar_colecoes)
         self.message_user(request, f'{updated} produto(s) desativado(s) com sucesso.')
 
     @admin.action(description='⭐ Marcar como destaque')
     def marcar_destaque(self, request, queryset):
         updated = queryset.update(em_destaque=True)
+        transaction.on_commit(invalidar_colecoes)
         self.message_user(request, f'{updated} produto(s) marcado(s) como destaque.')
 
     @admin.action(description='⚪ Desmarcar como destaque')
     def desmarcar_destaque(self, request, queryset):
         updated = queryset.update(em_destaque=False)
+        transaction.on_commit(invalidar_colecoes)
         self.message_user(request, f'{updated} produto(s) desmarcado(s) como destaque.')
 
 
@@ -236,8 +252,49 @@ class ImagemProdutoAdmin(admin.ModelAdmin):
     @admin.display(description='Imagem')
     def imagem_thumb(self, obj):
         if obj.imagem:
+            # Miniatura gerada (a original pode ter vários MB); a original enquanto não existir
             return format_html(
                 '<img src="{}" width="50" height="50" style="object-fit: cover; border-radius: 5px;" />',
-                obj.imagem.url
+                url_derivado(obj.imagem_derivados, 100) or obj.imagem.url
             )
-        return '-'
\ No newline at end of file
+        return '-'
+
+
+@admin.register(PrecoProduto)
+class PrecoProdutoAdmin(admin.ModelAdmin):
+    """Programação/histórico de preços; alterações aqui valem na hora (ver produtos/precos.py)"""
+    list_display = ['produto', 'campanha', 'preco', 'preco_promocional', 'valido_de', 'valido_ate', 'criado_em']
+    list_filter = ['campanha', 'valido_de']
+    search_fields = ['produto__nome', 'produto__sku', 'campanha']
+    date_hierarchy = 'valido_de'
+    raw_id_fields = ['produto']
+    list_select_related = ['produto']
+
+    actions = ['encerrar_campanhas']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.aplicar([obj.produto_id])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.aplicar([obj.produto_id])
+
+    def delete_queryset(self, request, queryset):
+        produto_ids = list(queryset.values_list('produto_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        self.aplicar(produto_ids)
+
+    def aplicar(self, produto_ids):
+        if recalcular(produto_ids):
+            transaction.on_commit(invalidar_colecoes)
+
+    @admin.action(description='⏹️ Encerrar agora as campanhas selecionadas')
+    def encerrar_campanhas(self, request, queryset):
+        campanhas = set(queryset.exclude(campanha='').values_list('campanha', flat=True))
+        alterados = 0
+        for campanha in campanhas:
+            alterados += len(encerrar_campanha(campanha)[1])
+        if alterados:
+            transaction.on_commit(invalidar_colecoes)
+        self.message_user(request, f'{len(campanhas)} campanha(s) encerrada(s), {alterados} preço(s) revertido(s).')
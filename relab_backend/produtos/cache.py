@@ -0,0 +1,82 @@
+# produtos/cache.py
+"""
+Cache das coleções da vitrine (destaques, promoções, mais vendidos, novidades).
+
+As chaves carregam a versão do catálogo (`produtos:colecoes:v<N>:...`).
+Qualquer alteração em Produto, Categoria ou ImagemProduto incrementa a versão
+(ver signals.py e as actions do admin), e as chaves antigas deixam de ser lidas.
+
+Para evitar que uma invalidação (ou um deploy) faça todos os workers
+recalcularem ao mesmo tempo, só quem obtém a trava recalcula; os demais
+continuam servindo a última versão calculada (stale) até ela ficar pronta.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSAO_KEY = 'produtos:colecoes:versao'
+TRAVA_TTL = 30
+ESPERA_MAXIMA = 2.0
+
+
+def versao_colecoes():
+    """Versão atual do catálogo usada nas chaves das coleções"""
+    return cache.get_or_set(VERSAO_KEY, 1, timeout=None)
+
+
+def invalidar_colecoes():
+    """Incrementa a versão: as coleções em cache passam a ser recalculadas"""
+    try:
+        cache.incr(VERSAO_KEY)
+    except ValueError:
+        # Chave expirada ou ainda não criada
+        cache.set(VERSAO_KEY, int(time.time()), timeout=None)
+
+
+def chave_variacao(*partes):
+    """Resume parâmetros (querystring, página...) em um pedaço curto da chave"""
+    return hashlib.md5('|'.join(str(parte) for parte in partes).encode('utf-8')).hexdigest()
+
+
+def colecao_em_cache(nome, calcular, variacao=''):
+    """
+    Retorna os dados da coleção `nome`, calculando-os com `calcular()` só
+    quando a versão em cache estiver desatualizada.
+    """
+    ttl = getattr(settings, 'COLECOES_CACHE_TTL', 300)
+    base = f'produtos:colecoes:{nome}:{variacao}'
+    chave = f'{base}:v{versao_colecoes()}'
+    chave_ultimo = f'{base}:ultimo'
+    chave_trava = f'{base}:trava'
+
+    dados = cache.get(chave)
+    if dados is not None:
+        return dados
+
+    travado = cache.add(chave_trava, 1, timeout=TRAVA_TTL)
+    if not travado:
+        # Outro worker está recalculando: serve a última versão, se houver
+        ultimo = cache.get(chave_ultimo)
+        if ultimo is not None:
+            return ultimo
+
+        # Cache frio: espera um pouco pelo cálculo do outro worker
+        limite = time.monotonic() + ESPERA_MAXIMA
+        while time.monotonic() < limite:
+            time.sleep(0.05)
+            dados = cache.get(chave)
+            if dados is not None:
+                return dados
+
+    try:
+        dados = calcular()
+        cache.set(chave, dados, timeout=ttl)
+        # A cópia "ultimo" vive mais que a versionada para cobrir invalidações
+        cache.set(chave_ultimo, dados, timeout=ttl * 24)
+    finally:
+        if travado:
+            cache.delete(chave_trava)
+
+    return dados
@@ -0,0 +1,243 @@
+# produtos/campos.py
+"""
+Campos esparsos nas APIs: ?fields= e ?expand=.
+
+    ?fields=id,nome,preco_final   só esses campos no JSON
+    ?expand=itens                 inclui relações aninhadas opcionais
+
+Além de podar o JSON, a view traduz os campos pedidos em `.only()` (colunas
+do SELECT), `select_related` (FKs usadas) e `prefetch_related` (só das
+relações aninhadas que vão aparecer na resposta).
+"""
+import re
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+PARAM_CAMPOS = 'fields'
+PARAM_EXPANDIR = 'expand'
+
+MENSAGEM_INVALIDO = 'Campo(s) inválido(s): {}'
+
+DISPLAY = re.compile(r'^get_(\w+)_display$')
+
+
+def ler_lista(request, param):
+    """'a, b,,c' -> ['a', 'b', 'c']; None se o parâmetro não foi enviado"""
+    valor = request.query_params.get(param) if request is not None else None
+    if valor is None:
+        return None
+    return [nome.strip() for nome in valor.split(',') if nome.strip()]
+
+
+class CamposDinamicosMixin:
+    """
+    Serializer que mostra só os campos de `context['campos']` (todos, se None).
+    Os campos listados em `Meta.expansiveis` só aparecem quando estão em
+    `context['expandir']`.
+
+    `Meta.dependencias` informa as colunas de campos que não são colunas
+    (properties), para o `.only()` da view: {'disponivel_venda': ['ativo', ...]}.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if 'expandir' not in self.context:
+            # Sem a view de campos dinâmicos (ex.: serializer usado diretamente): tudo
+            return
+
+        campos = self.context.get('campos')
+        expandir = self.context['expandir']
+        expansiveis = getattr(self.Meta, 'expansiveis', [])
+        for nome in list(self.fields):
+            if (campos is not None and nome not in campos) or (nome in expansiveis and nome not in expandir):
+                self.fields.pop(nome)
+
+
+class CamposDinamicosViewMixin:
+    """
+    ViewSet com ?fields= / ?expand= nas ações de `acoes_campos_dinamicos`.
+    Repassa os campos ao serializer (CamposDinamicosMixin) e poda o queryset
+    em filter_queryset(), depois da ordenação. Em `retrieve`, as relações
+    expansíveis vêm por padrão.
+    """
+    acoes_campos_dinamicos = ('list', 'retrieve')
+    invalid_fields_message = MENSAGEM_INVALIDO
+
+    def usa_campos_dinamicos(self):
+        return (
+            self.action in self.acoes_campos_dinamicos
+            and issubclass(self.get_serializer_class(), CamposDinamicosMixin)
+        )
+
+    def campos_pedidos(self):
+        """(campos ou None, relações a expandir) validados contra o serializer da ação"""
+        if hasattr(self, '_campos_pedidos'):
+            return self._campos_pedidos
+
+        serializer_class = self.get_serializer_class()
+        self._campos_pedidos = validar_campos(
+            self.request,
+            disponiveis=serializer_class(context={}).fields,
+            expansiveis=getattr(serializer_class.Meta, 'expansiveis', []),
+            expandir_por_padrao=self.action == 'retrieve',
+            mensagem=self.invalid_fields_message
+        )
+        return self._campos_pedidos
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.usa_campos_dinamicos():
+            context['campos'], context['expandir'] = self.campos_pedidos()
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.usa_campos_dinamicos():
+            queryset = self.aplicar_campos(queryset)
+        return queryset
+
+    def aplicar_campos(self, queryset):
+        """Poda o queryset para os campos pedidos (use em actions que não passam por filter_queryset)"""
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+        # Campos de ordenação ficam carregados (a paginação por cursor lê os valores da última linha)
+        return podar_queryset(queryset, serializer, extras=colunas_ordenacao(queryset))
+
+
+def colunas_ordenacao(queryset):
+    """Colunas (ou anotações) da ordenação ativa do queryset, sem a direção"""
+    query = queryset.query
+    ordenacao = list(query.order_by) or (list(query.get_meta().ordering) if query.default_ordering else [])
+    nomes = [campo.lstrip('-') for campo in ordenacao if isinstance(campo, str)]
+    return [nome for nome in nomes if nome in query.annotations or _coluna_local(query.model, nome)]
+
+
+def validar_campos(request, disponiveis, expansiveis=(), expandir_por_padrao=False,
+                   mensagem=MENSAGEM_INVALIDO):
+    """Lê ?fields= / ?expand= e valida contra os campos do serializer"""
+    disponiveis, expansiveis = set(disponiveis), set(expansiveis)
+    campos = ler_lista(request, PARAM_CAMPOS)
+    expandir = ler_lista(request, PARAM_EXPANDIR)
+    if expandir is None:
+        expandir = expansiveis if expandir_por_padrao else set()
+
+    erros = {}
+    if campos is not None and set(campos) - disponiveis:
+        erros[PARAM_CAMPOS] = [mensagem.format(', '.join(sorted(set(campos) - disponiveis)))]
+    if set(expandir) - expansiveis:
+        erros[PARAM_EXPANDIR] = [mensagem.format(', '.join(sorted(set(expandir) - expansiveis)))]
+    if erros:
+        raise ValidationError(erros)
+
+    expandir = set(expandir)
+    if campos is not None:
+        # Relação pedida em ?fields= também é expandida
+        expandir |= set(campos) & expansiveis
+        campos = set(campos)
+    return campos, expandir
+
+
+def podar_queryset(queryset, serializer, extras=()):
+    """
+    Aplica only()/select_related()/prefetch_related() com base nos campos que
+    o serializer vai ler. Relações aninhadas (many=True) viram Prefetch com o
+    queryset também podado. Se algum campo não puder ser mapeado para colunas,
+    mantém as colunas e os joins da view (só acrescenta os necessários).
+    """
+    modelo = queryset.model
+    dependencias = getattr(getattr(serializer, 'Meta', None), 'dependencias', {})
+    colunas = {modelo._meta.pk.name, *(extra for extra in extras if _coluna_local(modelo, extra))}
+    relacionados = set()
+    prefetch = []
+    completo = False
+
+    for nome, campo in serializer.fields.items():
+        if nome in dependencias:
+            colunas.update(dependencias[nome])
+            continue
+        if campo.source == '*':
+            completo = True
+            continue
+
+        if isinstance(campo, serializers.ListSerializer):
+            # Relação aninhada reversa/M2M: prefetch com o queryset do filho também podado
+            relacao = modelo._meta.get_field(campo.source_attrs[0])
+            filho = relacao.related_model._default_manager.all()
+            volta = [relacao.field.name] if relacao.one_to_many else []
+            prefetch.append(Prefetch(campo.source, queryset=podar_queryset(filho, campo.child, extras=volta)))
+            continue
+        if isinstance(campo, serializers.BaseSerializer):
+            # FK aninhada: join com o relacionado inteiro
+            caminho = '__'.join(campo.source_attrs)
+            relacionados.add(caminho)
+            colunas.add(caminho)
+            continue
+
+        caminho = _colunas_do_campo(modelo, campo.source_attrs)
+        if caminho is None:
+            completo = True
+            continue
+        coluna, relacao = caminho
+        colunas.add(coluna)
+        if relacao:
+            relacionados.add(relacao)
+
+    if not completo:
+        # Joins/prefetches definidos na view e que a resposta não usa são removidos
+        queryset = queryset.select_related(None).prefetch_related(None)
+    if relacionados:
+        queryset = queryset.select_related(*relacionados)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if not completo:
+        # Cada FK do select_related precisa estar no only() junto com as colunas usadas
+        colunas.update(relacao.split('__')[0] for relacao in relacionados)
+        queryset = queryset.only(*colunas)
+    return queryset
+
+
+def _coluna_local(modelo, nome):
+    try:
+        return modelo._meta.get_field(nome).concrete
+    except FieldDoesNotExist:
+        return False
+
+
+def _colunas_do_campo(modelo, atributos):
+    """
+    Caminho de only() (e select_related) para `source_attrs`, ex.:
+    ['categoria', 'nome'] -> ('categoria__nome', 'categoria').
+    Atributo que não é coluna (property/método) no modelo relacionado carrega
+    o relacionado inteiro; no modelo raiz, retorna None (não dá para podar).
+    """
+    caminho = []
+    for indice, atributo in enumerate(atributos):
+        try:
+            campo = modelo._meta.get_field(atributo)
+        except FieldDoesNotExist:
+            display = DISPLAY.match(atributo)
+            if display:
+                atributo = display.group(1)
+            elif caminho:
+                return '__'.join(caminho), '__'.join(caminho)
+            else:
+                return None
+            try:
+                campo = modelo._meta.get_field(atributo)
+            except FieldDoesNotExist:
+                return None
+
+        reverso_multiplo = campo.is_relation and not (campo.many_to_one or campo.one_to_one)
+        if reverso_multiplo or not campo.concrete and not campo.is_relation:
+            return None
+
+        caminho.append(atributo)
+        if campo.is_relation and indice < len(atributos) - 1:
+            modelo = campo.related_model
+            continue
+        break
+
+    relacao = '__'.join(caminho[:-1])
+    return '__'.join(caminho), relacao
@@ -0,0 +1,61 @@
+# produtos/categorias.py
+"""
+Árvore de categorias da vitrine.
+
+A hierarquia fica em Categoria.pai, com o caminho materializado em
+Categoria.caminho ("6/12/31/"): a subárvore de uma categoria é um prefixo
+(índice varchar_pattern_ops), então "todos os produtos de Eletrônicos" é um
+único JOIN (ProdutoQuerySet.na_categoria).
+
+A árvore servida em /categorias/arvore/ é montada uma vez e guardada em cache
+já serializada (bytes JSON). Qualquer alteração em categorias ou produtos
+incrementa a versão das coleções (ver cache.py e signals.py) e a árvore é
+remontada na requisição seguinte.
+"""
+import orjson
+from django.core.files.storage import default_storage
+
+from .cache import colecao_em_cache
+from .models import Categoria
+
+
+def montar_arvore():
+    """
+    Categorias ativas aninhadas em `subcategorias`, na ordem de exibição.
+    Uma categoria inativa esconde a subárvore; `total_produtos` soma as subcategorias.
+    """
+    categorias = Categoria.objects.filter(ativo=True).values(
+        'id', 'nome', 'slug', 'imagem', 'pai_id', 'caminho', 'ordem', 'produtos_disponiveis'
+    )
+    # Pais antes dos filhos; entre irmãos, a ordem de exibição
+    categorias = sorted(categorias, key=lambda c: (c['caminho'].count('/'), c['ordem'], c['nome']))
+
+    nos, raizes = {}, []
+    for categoria in categorias:
+        no = {
+            'id': categoria['id'],
+            'nome': categoria['nome'],
+            'slug': categoria['slug'],
+            'imagem': default_storage.url(categoria['imagem']) if categoria['imagem'] else None,
+            'total_produtos': categoria['produtos_disponiveis'],
+            'subcategorias': [],
+        }
+        if categoria['pai_id'] is None:
+            raizes.append(no)
+        elif categoria['pai_id'] in nos:
+            nos[categoria['pai_id']]['subcategorias'].append(no)
+        else:
+            continue  # Pai inativo
+        nos[categoria['id']] = no
+
+    # Dos mais profundos para a raiz: cada nó soma os filhos já totalizados
+    for categoria in reversed(categorias):
+        no = nos.get(categoria['id'])
+        if no is not None:
+            no['total_produtos'] += sum(filho['total_produtos'] for filho in no['subcategorias'])
+    return raizes
+
+
+def arvore_json():
+    """Árvore em bytes JSON, da cache (remontada quando o catálogo muda)"""
+    return colecao_em_cache('arvore_categorias', lambda: orjson.dumps(montar_arvore()))
@@ -0,0 +1,327 @@
+# produtos/colunar.py
+"""
+Catálogo em memória (colunar) para a listagem de produtos.
+
+Os produtos ativos e disponíveis ficam em arrays NumPy, uma coluna por campo
+(id, categoria, preço final em centavos, estoque, flags, criado_em e vendas),
+em ordem de id. A listagem filtra, conta e ordena nesses arrays e busca no
+PostgreSQL só as linhas da página exibida (WHERE id IN (...)), sem COUNT(*)
+nem ORDER BY ... OFFSET sobre o catálogo inteiro.
+
+Cada processo mantém o seu snapshot e, a cada CATALOGO_COLUNAR_INTERVALO
+segundos, relê só as linhas alteradas: um trigger grava em `versao_catalogo`
+o id da transação que alterou essas colunas (migração 0012_catalogo_colunar)
+e a leitura seguinte pega as linhas com versão >= xmin do snapshot da leitura
+anterior, então nenhuma transação que ainda não tinha feito commit fica de
+fora (inclusive UPDATEs em massa). Produtos apagados aparecem como diferença
+entre a contagem do snapshot e Categoria.produtos_disponiveis (ver
+contadores.py), e os ids da categoria divergente são relidos.
+
+Consultas que o snapshot não responde (busca textual, ?nome=, ordenação por
+outros campos, paginação por cursor) seguem pelo ORM. CATALOGO_COLUNAR=True
+ativa; o comando verificar_catalogo_colunar compara snapshot, banco e ORM.
+"""
+import io
+import threading
+import time
+from decimal import ROUND_CEILING, ROUND_FLOOR
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from .filters import caminho_categoria
+from .models import Categoria, Produto
+
+# Colunas do snapshot e as expressões inteiras lidas do banco (COPY em texto, sem objetos por linha)
+COLUNAS = {
+    'id': ('id', np.int64),
+    'categoria': ('COALESCE(categoria_id, 0)', np.int64),
+    'preco_final': ('(preco_final * 100)::bigint', np.int64),
+    'estoque': ('estoque', np.int32),
+    'flags': ('em_promocao::int | (em_destaque::int << 1)', np.uint8),
+    'criado_em': ('(EXTRACT(EPOCH FROM criado_em) * 1000000)::bigint', np.int64),
+    'vendas': ('vendas', np.int32),
+}
+
+PROMOCAO = 1
+DESTAQUE = 2
+
+# Campos de ordenação da listagem respondidos pelo snapshot (desempate por id)
+ORDENACOES = ['criado_em', 'preco_final', 'vendas', 'id']
+
+# Limite dos valores de filtro (evita overflow na comparação com int64)
+LIMITE = 2 ** 62
+
+
+def ativo():
+    return getattr(settings, 'CATALOGO_COLUNAR', False)
+
+
+def _marca(cursor):
+    """xmin do snapshot atual: transações com id >= marca podem não estar visíveis ainda"""
+    cursor.execute('SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint')
+    return cursor.fetchone()[0]
+
+
+def _ler(cursor, onde, extras=()):
+    """Linhas de produtos_produto em ordem de id, como matriz int64 (uma coluna por expressão)"""
+    expressoes = [expressao for expressao, _ in COLUNAS.values()] + list(extras)
+    buffer = io.StringIO()
+    cursor.copy_expert(
+        f"COPY (SELECT {', '.join(expressoes)} FROM {Produto._meta.db_table} WHERE {onde} ORDER BY id) "
+        f"TO STDOUT WITH (DELIMITER ' ')",
+        buffer
+    )
+    texto = buffer.getvalue()
+    if not texto:
+        return np.empty((0, len(expressoes)), dtype=np.int64)
+    return np.fromstring(texto, dtype=np.int64, sep=' ').reshape(-1, len(expressoes))
+
+
+def _colunas(matriz):
+    return {nome: matriz[:, indice].astype(tipo) for indice, (nome, (_, tipo)) in enumerate(COLUNAS.items())}
+
+
+class Catalogo:
+    """Snapshot imutável do catálogo: colunas em ordem de id e a marca da leitura"""
+
+    def __init__(self, colunas, marca):
+        self.colunas = colunas
+        self.marca = marca
+        self.verificado_em = time.monotonic()
+        self._ordens = {}
+
+    def __len__(self):
+        return len(self.colunas['id'])
+
+    @property
+    def memoria(self):
+        """Bytes ocupados pelas colunas e ordenações já calculadas"""
+        return sum(array.nbytes for array in [*self.colunas.values(), *self._ordens.values()])
+
+    @classmethod
+    def carregar(cls):
+        """Leitura completa dos produtos ativos e disponíveis"""
+        with connection.cursor() as cursor:
+            marca = _marca(cursor)
+            return cls(_colunas(_ler(cursor, 'ativo AND disponivel')), marca)
+
+    def atualizado(self):
+        """Snapshot com as alterações desde a leitura anterior (o próprio, se nada mudou)"""
+        with connection.cursor() as cursor:
+            marca = _marca(cursor)
+            alteradas = _ler(cursor, f'versao_catalogo >= {int(self.marca)}', ['(ativo AND disponivel)::int'])
+            if len(alteradas) > len(self) // 2:
+                return Catalogo.carregar()
+
+            catalogo = self._aplicar(alteradas, marca) if len(alteradas) else self
+            catalogo = catalogo._conferir_categorias(cursor, marca)
+
+        catalogo.marca = marca
+        catalogo.verificado_em = time.monotonic()
+        return catalogo
+
+    def _aplicar(self, alteradas, marca):
+        """Remove as linhas alteradas e insere as que continuam no catálogo, mantendo a ordem de id"""
+        ids = self.colunas['id']
+        posicoes = np.searchsorted(ids, alteradas[:, 0])
+        existentes = posicoes < len(ids)
+        existentes[existentes] = ids[posicoes[existentes]] == alteradas[existentes, 0]
+        manter = np.ones(len(ids), dtype=bool)
+        manter[posicoes[existentes]] = False
+
+        novas = _colunas(alteradas[alteradas[:, -1] == 1, :-1])
+        restantes = {nome: coluna[manter] for nome, coluna in self.colunas.items()}
+        destino = np.searchsorted(restantes['id'], novas['id'])
+        colunas = {nome: np.insert(coluna, destino, novas[nome]) for nome, coluna in restantes.items()}
+
+        catalogo = Catalogo(colunas, marca)
+        # Mesmos produtos: as ordenações cuja coluna não mudou continuam valendo
+        if np.array_equal(colunas['id'], ids):
+            catalogo._ordens = {
+                campo: ordem for campo, ordem in self._ordens.items()
+                if np.array_equal(colunas[campo], self.colunas[campo])
+            }
+        return catalogo
+
+    def _conferir_categorias(self, cursor, marca):
+        """Relê os ids das categorias com mais produtos no snapshot que no contador (produtos apagados)"""
+        cursor.execute(
+            f"""
+            SELECT id, produtos_disponiveis FROM {Categoria._meta.db_table}
+            UNION ALL
+            SELECT 0, COUNT(*) FROM {Produto._meta.db_table} WHERE categoria_id IS NULL AND ativo AND disponivel
+            """
+        )
+        contadores = dict(cursor.fetchall())
+        no_snapshot = np.bincount(self.colunas['categoria'])
+        sobrando = [
+            int(categoria_id) for categoria_id in np.flatnonzero(no_snapshot)
+            if no_snapshot[categoria_id] > contadores.get(int(categoria_id), 0)
+        ]
+        if not sobrando:
+            return self
+
+        cursor.execute(
+            f'SELECT id FROM {Produto._meta.db_table} WHERE ativo AND disponivel '
+            f'AND (categoria_id = ANY(%s) OR (categoria_id IS NULL AND %s)) ORDER BY id',
+            [sobrando, 0 in sobrando]
+        )
+        existentes = np.array([produto_id for (produto_id,) in cursor.fetchall()], dtype=np.int64)
+        ids = self.colunas['id']
+        conferir = np.isin(self.colunas['categoria'], sobrando)
+        manter = ~conferir
+        manter[conferir] = np.isin(ids[conferir], existentes, assume_unique=True)
+        if manter.all():
+            return self
+        return Catalogo({nome: coluna[manter] for nome, coluna in self.colunas.items()}, marca)
+
+    def _ordem(self, campo):
+        """Posições em ordem de (campo, id), calculadas na primeira consulta"""
+        ordem = self._ordens.get(campo)
+        if ordem is None:
+            if campo == 'id':
+                ordem = np.arange(len(self), dtype=np.int32)
+            else:
+                # Ordenação estável sobre as colunas em ordem de id: empates ficam por id
+                ordem = np.argsort(self.colunas[campo], kind='stable').astype(np.int32)
+            self._ordens[campo] = ordem
+        return ordem
+
+    def _mascara(self, categorias=None, preco_min=None, preco_max=None,
+                 em_promocao=None, em_destaque=None, em_estoque=None, vazio=False):
+        colunas = self.colunas
+        mascara = np.full(len(self), not vazio)
+        if categorias is not None:
+            # Tabela indexada pelo id da categoria: um acesso por produto
+            tabela = np.zeros(int(colunas['categoria'].max(initial=0)) + 1, dtype=bool)
+            tabela[[categoria for categoria in categorias if categoria < len(tabela)]] = True
+            mascara &= tabela[colunas['categoria']]
+        if preco_min is not None:
+            mascara &= colunas['preco_final'] >= preco_min
+        if preco_max is not None:
+            mascara &= colunas['preco_final'] <= preco_max
+        if em_promocao:
+            mascara &= (colunas['flags'] & PROMOCAO) != 0
+        if em_destaque is not None:
+            mascara &= ((colunas['flags'] & DESTAQUE) != 0) == em_destaque
+        if em_estoque is not None:
+            mascara &= (colunas['estoque'] > 0) == em_estoque
+        return mascara
+
+    def consultar(self, filtros, campo, decrescente=False):
+        """Posições dos produtos que passam nos filtros, em ordem de (campo, id)"""
+        ordem = self._ordem(campo)
+        if filtros:
+            ordem = ordem[self._mascara(**filtros)[ordem]]
+        return ordem[::-1] if decrescente else ordem
+
+    def listar(self, filtros, campo, decrescente, buscar):
+        return ListaColunar(self, self.consultar(filtros, campo, decrescente), buscar)
+
+
+class ListaColunar:
+    """
+    Resultado da listagem para o paginator: count() vem do snapshot e o
+    fatiamento busca no banco só os ids da fatia (`buscar(ids)`), na ordem do snapshot.
+    """
+
+    def __init__(self, catalogo, posicoes, buscar):
+        self.catalogo = catalogo
+        self.posicoes = posicoes
+        self.buscar = buscar
+
+    def count(self):
+        return len(self.posicoes)
+
+    def __len__(self):
+        return len(self.posicoes)
+
+    def __getitem__(self, fatia):
+        ids = self.catalogo.colunas['id'][self.posicoes[fatia]].tolist()
+        posicao = {produto_id: indice for indice, produto_id in enumerate(ids)}
+        # Produto desativado ou apagado depois da última atualização do snapshot some da página
+        return sorted(self.buscar(ids), key=lambda linha: posicao[linha['id'] if isinstance(linha, dict) else linha.pk])
+
+
+def _centavos(valor, arredondamento):
+    centavos = int((valor * 100).to_integral_value(rounding=arredondamento))
+    return max(-LIMITE, min(LIMITE, centavos))
+
+
+def consulta(dados, ordenacao):
+    """
+    (filtros, campo, decrescente) do snapshot a partir do cleaned_data do
+    ProdutoFilter e da ordenação do OrdenacaoFilter; None se não for suportada.
+    """
+    if dados.get('nome') or len(ordenacao or []) != 1 or ordenacao[0].lstrip('-') not in ORDENACOES:
+        return None
+
+    filtros = {}
+    # Categoria e subcategorias; com ?categoria= e ?categoria_slug=, as que estão nas duas subárvores
+    for nome, campo in [('categoria', 'id'), ('categoria_slug', 'slug')]:
+        if dados.get(nome) is None or dados.get(nome) == '':
+            continue
+        caminho = caminho_categoria(**{campo: dados[nome]})
+        ids = set() if caminho is None else set(Categoria.objects.filter(caminho__startswith=caminho).values_list('id', flat=True))
+        filtros['categorias'] = filtros.get('categorias', ids) & ids
+    if dados.get('preco_min') is not None:
+        filtros['preco_min'] = _centavos(dados['preco_min'], ROUND_CEILING)
+    if dados.get('preco_max') is not None:
+        filtros['preco_max'] = _centavos(dados['preco_max'], ROUND_FLOOR)
+    if dados.get('em_promocao'):
+        filtros['em_promocao'] = True
+    if dados.get('em_destaque') is not None:
+        filtros['em_destaque'] = dados['em_destaque']
+    if dados.get('disponivel') is False:
+        # A listagem só tem produtos disponíveis
+        filtros['vazio'] = True
+    if dados.get('em_estoque') is not None:
+        filtros['em_estoque'] = dados['em_estoque']
+
+    campo = ordenacao[0]
+    return filtros, campo.lstrip('-'), campo.startswith('-')
+
+
+_atual = None
+_trava = threading.Lock()
+
+
+def catalogo():
+    """Snapshot do processo: carregado no primeiro uso e atualizado a cada CATALOGO_COLUNAR_INTERVALO segundos"""
+    global _atual
+    atual = _atual
+    intervalo = getattr(settings, 'CATALOGO_COLUNAR_INTERVALO', 5)
+    if atual is not None and time.monotonic() - atual.verificado_em < intervalo:
+        return atual
+
+    # Só um thread atualiza; os demais seguem com o snapshot anterior
+    if not _trava.acquire(blocking=atual is None):
+        return atual
+    try:
+        if _atual is atual:
+            _atual = Catalogo.carregar() if atual is None else atual.atualizado()
+        return _atual
+    finally:
+        _trava.release()
+
+
+def descartar():
+    """Esquece o snapshot do processo (o próximo uso faz a leitura completa)"""
+    global _atual
+    with _trava:
+        _atual = None
+
+
+def divergencias(catalogo):
+    """Compara o snapshot com uma leitura completa: (ids faltando, ids sobrando, ids com colunas diferentes)"""
+    real = Catalogo.carregar()
+    ids, ids_reais = catalogo.colunas['id'], real.colunas['id']
+    faltando = np.setdiff1d(ids_reais, ids, assume_unique=True)
+    sobrando = np.setdiff1d(ids, ids_reais, assume_unique=True)
+    comuns, posicoes, posicoes_reais = np.intersect1d(ids, ids_reais, assume_unique=True, return_indices=True)
+    diferentes = np.zeros(len(comuns), dtype=bool)
+    for nome, coluna in catalogo.colunas.items():
+        diferentes |= coluna[posicoes] != real.colunas[nome][posicoes_reais]
+    return faltando.tolist(), sobrando.tolist(), comuns[diferentes].tolist()
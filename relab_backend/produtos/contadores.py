@@ -0,0 +1,70 @@
+# produtos/contadores.py
+"""
+Contadores de produtos por categoria (Categoria.produtos_ativos,
+produtos_disponiveis e produtos_em_estoque).
+
+São mantidos no banco por triggers de statement em produtos_produto (migração
+0011_contadores_categoria): cada INSERT, UPDATE ou DELETE soma a diferença
+das linhas afetadas na mesma transação, inclusive nas escritas em massa
+(queryset.update(), importação, baixa de estoque e preços programados). Assim
+as listagens de categorias leem os números direto da linha, sem COUNT.
+
+O comando verificar_contadores compara os contadores com uma contagem
+completa e, com --corrigir, regrava os que divergirem.
+"""
+from django.db import connection, transaction
+
+from .models import Categoria, Produto
+
+CONTAGEM = """
+    SELECT c.id,
+           COUNT(p.id) FILTER (WHERE p.ativo) AS ativos,
+           COUNT(p.id) FILTER (WHERE p.ativo AND p.disponivel) AS disponiveis,
+           COUNT(p.id) FILTER (WHERE p.ativo AND p.disponivel AND p.estoque > 0) AS em_estoque
+    FROM {categorias} c
+    LEFT JOIN {produtos} p ON p.categoria_id = c.id
+    GROUP BY c.id
+"""
+
+
+def _contagem():
+    return CONTAGEM.format(categorias=Categoria._meta.db_table, produtos=Produto._meta.db_table)
+
+
+def divergencias():
+    """[(categoria_id, nome, (contadores gravados), (contagem real))] das categorias com diferença"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT c.id, c.nome,
+                   c.produtos_ativos, c.produtos_disponiveis, c.produtos_em_estoque,
+                   r.ativos, r.disponiveis, r.em_estoque
+            FROM {Categoria._meta.db_table} c
+            JOIN ({_contagem()}) AS r ON r.id = c.id
+            WHERE (c.produtos_ativos, c.produtos_disponiveis, c.produtos_em_estoque)
+                  IS DISTINCT FROM (r.ativos, r.disponiveis, r.em_estoque)
+            ORDER BY c.id
+            """
+        )
+        return [(linha[0], linha[1], linha[2:5], linha[5:8]) for linha in cursor.fetchall()]
+
+
+def corrigir():
+    """Regrava os contadores divergentes; retorna os ids das categorias corrigidas"""
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Bloqueia escritas em produtos durante a contagem (leituras continuam)
+        cursor.execute(f'LOCK TABLE {Produto._meta.db_table} IN SHARE MODE')
+        cursor.execute(
+            f"""
+            UPDATE {Categoria._meta.db_table} c SET
+                produtos_ativos = r.ativos,
+                produtos_disponiveis = r.disponiveis,
+                produtos_em_estoque = r.em_estoque
+            FROM ({_contagem()}) AS r
+            WHERE r.id = c.id
+              AND (c.produtos_ativos, c.produtos_disponiveis, c.produtos_em_estoque)
+                  IS DISTINCT FROM (r.ativos, r.disponiveis, r.em_estoque)
+            RETURNING c.id
+            """
+        )
+        return [categoria_id for (categoria_id,) in cursor.fetchall()]
@@ -0,0 +1,75 @@
+# produtos/facetas.py
+"""
+Contagens da barra de filtros da vitrine (facetas) em uma única query.
+
+O queryset já filtrado (ProdutoFilter + busca) vira uma subquery, e um
+`GROUP BY GROUPING SETS` devolve de uma vez as contagens por categoria, por
+faixa de preço e os totais gerais (`COUNT(*) FILTER (...)`).
+"""
+from decimal import Decimal
+
+from django.db import connections
+
+from .models import Categoria
+
+
+def contar_facetas(queryset, faixas):
+    """
+    Retorna as facetas do queryset. `faixas` são os limites (crescentes) das
+    faixas de preço: [50, 100] gera as faixas <50, 50-100 e >=100.
+    """
+    limites = sorted(Decimal(limite) for limite in faixas)
+
+    subquery = queryset.order_by().values('categoria_id', 'preco_final', 'em_promocao', 'em_destaque', 'estoque')
+    sub_sql, sub_params = subquery.query.get_compiler(using=queryset.db).as_sql()
+
+    connection = connections[queryset.db]
+    categorias = connection.ops.quote_name(Categoria._meta.db_table)
+
+    sql = (
+        f'SELECT GROUPING(c.id, faixa), c.id, c.nome, c.slug, faixa, COUNT(*), '
+        f'COUNT(*) FILTER (WHERE p.em_promocao), '
+        f'COUNT(*) FILTER (WHERE p.em_destaque), '
+        f'COUNT(*) FILTER (WHERE p.estoque > 0) '
+        f'FROM ('
+        f'SELECT s.*, width_bucket(s.preco_final, %s::numeric[]) AS faixa FROM ({sub_sql}) AS s'
+        f') AS p '
+        f'LEFT JOIN {categorias} AS c ON c.id = p.categoria_id '
+        f'GROUP BY GROUPING SETS ((c.id, c.nome, c.slug), (faixa), ())'
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [limites, *sub_params])
+        linhas = cursor.fetchall()
+
+    facetas = {
+        'total': 0,
+        'em_promocao': 0,
+        'em_destaque': 0,
+        'em_estoque': 0,
+        'categorias': [],
+        'faixas_preco': [],
+    }
+    por_faixa = {}
+
+    for grupo, categoria_id, nome, slug, faixa, total, promocao, destaque, estoque in linhas:
+        # GROUPING(c.id, faixa): 1 = agrupado por categoria, 2 = por faixa, 3 = total geral
+        if grupo == 3:
+            facetas.update(total=total, em_promocao=promocao, em_destaque=destaque, em_estoque=estoque)
+        elif grupo == 2:
+            por_faixa[faixa] = total
+        elif categoria_id is not None:
+            facetas['categorias'].append({'id': categoria_id, 'nome': nome, 'slug': slug, 'total': total})
+
+    facetas['categorias'].sort(key=lambda categoria: (-categoria['total'], categoria['nome']))
+
+    # width_bucket: 0 = abaixo do primeiro limite, len(limites) = acima do último
+    bordas = [None, *limites, None]
+    for indice in range(len(limites) + 1):
+        facetas['faixas_preco'].append({
+            'min': bordas[indice],
+            'max': bordas[indice + 1],
+            'total': por_faixa.get(indice, 0),
+        })
+
+    return facetas
@@ -0,0 +1,213 @@
+# produtos/feed.py
+"""
+Exportação do catálogo para crawlers e parceiros: sitemap XML e feed de
+produtos (CSV, XML no formato do Google Shopping ou JSONL).
+
+Tudo é gerado em streaming: os produtos vêm de um cursor no servidor
+(`.iterator(chunk_size=...)`) e cada linha vira texto assim que é lida,
+agrupada em blocos e comprimida com gzip quando pedido, então a memória não
+depende do tamanho do catálogo.
+
+O catálogo é dividido em shards por faixa de id (FEED_PRODUTOS_POR_SHARD,
+no máximo 50 mil URLs por sitemap). O comando gerar_feeds grava um arquivo
+por shard e só regrava os shards cuja assinatura (Assinatura) mudou desde a
+última geração. Renomear uma categoria não toca nos produtos, por isso a
+assinatura também leva o maior atualizado_em das categorias deles (e quantos
+têm categoria, que muda quando uma é apagada).
+"""
+import csv
+import io
+import re
+import zlib
+from collections import namedtuple
+from urllib.parse import urljoin
+from xml.sax.saxutils import escape
+
+import orjson
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .models import Categoria, Produto
+
+COLUNAS = [
+    'id', 'sku', 'nome', 'slug', 'descricao_curta', 'preco', 'preco_promocional',
+    'em_promocao', 'estoque', 'imagem', 'categoria__nome', 'atualizado_em',
+]
+
+CAMPOS_FEED = [
+    'id', 'title', 'description', 'link', 'image_link', 'availability',
+    'price', 'sale_price', 'product_type',
+]
+
+# Caracteres que não podem aparecer em XML 1.0
+_INVALIDOS_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+MOEDA = 'BRL'
+
+Formato = namedtuple('Formato', 'content_type extensao cabecalho linha rodape')
+
+Assinatura = namedtuple('Assinatura', 'quantidade soma ultimo categorizados categorias')
+
+
+def produtos_por_shard():
+    return getattr(settings, 'FEED_PRODUTOS_POR_SHARD', 20000)
+
+
+def url_produto(slug):
+    return settings.FEED_URL_PRODUTO.format(slug=slug)
+
+
+def produtos(shard=None, chunk_size=2000):
+    """Produtos exportados (ativos e disponíveis) em ordem de id, lidos por cursor no servidor"""
+    queryset = Produto.objects.filter(ativo=True, disponivel=True)
+    if shard is not None:
+        tamanho = produtos_por_shard()
+        queryset = queryset.filter(id__gte=shard * tamanho, id__lt=(shard + 1) * tamanho)
+    return queryset.order_by('id').values(*COLUNAS).iterator(chunk_size=chunk_size)
+
+
+def shards():
+    """
+    {shard: Assinatura} dos produtos exportados: quantidade, soma dos ids,
+    maior atualizado_em, quantos têm categoria e maior atualizado_em delas
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT p.id / %s, COUNT(*), SUM(p.id), MAX(p.atualizado_em), COUNT(c.id), MAX(c.atualizado_em)
+            FROM {Produto._meta.db_table} p
+            LEFT JOIN {Categoria._meta.db_table} c ON c.id = p.categoria_id
+            WHERE p.ativo AND p.disponivel
+            GROUP BY 1 ORDER BY 1
+            """,
+            [produtos_por_shard()]
+        )
+        return {
+            shard: Assinatura(quantidade, int(soma), ultimo, categorizados, categorias)
+            for shard, quantidade, soma, ultimo, categorizados, categorias in cursor.fetchall()
+        }
+
+
+def item(produto, url_base):
+    """Campos do feed (nomes do Google Merchant Center) de uma linha de produtos()"""
+    imagem = produto['imagem']
+    return {
+        'id': produto['sku'] or str(produto['id']),
+        'title': produto['nome'],
+        'description': produto['descricao_curta'] or produto['nome'],
+        'link': url_produto(produto['slug']),
+        'image_link': urljoin(url_base, default_storage.url(imagem)) if imagem else '',
+        'availability': 'in_stock' if produto['estoque'] > 0 else 'out_of_stock',
+        'price': f"{produto['preco']} {MOEDA}",
+        'sale_price': f"{produto['preco_promocional']} {MOEDA}" if produto['em_promocao'] else '',
+        'product_type': produto['categoria__nome'] or '',
+    }
+
+
+def xml(valor):
+    return escape(_INVALIDOS_XML.sub('', valor))
+
+
+def _linha_sitemap(produto, url_base):
+    return (
+        f"<url><loc>{xml(url_produto(produto['slug']))}</loc>"
+        f"<lastmod>{produto['atualizado_em'].date().isoformat()}</lastmod></url>\n"
+    )
+
+
+def _linha_csv(produto, url_base):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(item(produto, url_base).values())
+    return buffer.getvalue()
+
+
+def _linha_xml(produto, url_base):
+    campos = ''.join(
+        f'<g:{campo}>{xml(valor)}</g:{campo}>'
+        for campo, valor in item(produto, url_base).items() if valor
+    )
+    return f'<item>{campos}</item>\n'
+
+
+def _linha_jsonl(produto, url_base):
+    return orjson.dumps(item(produto, url_base)).decode('utf-8') + '\n'
+
+
+FORMATOS = {
+    'sitemap': Formato(
+        'application/xml', 'xml',
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n',
+        _linha_sitemap,
+        '</urlset>\n'
+    ),
+    'csv': Formato('text/csv', 'csv', ','.join(CAMPOS_FEED) + '\r\n', _linha_csv, ''),
+    'xml': Formato(
+        'application/xml', 'xml',
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0"><channel>\n',
+        _linha_xml,
+        '</channel></rss>\n'
+    ),
+    'jsonl': Formato('application/x-ndjson', 'jsonl', '', _linha_jsonl, ''),
+}
+
+
+def gerar(formato, linhas, url_base, cabecalho=True):
+    """Texto do formato em pedaços: cabeçalho, uma linha por produto e rodapé"""
+    formato = FORMATOS[formato]
+    if cabecalho:
+        yield formato.cabecalho
+    for produto in linhas:
+        yield formato.linha(produto, url_base)
+    if cabecalho:
+        yield formato.rodape
+
+
+def indice_sitemap(assinaturas, url_shard):
+    """Sitemap index com um <sitemap> por shard (lastmod = produto mais recente do shard)"""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for shard, assinatura in sorted(assinaturas.items()):
+        yield f'<sitemap><loc>{xml(url_shard(shard))}</loc><lastmod>{assinatura.ultimo.isoformat()}</lastmod></sitemap>\n'
+    yield '</sitemapindex>\n'
+
+
+def em_bytes(pedacos, comprimir=False, tamanho=64 * 1024):
+    """Agrupa os pedaços de texto em blocos de ~64 KB, comprimidos com gzip se `comprimir`"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None
+    bloco, total = [], 0
+    for pedaco in pedacos:
+        bloco.append(pedaco)
+        total += len(pedaco)
+        if total < tamanho:
+            continue
+        dados = ''.join(bloco).encode('utf-8')
+        bloco, total = [], 0
+        dados = compressor.compress(dados) if compressor else dados
+        if dados:
+            yield dados
+
+    dados = ''.join(bloco).encode('utf-8')
+    if compressor:
+        dados = compressor.compress(dados) + compressor.flush()
+    if dados:
+        yield dados
+
+
+def aceita_gzip(request):
+    return 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+
+def resposta(request, pedacos, content_type, nome=None):
+    """StreamingHttpResponse dos pedaços de texto, com gzip se o cliente aceitar"""
+    comprimir = aceita_gzip(request)
+    response = StreamingHttpResponse(em_bytes(pedacos, comprimir), content_type=f'{content_type}; charset=utf-8')
+    if comprimir:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    if nome:
+        response['Content-Disposition'] = f'inline; filename="{nome}"'
+    return response
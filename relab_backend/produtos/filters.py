@@ -1,14 +1,15 @@
 import django_filters
-from django.db import models
-from .models import Produto
+from rest_framework import filters
+from .models import Categoria, Produto
 
 
 class ProdutoFilter(django_filters.FilterSet):
     nome = django_filters.CharFilter(lookup_expr='icontains')
-    categoria = django_filters.NumberFilter(field_name='categoria__id')
-    categoria_slug = django_filters.CharFilter(field_name='categoria__slug')
-    preco_min = django_filters.NumberFilter(field_name='preco', lookup_expr='gte')
-    preco_max = django_filters.NumberFilter(field_name='preco', lookup_expr='lte')
+    # A categoria e as subcategorias (ver Categoria.caminho)
+    categoria = django_filters.NumberFilter(method='filter_categoria')
+    categoria_slug = django_filters.CharFilter(method='filter_categoria')
+    preco_min = django_filters.NumberFilter(field_name='preco_final', lookup_expr='gte')
+    preco_max = django_filters.NumberFilter(field_name='preco_final', lookup_expr='lte')
     em_promocao = django_filters.BooleanFilter(method='filter_em_promocao')
     em_destaque = django_filters.BooleanFilter()
     disponivel = django_filters.BooleanFilter()
@@ -18,15 +19,65 @@ class ProdutoFilter(django_filters.FilterSet):
         model = Produto
         fields = ['categoria', 'categoria_slug', 'em_destaque', 'disponivel']
 
+    def filter_categoria(self, queryset, name, value):
+        caminho = caminho_categoria(**{'id' if name == 'categoria' else 'slug': value})
+        if caminho is None:
+            return queryset.none()
+        return queryset.na_categoria(caminho)
+
     def filter_em_promocao(self, queryset, name, value):
         if value:
-            return queryset.filter(
-                preco_promocional__isnull=False,
-                preco_promocional__lt=models.F('preco')
-            )
+            return queryset.filter(em_promocao=True)
         return queryset
 
     def filter_em_estoque(self, queryset, name, value):
         if value:
             return queryset.filter(estoque__gt=0)
-        return queryset.filter(estoque=0)
\ No newline at end of file
+        return queryset.filter(estoque=0)
+
+
+def caminho_categoria(**filtro):
+    """Caminho materializado da categoria (None se não existir)"""
+    return Categoria.objects.filter(**filtro).values_list('caminho', flat=True).first()
+
+
+class OrdenacaoFilter(filters.OrderingFilter):
+    """
+    OrderingFilter que aceita apelidos definidos na view (`ordering_aliases`),
+    ex.: ?ordering=preco ordena pelo preço efetivamente cobrado (preco_final)
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        return aplicar_apelidos(ordering, getattr(view, 'ordering_aliases', {}))
+
+
+def aplicar_apelidos(campos, apelidos):
+    """Troca cada campo de ordenação pelo seu apelido, mantendo a direção"""
+    if not campos:
+        return campos
+    return [
+        ('-' if campo.startswith('-') else '') + apelidos.get(campo.lstrip('-'), campo.lstrip('-'))
+        for campo in campos
+    ]
+
+
+class BuscaTextualFilter(filters.SearchFilter):
+    """
+    Substitui o SearchFilter (icontains em vários campos) pela busca textual
+    do PostgreSQL sobre `Produto.busca`.
+    Sem ?ordering= explícito, ordena por relevância.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        termo = request.query_params.get(self.search_param, '').strip()
+        if not termo:
+            return queryset
+
+        queryset = queryset.buscar(termo)
+
+        ordering_param = filters.OrderingFilter.ordering_param
+        if not request.query_params.get(ordering_param):
+            queryset = queryset.order_by('-relevancia', '-criado_em')
+
+        return queryset
@@ -0,0 +1,157 @@
+# produtos/imagens.py
+"""
+Derivados responsivos das imagens de produto (miniaturas WebP e JPEG).
+
+Cada imagem enviada gera versões reduzidas nas larguras de IMAGENS_LARGURAS.
+Os arquivos ficam em `derivados/<hash>/` e o hash cobre o conteúdo do
+original e os parâmetros de geração, então o nome muda sempre que o resultado
+muda (cache-busting) e imagens iguais compartilham os mesmos arquivos.
+
+A geração roda fora da requisição: após o commit do upload (ver signals.py)
+em um pool de threads do processo, ou em massa pelo comando
+`gerar_derivados_imagens`. O resultado fica em `imagem_derivados` (JSON)
+no próprio registro.
+"""
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+FORMATOS = {
+    # formato: (extensão, opções do Image.save)
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+
+
+def larguras():
+    return sorted(getattr(settings, 'IMAGENS_LARGURAS', [160, 320, 640, 1024]))
+
+
+def gerar_derivados(nome):
+    """
+    Gera os derivados do arquivo `nome` (no storage padrão) e retorna o dict
+    gravado em `imagem_derivados`. Não acessa o banco (roda em processos do
+    backfill).
+    """
+    from PIL import Image, ImageOps
+
+    with default_storage.open(nome, 'rb') as arquivo:
+        conteudo = arquivo.read()
+
+    parametros = repr((larguras(), sorted(FORMATOS.items()))).encode('utf-8')
+    assinatura = hashlib.sha256(conteudo + parametros).hexdigest()[:20]
+
+    with Image.open(io.BytesIO(conteudo)) as original:
+        imagem = ImageOps.exif_transpose(original)
+        imagem.load()
+
+    tem_alpha = imagem.mode in ('RGBA', 'LA') or (imagem.mode == 'P' and 'transparency' in imagem.info)
+    imagem = imagem.convert('RGBA' if tem_alpha else 'RGB')
+
+    # Não amplia: larguras maiores que o original são descartadas
+    alvo = [largura for largura in larguras() if largura < imagem.width] or [imagem.width]
+
+    derivados = {'origem': nome, 'hash': assinatura, 'formatos': {formato: {} for formato in FORMATOS}}
+    for largura in alvo:
+        altura = max(1, round(imagem.height * largura / imagem.width))
+        reduzida = imagem.resize((largura, altura), Image.Resampling.LANCZOS)
+
+        for formato, (extensao, opcoes) in FORMATOS.items():
+            caminho = f'derivados/{assinatura[:2]}/{assinatura}/{largura}w.{extensao}'
+            if not default_storage.exists(caminho):
+                saida = reduzida
+                if formato == 'jpeg' and tem_alpha:
+                    # JPEG não tem transparência: compõe sobre fundo branco
+                    saida = Image.new('RGB', reduzida.size, (255, 255, 255))
+                    saida.paste(reduzida, mask=reduzida.getchannel('A'))
+                buffer = io.BytesIO()
+                saida.save(buffer, format=formato.upper(), **opcoes)
+                default_storage.save(caminho, ContentFile(buffer.getvalue()))
+            derivados['formatos'][formato][str(largura)] = caminho
+
+    return derivados
+
+
+def iniciar_processo():
+    """Initializer dos processos do backfill (criados com spawn, sem herdar conexões do pai)"""
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    django.setup()
+
+
+def gerar_derivados_processo(nome):
+    """Versão de gerar_derivados para o pool de processos: devolve o erro em vez de levantar"""
+    try:
+        return nome, gerar_derivados(nome), None
+    except Exception as erro:
+        return nome, None, f'{type(erro).__name__}: {erro}'
+
+
+def atualizar_derivados(modelo, pk):
+    """Gera e grava os derivados do registro, se a imagem ainda for a mesma"""
+    from .cache import invalidar_colecoes
+
+    nome = modelo.objects.filter(pk=pk).values_list('imagem', flat=True).first()
+    if not nome:
+        return
+
+    derivados = gerar_derivados(nome)
+    # Só grava se a imagem ainda for a mesma: não sobrescreve um upload mais novo
+    if modelo.objects.filter(pk=pk, imagem=nome).update(imagem_derivados=derivados):
+        invalidar_colecoes()
+
+
+def agendar_derivados(modelo, pk):
+    """Agenda a geração fora da requisição (ou gera na hora, se assíncrono estiver desligado)"""
+    global _executor
+
+    if not getattr(settings, 'IMAGENS_DERIVADOS_ASSINCRONO', True):
+        atualizar_derivados(modelo, pk)
+        return
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='derivados-imagens')
+    _executor.submit(_tarefa, modelo, pk)
+
+
+def _tarefa(modelo, pk):
+    try:
+        atualizar_derivados(modelo, pk)
+    except Exception:
+        logger.exception('Falha ao gerar derivados de %s %s', modelo.__name__, pk)
+    finally:
+        connection.close()
+
+
+def srcset(derivados, formato, url=None):
+    """Monta o atributo srcset (`url 160w, url 320w...`) de um formato"""
+    url = url or default_storage.url
+    caminhos = (derivados or {}).get('formatos', {}).get(formato, {})
+    return ', '.join(
+        f'{url(caminho)} {largura}w'
+        for largura, caminho in sorted(caminhos.items(), key=lambda item: int(item[0]))
+    )
+
+
+def url_derivado(derivados, largura_minima, formato='webp'):
+    """URL do menor derivado com pelo menos `largura_minima` px (ou do maior disponível)"""
+    caminhos = (derivados or {}).get('formatos', {}).get(formato, {})
+    if not caminhos:
+        return None
+    ordenados = sorted(caminhos.items(), key=lambda item: int(item[0]))
+    for largura, caminho in ordenados:
+        if int(largura) >= largura_minima:
+            return default_storage.url(caminho)
+    return default_storage.url(ordenados[-1][1])
@@ -0,0 +1,31 @@
+# produtos/management/commands/aplicar_precos.py
+
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from produtos.cache import invalidar_colecoes
+from produtos.precos import aplicar, encerrar_campanha
+
+
+class Command(BaseCommand):
+    help = 'Aplica os preços programados que começaram ou terminaram desde a última execução (rodar a cada minuto)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--encerrar', metavar='CAMPANHA', help='Encerra agora a campanha e volta os preços')
+        parser.add_argument('--sobreposicao', type=int, default=5, help='Minutos revistos a cada execução')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        if options['encerrar']:
+            linhas, alterados = encerrar_campanha(options['encerrar'])
+            self.stdout.write(self.style.WARNING(f'🗑️  Campanha "{options["encerrar"]}" encerrada ({linhas} preço(s))'))
+        else:
+            alterados = aplicar(sobreposicao=timedelta(minutes=options['sobreposicao']))
+
+        if alterados:
+            invalidar_colecoes()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Preço de {len(alterados)} produto(s) alterado(s) em {time.perf_counter() - inicio:.2f}s'
+        ))
@@ -0,0 +1,29 @@
+# produtos/management/commands/atualizar_tendencia.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from produtos.cache import invalidar_colecoes
+from produtos.tendencia import atualizar, backfill, meia_vida_horas
+
+
+class Command(BaseCommand):
+    help = 'Atualiza a tendência dos produtos (decaimento + visualizações e vendas desde a última execução)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backfill',
+            action='store_true',
+            help='Recalcula do zero a partir do histórico de itens de pedido'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        alterados = backfill() if options['backfill'] else atualizar()
+        if alterados:
+            invalidar_colecoes()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Tendência de {alterados} produto(s) atualizada em {time.perf_counter() - inicio:.2f}s '
+            f'(meia-vida: {meia_vida_horas():g}h)'
+        ))
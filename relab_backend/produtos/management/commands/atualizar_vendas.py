@@ -0,0 +1,33 @@
+# produtos/management/commands/atualizar_vendas.py
+
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from produtos.cache import invalidar_colecoes
+from produtos.vendas import atualizar
+
+
+class Command(BaseCommand):
+    help = 'Atualiza as vendas diárias por produto (dias com pedidos novos ou alterados desde a última execução)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Recalcula todos os dias a partir desta data (AAAA-MM-DD)')
+        parser.add_argument('--sobreposicao', type=int, default=10, help='Minutos revistos a cada execução')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            try:
+                desde = date.fromisoformat(options['desde'])
+            except ValueError:
+                raise CommandError('--desde deve estar no formato AAAA-MM-DD')
+
+        inicio = time.perf_counter()
+        dias, linhas = atualizar(sobreposicao=timedelta(minutes=options['sobreposicao']), desde=desde)
+        if dias:
+            invalidar_colecoes()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {dias} dia(s) recalculado(s), {linhas} linha(s) em {time.perf_counter() - inicio:.1f}s'
+        ))
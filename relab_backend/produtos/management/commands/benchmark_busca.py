@@ -0,0 +1,116 @@
+# produtos/management/commands/benchmark_busca.py
+
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from produtos.models import Produto
+
+
+class RollbackBenchmark(Exception):
+    """Usada para desfazer os produtos sintéticos ao final do benchmark"""
+
+
+class Command(BaseCommand):
+    help = 'Compara a busca textual (tsvector + GIN) com o caminho antigo via icontains'
+
+    PALAVRAS = [
+        'notebook', 'mouse', 'teclado', 'monitor', 'fone', 'camiseta', 'calça',
+        'jaqueta', 'livro', 'luminária', 'quadro', 'tênis', 'garrafa', 'térmica',
+        'mecânico', 'ergonômico', 'algodão', 'couro', 'corrida', 'decoração',
+        'bluetooth', 'premium', 'básica', 'sem fio', 'ultrawide', 'led',
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--termos',
+            nargs='+',
+            default=['notebook', 'teclado mecanico', 'camiseta algodão', 'tenis corrida'],
+            help='Termos buscados em cada rodada',
+        )
+        parser.add_argument(
+            '--repeticoes',
+            type=int,
+            default=20,
+            help='Quantas vezes cada termo é buscado por caminho',
+        )
+        parser.add_argument(
+            '--popular',
+            type=int,
+            default=0,
+            help='Cria N produtos sintéticos numa transação desfeita ao final',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['popular']:
+                    self.popular(options['popular'])
+                self.executar(options['termos'], options['repeticoes'])
+                if options['popular']:
+                    raise RollbackBenchmark
+        except RollbackBenchmark:
+            self.stdout.write(self.style.WARNING('🗑️  Produtos sintéticos descartados (rollback)'))
+
+    def popular(self, quantidade):
+        self.stdout.write(self.style.HTTP_INFO(f'📦 Criando {quantidade} produtos sintéticos...'))
+        rng = random.Random(42)
+        lote = []
+        for i in range(quantidade):
+            palavras = rng.sample(self.PALAVRAS, 4)
+            lote.append(Produto(
+                nome=' '.join(palavras[:2]).title(),
+                slug=f'benchmark-busca-{i}',
+                descricao_curta=' '.join(palavras[1:3]),
+                descricao=' '.join(rng.choices(self.PALAVRAS, k=40)),
+                meta_keywords=', '.join(palavras[2:]),
+                preco=Decimal('99.90'),
+                estoque=10,
+            ))
+            if len(lote) == 5000:
+                Produto.objects.bulk_create(lote)
+                lote = []
+        Produto.objects.bulk_create(lote)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE produtos_produto')
+
+    def executar(self, termos, repeticoes):
+        base = Produto.objects.filter(ativo=True, disponivel=True)
+        total = base.count()
+        self.stdout.write(self.style.HTTP_INFO(f'🔎 Catálogo ativo: {total} produtos'))
+
+        caminhos = {
+            'icontains': lambda termo: base.filter(
+                Q(nome__icontains=termo) |
+                Q(descricao__icontains=termo) |
+                Q(descricao_curta__icontains=termo) |
+                Q(meta_keywords__icontains=termo)
+            ).order_by('-criado_em'),
+            'tsvector': lambda termo: base.buscar(termo).order_by('-relevancia', '-criado_em'),
+        }
+
+        for termo in termos:
+            self.stdout.write('')
+            self.stdout.write(self.style.SUCCESS(f'Termo: "{termo}"'))
+            for nome, montar in caminhos.items():
+                tempos = []
+                encontrados = 0
+                for _ in range(repeticoes):
+                    inicio = time.perf_counter()
+                    queryset = montar(termo)
+                    encontrados = queryset.count()
+                    list(queryset.values_list('id', flat=True)[:20])
+                    tempos.append((time.perf_counter() - inicio) * 1000)
+
+                tempos.sort()
+                p95 = tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))]
+                self.stdout.write(
+                    f'  {nome:<10} média {statistics.mean(tempos):8.2f} ms | '
+                    f'p50 {statistics.median(tempos):8.2f} ms | '
+                    f'p95 {p95:8.2f} ms | {encontrados} resultado(s)'
+                )
@@ -0,0 +1,160 @@
+# produtos/management/commands/benchmark_catalogo_colunar.py
+
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.test.client import RequestFactory
+from produtos import colunar
+from produtos.models import Categoria, Produto
+from produtos.views import ProdutoViewSet
+
+PREFIXO = 'benchmark-colunar-'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara a listagem de produtos pelo catálogo em memória (produtos/colunar.py) com o caminho do ORM. '
+        'Com --popular, os produtos sintéticos são gravados (a atualização incremental precisa de commit) '
+        'e apagados ao final'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--popular', type=int, default=0, help='Cria N produtos sintéticos antes de medir')
+        parser.add_argument('--repeticoes', type=int, default=10, help='Requisições por cenário e caminho')
+        parser.add_argument('--alterar', type=int, default=1000, help='Produtos alterados na medição da atualização')
+
+    def handle(self, *args, **options):
+        try:
+            if options['popular']:
+                self.popular(options['popular'])
+            self.executar(options['repeticoes'], options['alterar'])
+        finally:
+            if options['popular']:
+                self.limpar()
+
+    def popular(self, quantidade):
+        self.stdout.write(self.style.HTTP_INFO(f'📦 Criando {quantidade} produtos sintéticos...'))
+        inicio = time.perf_counter()
+        categorias = Categoria.objects.bulk_create([
+            Categoria(nome=f'Benchmark colunar {i}', slug=f'{PREFIXO}{i}') for i in range(50)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {Produto._meta.db_table} (
+                    nome, slug, descricao_curta, categoria_id, preco, preco_promocional, estoque, estoque_minimo,
+                    ativo, disponivel, em_destaque, imagem_derivados, meta_description, meta_keywords,
+                    visualizacoes, vendas, criado_em, atualizado_em
+                )
+                SELECT 'Produto benchmark ' || g, '{PREFIXO}' || g, '', (%s::bigint[])[1 + g %% 50],
+                       p.preco, CASE WHEN g %% 5 = 0 THEN round(p.preco * 0.8, 2) END,
+                       (g * 7) %% 40, 5, g %% 50 <> 0, true, g %% 97 = 0, '{{}}', '', '',
+                       0, (random() * random() * 500)::int, now() - random() * interval '730 days', now()
+                FROM generate_series(1, %s) g
+                CROSS JOIN LATERAL (SELECT round((5 + random() * 995)::numeric + g * 0, 2) AS preco) p
+                """,
+                [[categoria.id for categoria in categorias], quantidade]
+            )
+            cursor.execute(f'ANALYZE {Produto._meta.db_table}')
+        self.stdout.write(f'   {time.perf_counter() - inicio:.1f}s')
+
+    def limpar(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {Produto._meta.db_table} WHERE slug LIKE %s', [f'{PREFIXO}%'])
+        Categoria.objects.filter(slug__startswith=PREFIXO).delete()
+        self.stdout.write(self.style.WARNING('🗑️  Produtos sintéticos apagados'))
+
+    def executar(self, repeticoes, alterar):
+        colunar.descartar()
+        inicio = time.perf_counter()
+        catalogo = colunar.Catalogo.carregar()
+        self.stdout.write(self.style.HTTP_INFO(
+            f'🔎 Catálogo ativo: {len(catalogo)} produtos, leitura completa em {time.perf_counter() - inicio:.2f}s '
+            f'({catalogo.memoria / 1024 / 1024:.1f} MB)'
+        ))
+
+        categoria = Categoria.objects.filter(produtos_disponiveis__gt=0).order_by('-produtos_disponiveis').first()
+        cenarios = {
+            'padrão (-criado_em)': {},
+            'categoria + em estoque': {'categoria': categoria.id if categoria else 0, 'em_estoque': 'true'},
+            'faixa de preço, ?ordering=preco': {'preco_min': '50', 'preco_max': '150', 'ordering': 'preco'},
+            'promoção, ?ordering=-vendas': {'em_promocao': 'true', 'ordering': '-vendas'},
+            'destaque, ?ordering=-preco': {'em_destaque': 'true', 'ordering': '-preco'},
+            'página 2000': {'page': '2000'},
+        }
+        view = ProdutoViewSet.as_view({'get': 'list'})
+        fabrica = RequestFactory()
+
+        def requisitar(parametros):
+            response = view(fabrica.get('/api/v1/produtos/', parametros, HTTP_HOST='localhost'))
+            response.render()
+            return response
+
+        for nome, parametros in cenarios.items():
+            self.stdout.write('')
+            self.stdout.write(self.style.SUCCESS(f'Cenário: {nome}'))
+            respostas = {}
+            for caminho, ligado in [('orm', False), ('colunar', True)]:
+                with override_settings(CATALOGO_COLUNAR=ligado, CATALOGO_COLUNAR_INTERVALO=3600):
+                    requisitar(parametros)  # Aquecimento (e ordenação do snapshot, no colunar)
+                    tempos = []
+                    for _ in range(repeticoes):
+                        inicio = time.perf_counter()
+                        respostas[caminho] = requisitar(parametros)
+                        tempos.append((time.perf_counter() - inicio) * 1000)
+                tempos.sort()
+                p95 = tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))]
+                self.stdout.write(
+                    f'  {caminho:<8} média {statistics.mean(tempos):8.2f} ms | '
+                    f'p50 {statistics.median(tempos):8.2f} ms | p95 {p95:8.2f} ms | '
+                    f'{respostas[caminho].data.get("count", 0)} resultado(s)'
+                )
+            orm, memoria = respostas['orm'].data, respostas['colunar'].data
+            if orm.get('count') != memoria.get('count'):
+                self.stdout.write(self.style.WARNING('  ⚠️  Contagens diferentes'))
+            elif [p['id'] for p in orm.get('results', [])] != [p['id'] for p in memoria.get('results', [])]:
+                self.stdout.write('  (páginas diferentes só na ordem dos empates: o snapshot desempata por id)')
+
+        self.atualizacao(alterar)
+
+    def atualizacao(self, quantidade):
+        """Custo da atualização incremental depois de alterar `quantidade` produtos"""
+        catalogo = colunar.catalogo()
+        inicio = time.perf_counter()
+        igual = catalogo.atualizado()
+        sem_alteracoes = time.perf_counter() - inicio
+
+        ids = list(Produto.objects.filter(ativo=True, disponivel=True).order_by('?').values_list('id', flat=True)[:quantidade])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {Produto._meta.db_table} SET estoque = estoque + 1, vendas = vendas + 1 WHERE id = ANY(%s)',
+                [ids]
+            )
+            cursor.execute(
+                f'UPDATE {Produto._meta.db_table} SET ativo = false WHERE id = ANY(%s)', [ids[:quantidade // 10]]
+            )
+        inicio = time.perf_counter()
+        atualizado = igual.atualizado()
+        com_alteracoes = time.perf_counter() - inicio
+
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS('Atualização incremental'))
+        self.stdout.write(f'  sem alterações: {sem_alteracoes * 1000:8.2f} ms')
+        self.stdout.write(
+            f'  {len(ids)} alterado(s), {len(ids[:quantidade // 10])} desativado(s): {com_alteracoes * 1000:8.2f} ms '
+            f'({len(igual)} -> {len(atualizado)} produtos)'
+        )
+        faltando, sobrando, diferentes = colunar.divergencias(atualizado)
+        if faltando or sobrando or diferentes:
+            self.stdout.write(self.style.WARNING(
+                f'  ⚠️  Divergências: {len(faltando)} faltando, {len(sobrando)} sobrando, {len(diferentes)} diferentes'
+            ))
+        else:
+            self.stdout.write('  snapshot igual à leitura completa')
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE {Produto._meta.db_table} SET ativo = true WHERE id = ANY(%s)', [ids[:quantidade // 10]])
+        colunar.descartar()
@@ -0,0 +1,92 @@
+# produtos/management/commands/benchmark_serializacao.py
+
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from produtos.cache import invalidar_colecoes
+from produtos.models import Categoria, Produto
+
+
+class Command(BaseCommand):
+    help = 'Compara as listagens com o serializer do DRF e com a serialização compilada + orjson (req/s e bytes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--produtos', type=int, default=500, help='Produtos temporários criados para o teste')
+        parser.add_argument('--requisicoes', type=int, default=300, help='Requisições por endpoint e caminho')
+
+    def handle(self, *args, **options):
+        categoria = Categoria.objects.create(nome='Benchmark serialização', slug='benchmark-serializacao')
+        try:
+            self.popular(categoria, options['produtos'])
+            invalidar_colecoes()
+
+            endpoints = [
+                ('listagem', '/api/v1/produtos/', False),
+                ('listagem cursor', '/api/v1/produtos/?paginacao=cursor', False),
+                ('listagem ?fields', '/api/v1/produtos/?fields=id,nome,preco_final,categoria_nome', False),
+                ('categoria/produtos', f'/api/v1/produtos/categorias/{categoria.pk}/produtos/', False),
+                ('categorias', '/api/v1/produtos/categorias/', False),
+                ('novidades', '/api/v1/produtos/novidades/', True),
+                ('promoções', '/api/v1/produtos/promocoes/', True),
+            ]
+            client = Client(HTTP_HOST='localhost')
+            for nome, url, colecao in endpoints:
+                resultados = {}
+                for caminho, compilada in [('drf', False), ('compilada', True)]:
+                    with override_settings(SERIALIZACAO_COMPILADA=compilada):
+                        resultados[caminho] = self.rodada(client, url, colecao, options['requisicoes'])
+
+                (corpo_drf, duracao_drf), (corpo, duracao) = resultados['drf'], resultados['compilada']
+                igual = '✓ bytes idênticos' if corpo == corpo_drf else '❌ SAÍDA DIFERENTE'
+                estilo = self.style.SUCCESS if corpo == corpo_drf else self.style.ERROR
+                self.stdout.write(estilo(
+                    f'{nome:<20} drf {options["requisicoes"] / duracao_drf:8.1f} req/s | '
+                    f'compilada {options["requisicoes"] / duracao:8.1f} req/s '
+                    f'({duracao_drf / duracao:4.1f}x) | {igual}'
+                ))
+        finally:
+            Produto.objects.filter(slug__startswith='benchmark-serializacao-').delete()
+            categoria.delete()
+            invalidar_colecoes()
+
+    def popular(self, categoria, quantidade):
+        self.stdout.write(self.style.HTTP_INFO(f'📦 Criando {quantidade} produtos temporários...'))
+        rng = random.Random(42)
+        derivados = {'origem': 'produtos/bench.jpg', 'hash': 'b' * 20, 'formatos': {
+            'webp': {'160': 'derivados/bb/bench/160w.webp', '320': 'derivados/bb/bench/320w.webp'},
+            'jpeg': {'160': 'derivados/bb/bench/160w.jpg', '320': 'derivados/bb/bench/320w.jpg'},
+        }}
+        produtos = []
+        for i in range(quantidade):
+            preco = Decimal(rng.randint(500, 500000)) / 100
+            produtos.append(Produto(
+                nome=f'Produto ação nº {i}' + ('\u2028' if i % 50 == 0 else ''),
+                slug=f'benchmark-serializacao-{i}',
+                descricao_curta='Descrição "curta" com acentuação',
+                descricao='Texto',
+                # Alguns sem categoria, promoção ou imagem (campos nulos/omitidos)
+                categoria=categoria if i % 7 else None,
+                preco=preco,
+                preco_promocional=(preco * Decimal('0.85')).quantize(Decimal('0.01')) if i % 3 == 0 else None,
+                estoque=rng.randint(0, 30),
+                em_destaque=i % 5 == 0,
+                imagem=f'produtos/2024/01/bench-{i}.jpg' if i % 2 else '',
+                imagem_derivados=derivados if i % 4 == 1 else {},
+            ))
+        Produto.objects.bulk_create(produtos, batch_size=1000)
+
+    def rodada(self, client, url, colecao, requisicoes):
+        corpo = None
+        inicio = time.perf_counter()
+        for _ in range(requisicoes):
+            if colecao:
+                # Coleções ficam em cache: invalida para medir o cálculo
+                invalidar_colecoes()
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url}: HTTP {response.status_code}')
+            corpo = response.content
+        return corpo, time.perf_counter() - inicio
@@ -0,0 +1,77 @@
+# produtos/management/commands/benchmark_visualizacoes.py
+
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from produtos.models import Produto
+from produtos.visualizacoes import contador
+
+
+class Command(BaseCommand):
+    help = 'Mede a vazão do GET /produtos/{id}/ em um único produto muito acessado (gravação imediata vs em lote)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--produto', type=int, help='ID do produto (padrão: cria um produto temporário)')
+        parser.add_argument('--requisicoes', type=int, default=2000, help='Requisições por rodada')
+        parser.add_argument('--threads', type=int, default=8, help='Requisições simultâneas')
+
+    def handle(self, *args, **options):
+        produto_id = options['produto']
+        temporario = None
+        if not produto_id:
+            temporario = Produto.objects.create(
+                nome='Produto benchmark visualizações',
+                preco=Decimal('10.00'),
+                estoque=1
+            )
+            produto_id = temporario.pk
+
+        intervalo_original = contador.intervalo
+        try:
+            for nome, intervalo in [('imediato', 0), ('em lote', intervalo_original or 10)]:
+                contador.intervalo = intervalo
+                antes = Produto.objects.values_list('visualizacoes', flat=True).get(pk=produto_id)
+                duracao = self.rodada(produto_id, options['requisicoes'], options['threads'])
+                contador.flush()
+                depois = Produto.objects.values_list('visualizacoes', flat=True).get(pk=produto_id)
+
+                self.stdout.write(self.style.SUCCESS(
+                    f'{nome:<9} {options["requisicoes"] / duracao:8.1f} req/s | '
+                    f'{duracao:6.2f}s | visualizações gravadas: {depois - antes}'
+                ))
+        finally:
+            contador.intervalo = intervalo_original
+            if temporario:
+                temporario.delete()
+
+    def rodada(self, produto_id, requisicoes, threads):
+        por_thread = requisicoes // threads
+        barreira = threading.Barrier(threads)
+        erros = []
+
+        def trabalhador():
+            client = Client(HTTP_HOST='localhost')
+            barreira.wait()
+            try:
+                for _ in range(por_thread):
+                    response = client.get(f'/api/v1/produtos/{produto_id}/')
+                    if response.status_code != 200:
+                        erros.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=trabalhador) for _ in range(threads)]
+        inicio = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        duracao = time.perf_counter() - inicio
+
+        if erros:
+            self.stdout.write(self.style.ERROR(f'❌ {len(erros)} requisição(ões) com erro: {set(erros)}'))
+        return duracao
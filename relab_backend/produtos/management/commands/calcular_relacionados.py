@@ -0,0 +1,64 @@
+# produtos/management/commands/calcular_relacionados.py
+
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from produtos.cache import invalidar_colecoes
+from produtos.models import CoocorrenciaProduto, MarcaProcessamento, ProdutoRelacionado
+from produtos.relacionados import (
+    MARCA, MARCA_CANCELADOS, calcular_limite, descontar_cancelados, ler_marca, processar_pedidos,
+    recalcular_top_k, vizinhos,
+)
+
+
+class Command(BaseCommand):
+    help = 'Atualiza os produtos "comprados juntos" a partir dos pedidos novos (incremental pela marca d\'água)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=12, help='Relacionados guardados por produto')
+        parser.add_argument('--minimo', type=int, default=2, help='Pedidos em comum para considerar o par')
+        parser.add_argument('--lote-pedidos', type=int, default=20000, help='Pedidos lidos por transação')
+        parser.add_argument('--atraso', type=int, default=10, help='Ignora pedidos dos últimos N minutos')
+        parser.add_argument('--completo', action='store_true', help='Zera as contagens e reprocessa todos os pedidos')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+
+        if options['completo']:
+            with transaction.atomic():
+                CoocorrenciaProduto.objects.all().delete()
+                ProdutoRelacionado.objects.all().delete()
+                MarcaProcessamento.objects.filter(nome__in=[MARCA, MARCA_CANCELADOS]).delete()
+            self.stdout.write(self.style.WARNING('🗑️  Contagens zeradas, reprocessando todos os pedidos'))
+
+        limite = calcular_limite(timedelta(minutes=options['atraso']))
+        cancelados, tocados = descontar_cancelados(limite)
+        if cancelados:
+            self.stdout.write(self.style.WARNING(f'🗑️  {cancelados} pedido(s) cancelado(s) descontado(s)'))
+
+        self.stdout.write(self.style.HTTP_INFO(f'📦 Pedidos a partir do #{ler_marca() + 1}...'))
+        total_pedidos = total_itens = 0
+        for pedidos, itens, produtos in processar_pedidos(limite, lote_pedidos=options['lote_pedidos']):
+            total_pedidos += pedidos
+            total_itens += itens
+            tocados = np.union1d(tocados, produtos)
+            self.stdout.write(f'   {total_pedidos} pedidos / {total_itens} itens')
+
+        if not len(tocados):
+            self.stdout.write(self.style.SUCCESS('✓ Nenhum pedido novo ou cancelado'))
+            return
+
+        # O score dos vizinhos também muda (depende do total de pedidos dos produtos tocados)
+        afetados = np.union1d(tocados, vizinhos(tocados))
+        self.stdout.write(self.style.HTTP_INFO(f'🔗 Recalculando top-{options["k"]} de {len(afetados)} produto(s)...'))
+        gravadas = recalcular_top_k(afetados, k=options['k'], minimo=options['minimo'])
+        invalidar_colecoes()
+
+        duracao = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {total_itens} itens de {total_pedidos} pedidos em {duracao:.1f}s '
+            f'({total_itens / max(duracao, 1e-9):.0f} itens/s) | {gravadas} relacionados gravados'
+        ))
@@ -0,0 +1,79 @@
+# produtos/management/commands/gerar_derivados_imagens.py
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from produtos.cache import invalidar_colecoes
+from produtos.imagens import gerar_derivados_processo, iniciar_processo
+from produtos.models import ImagemProduto, Produto
+
+
+class Command(BaseCommand):
+    help = 'Gera as miniaturas WebP/JPEG das imagens de Produto e ImagemProduto (backfill em paralelo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processos', type=int, default=os.cpu_count() or 2, help='Processos em paralelo')
+        parser.add_argument('--todos', action='store_true', help='Regera mesmo as imagens que já têm derivados')
+        parser.add_argument('--lote', type=int, default=200, help='Imagens enviadas ao pool por vez')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        totais = {'geradas': 0, 'erros': 0}
+
+        # spawn: os processos não herdam as conexões do banco abertas no processo principal.
+        # Eles só leem/gravam arquivos; as gravações no banco ficam aqui
+        pool = ProcessPoolExecutor(
+            max_workers=options['processos'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=iniciar_processo
+        )
+        with pool:
+            for modelo in (Produto, ImagemProduto):
+                self.stdout.write(self.style.HTTP_INFO(f'🖼️  {modelo._meta.verbose_name_plural}...'))
+                pendentes = self.pendentes(modelo, options['todos'])
+
+                lote = []
+                for item in pendentes:
+                    lote.append(item)
+                    if len(lote) >= options['lote']:
+                        self.processar(pool, modelo, lote, totais)
+                        lote = []
+                if lote:
+                    self.processar(pool, modelo, lote, totais)
+
+        if totais['geradas']:
+            invalidar_colecoes()
+
+        duracao = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {totais["geradas"]} imagem(ns) processada(s) em {duracao:.1f}s '
+            f'({totais["geradas"] / max(duracao, 1e-9):.1f} imagens/s) | erros: {totais["erros"]}'
+        ))
+
+    def pendentes(self, modelo, todos):
+        """(pk, nome da imagem) dos registros sem derivados para a imagem atual"""
+        queryset = modelo.objects.exclude(imagem='').exclude(imagem__isnull=True).order_by('pk')
+        for pk, nome, derivados in queryset.values_list('pk', 'imagem', 'imagem_derivados').iterator(chunk_size=1000):
+            if todos or (derivados or {}).get('origem') != nome:
+                yield pk, nome
+
+    def processar(self, pool, modelo, lote, totais):
+        por_nome = {}
+        for pk, nome in lote:
+            # A mesma imagem em vários registros é processada uma vez só
+            por_nome.setdefault(nome, []).append(pk)
+
+        futuros = [pool.submit(gerar_derivados_processo, nome) for nome in por_nome]
+        for futuro in as_completed(futuros):
+            nome, derivados, erro = futuro.result()
+            if erro:
+                totais['erros'] += 1
+                self.stderr.write(f'⚠️  {nome}: {erro}')
+                continue
+
+            # Filtra pela imagem também: um upload feito durante o backfill não é sobrescrito
+            modelo.objects.filter(pk__in=por_nome[nome], imagem=nome).update(imagem_derivados=derivados)
+            totais['geradas'] += 1
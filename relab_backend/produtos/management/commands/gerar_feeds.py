@@ -0,0 +1,116 @@
+# produtos/management/commands/gerar_feeds.py
+
+import json
+import tempfile
+import time
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from produtos.feed import FORMATOS, em_bytes, gerar, indice_sitemap, produtos, produtos_por_shard, shards
+
+PASTA = 'feeds'
+MANIFESTO = f'{PASTA}/manifesto.json'
+
+
+def caminho_shard(formato, shard):
+    if formato == 'sitemap':
+        # Sitemaps completos (servidos direto pelo índice)
+        return f'{PASTA}/sitemap-produtos-{shard:05d}.xml.gz'
+    # Só as linhas: o feed completo é a concatenação dos membros gzip
+    return f'{PASTA}/shards/{formato}/{shard:05d}.gz'
+
+
+class Command(BaseCommand):
+    help = 'Gera sitemap e feeds do catálogo no storage (feeds/), regravando só os shards com produtos alterados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formatos', default='sitemap,csv,xml,jsonl', help='Formatos separados por vírgula')
+        parser.add_argument('--completo', action='store_true', help='Regrava todos os shards')
+        parser.add_argument('--url-base', default=settings.SITE_URL, help='URL base dos arquivos e das imagens')
+
+    def handle(self, *args, **options):
+        formatos = [formato.strip() for formato in options['formatos'].split(',') if formato.strip()]
+        desconhecidos = set(formatos) - set(FORMATOS)
+        if desconhecidos:
+            raise CommandError(f'Formatos desconhecidos: {", ".join(sorted(desconhecidos))}')
+
+        inicio = time.perf_counter()
+        url_base = options['url_base']
+        parametros = {
+            'produtos_por_shard': produtos_por_shard(),
+            'url_produto': settings.FEED_URL_PRODUTO,
+            'url_base': url_base,
+        }
+        manifesto = self.ler_manifesto()
+        if options['completo'] or manifesto.get('parametros') != parametros:
+            manifesto = {'parametros': parametros, 'formatos': {}}
+
+        assinaturas = shards()
+        atuais = {
+            str(shard): [
+                assinatura.quantidade, assinatura.soma, assinatura.ultimo.isoformat(),
+                assinatura.categorizados, assinatura.categorias and assinatura.categorias.isoformat(),
+            ]
+            for shard, assinatura in assinaturas.items()
+        }
+        self.stdout.write(self.style.HTTP_INFO(
+            f'📦 {sum(assinatura.quantidade for assinatura in assinaturas.values())} produtos em {len(atuais)} shard(s)'
+        ))
+
+        for formato in formatos:
+            gravados = manifesto['formatos'].setdefault(formato, {})
+            regravar = [shard for shard, assinatura in atuais.items() if gravados.get(shard) != assinatura]
+            for shard in regravar:
+                linhas = gerar(formato, produtos(int(shard)), url_base, cabecalho=formato == 'sitemap')
+                self.gravar(caminho_shard(formato, int(shard)), em_bytes(linhas, comprimir=True))
+                gravados[shard] = atuais[shard]
+
+            removidos = [shard for shard in gravados if shard not in atuais]
+            for shard in removidos:
+                default_storage.delete(caminho_shard(formato, int(shard)))
+                del gravados[shard]
+
+            if formato == 'sitemap':
+                url_shard = lambda shard: urljoin(url_base, default_storage.url(caminho_shard('sitemap', shard)))
+                self.gravar(f'{PASTA}/sitemap.xml', em_bytes(indice_sitemap(assinaturas, url_shard)))
+            elif regravar or removidos:
+                self.gravar(f'{PASTA}/produtos.{FORMATOS[formato].extensao}.gz', self.concatenar(formato, atuais))
+
+            self.stdout.write(
+                f'   {formato}: {len(regravar)} shard(s) regravado(s), {len(removidos)} removido(s), '
+                f'{len(atuais) - len(regravar)} inalterado(s)'
+            )
+
+        self.gravar(MANIFESTO, [json.dumps(manifesto).encode('utf-8')])
+        self.stdout.write(self.style.SUCCESS(f'✓ Feeds gerados em {time.perf_counter() - inicio:.1f}s'))
+
+    def ler_manifesto(self):
+        if not default_storage.exists(MANIFESTO):
+            return {}
+        with default_storage.open(MANIFESTO, 'rb') as arquivo:
+            return json.loads(arquivo.read())
+
+    def concatenar(self, formato, atuais):
+        """Feed completo: membro gzip do cabeçalho, os shards na ordem de id e o rodapé (sem recomprimir)"""
+        info = FORMATOS[formato]
+        if info.cabecalho:
+            yield from em_bytes([info.cabecalho], comprimir=True)
+        for shard in sorted(atuais, key=int):
+            with default_storage.open(caminho_shard(formato, int(shard)), 'rb') as arquivo:
+                while bloco := arquivo.read(1024 * 1024):
+                    yield bloco
+        if info.rodape:
+            yield from em_bytes([info.rodape], comprimir=True)
+
+    def gravar(self, nome, blocos):
+        """Grava os blocos em arquivo temporário e substitui o arquivo no storage"""
+        with tempfile.TemporaryFile() as temporario:
+            for bloco in blocos:
+                temporario.write(bloco)
+            temporario.seek(0)
+            if default_storage.exists(nome):
+                default_storage.delete(nome)
+            default_storage.save(nome, File(temporario, name=nome))
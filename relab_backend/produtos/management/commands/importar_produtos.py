@@ -0,0 +1,327 @@
+# produtos/management/commands/importar_produtos.py
+
+import csv
+import io
+import json
+import re
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.text import slugify
+from produtos.cache import invalidar_colecoes
+from produtos.models import Categoria, Produto
+from produtos.precos import registrar_alteracoes
+
+# Colunas da tabela de staging, na ordem do COPY
+COLUNAS = [
+    'linha', 'sku', 'nome', 'slug', 'descricao_curta', 'descricao', 'categoria_id',
+    'preco', 'preco_promocional', 'preco_custo', 'estoque', 'estoque_minimo',
+    'ativo', 'em_destaque', 'disponivel', 'meta_description', 'meta_keywords',
+]
+
+# Campos atualizados quando o SKU já existe (slug, métricas e criado_em são preservados)
+CAMPOS_ATUALIZADOS = [
+    'nome', 'descricao_curta', 'descricao', 'categoria_id', 'preco', 'preco_promocional',
+    'preco_custo', 'estoque', 'estoque_minimo', 'ativo', 'em_destaque', 'disponivel',
+    'meta_description', 'meta_keywords',
+]
+
+VERDADEIROS = {'1', 'true', 't', 'sim', 's', 'yes', 'y'}
+FALSOS = {'0', 'false', 'f', 'nao', 'não', 'n', 'no'}
+
+NULO = '\\N'
+
+
+class LinhaRejeitada(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Importa/atualiza produtos em massa a partir de CSV ou JSONL (COPY + INSERT ... ON CONFLICT pelo SKU)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Arquivo .csv ou .jsonl (um produto por linha)')
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], help='Padrão: pela extensão do arquivo')
+        parser.add_argument('--delimitador', default=',', help='Delimitador do CSV')
+        parser.add_argument('--lote', type=int, default=5000, help='Linhas por COPY/upsert')
+        parser.add_argument('--rejeitados', help='Grava as linhas rejeitadas (JSONL com linha e motivo)')
+
+    def handle(self, *args, **options):
+        caminho = Path(options['arquivo'])
+        if not caminho.exists():
+            raise CommandError(f'Arquivo não encontrado: {caminho}')
+
+        formato = options['formato'] or caminho.suffix.lstrip('.').lower()
+        if formato not in ('csv', 'jsonl'):
+            raise CommandError('Formato não reconhecido: use --formato csv ou --formato jsonl')
+
+        self.categorias = dict(Categoria.objects.values_list('slug', 'id'))
+        self.tabela = connection.ops.quote_name(Produto._meta.db_table)
+        self.totais = {'lidas': 0, 'inseridas': 0, 'atualizadas': 0, 'inalteradas': 0, 'rejeitadas': 0}
+        rejeitados = open(options['rejeitados'], 'w', encoding='utf-8') if options['rejeitados'] else None
+
+        self.stdout.write(self.style.HTTP_INFO(f'📦 Importando {caminho} ({formato})...'))
+        inicio = time.perf_counter()
+
+        try:
+            self.criar_staging()
+            lote = []
+            with open(caminho, newline='', encoding='utf-8-sig') as arquivo:
+                for numero, dados in self.ler(arquivo, formato, options['delimitador']):
+                    self.totais['lidas'] += 1
+                    try:
+                        lote.append(self.converter(numero, dados))
+                    except LinhaRejeitada as erro:
+                        self.rejeitar(rejeitados, numero, str(erro), dados)
+
+                    if len(lote) >= options['lote']:
+                        self.gravar_lote(lote)
+                        lote = []
+                        self.progresso(inicio)
+
+            if lote:
+                self.gravar_lote(lote)
+        finally:
+            if rejeitados:
+                rejeitados.close()
+            with connection.cursor() as cursor:
+                cursor.execute('DROP TABLE IF EXISTS produtos_importacao')
+
+        invalidar_colecoes()
+
+        duracao = time.perf_counter() - inicio
+        totais = self.totais
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {totais["lidas"]} linhas em {duracao:.1f}s ({totais["lidas"] / max(duracao, 1e-9):.0f} linhas/s) | '
+            f'inseridos: {totais["inseridas"]} | atualizados: {totais["atualizadas"]} | '
+            f'inalterados: {totais["inalteradas"]} | '
+            f'rejeitados: {totais["rejeitadas"]}'
+        ))
+
+    def ler(self, arquivo, formato, delimitador):
+        """Gera (número da linha, dict) sem carregar o arquivo inteiro"""
+        if formato == 'csv':
+            leitor = csv.DictReader(arquivo, delimiter=delimitador)
+            for dados in leitor:
+                yield leitor.line_num, dados
+            return
+
+        for numero, conteudo in enumerate(arquivo, start=1):
+            if not conteudo.strip():
+                continue
+            try:
+                dados = json.loads(conteudo)
+            except ValueError:
+                dados = {'_bruto': conteudo.rstrip('\n')}
+            yield numero, dados
+
+    def converter(self, numero, dados):
+        """Valida uma linha e devolve a tupla da staging (na ordem de COLUNAS)"""
+        if not isinstance(dados, dict) or '_bruto' in dados:
+            raise LinhaRejeitada('JSON inválido')
+
+        sku = texto(dados.get('sku'))
+        nome = texto(dados.get('nome'))
+        if not sku:
+            raise LinhaRejeitada('sku obrigatório')
+        if len(sku) > 64:
+            raise LinhaRejeitada('sku com mais de 64 caracteres')
+        if not nome:
+            raise LinhaRejeitada('nome obrigatório')
+        if len(nome) > 255:
+            raise LinhaRejeitada('nome com mais de 255 caracteres')
+
+        categoria_id = None
+        categoria = texto(dados.get('categoria') or dados.get('categoria_slug'))
+        if categoria:
+            categoria_id = self.categorias.get(categoria)
+            if categoria_id is None:
+                raise LinhaRejeitada(f'categoria desconhecida: {categoria}')
+
+        preco = decimal(dados.get('preco'), 'preco')
+        if preco is None or preco <= 0:
+            raise LinhaRejeitada('preco obrigatório e maior que zero')
+        preco_promocional = decimal(dados.get('preco_promocional'), 'preco_promocional')
+        if preco_promocional is not None and preco_promocional <= 0:
+            raise LinhaRejeitada('preco_promocional deve ser maior que zero')
+
+        estoque = inteiro(dados.get('estoque'), 'estoque', 0)
+        if estoque < 0:
+            raise LinhaRejeitada('estoque negativo')
+
+        slug = slugify(texto(dados.get('slug')) or nome)[:200] or 'produto'
+
+        return (
+            numero, sku, nome, slug,
+            texto(dados.get('descricao_curta'))[:255],
+            texto(dados.get('descricao')) or None,
+            categoria_id,
+            preco, preco_promocional, decimal(dados.get('preco_custo'), 'preco_custo'),
+            estoque, inteiro(dados.get('estoque_minimo'), 'estoque_minimo', 5),
+            booleano(dados.get('ativo'), 'ativo', True),
+            booleano(dados.get('em_destaque'), 'em_destaque', False),
+            booleano(dados.get('disponivel'), 'disponivel', True),
+            texto(dados.get('meta_description'))[:160],
+            texto(dados.get('meta_keywords'))[:255],
+        )
+
+    def rejeitar(self, rejeitados, numero, motivo, dados):
+        self.totais['rejeitadas'] += 1
+        if rejeitados:
+            rejeitados.write(json.dumps({'linha': numero, 'motivo': motivo, 'dados': dados}, ensure_ascii=False) + '\n')
+        elif self.totais['rejeitadas'] <= 10:
+            self.stderr.write(f'⚠️  linha {numero}: {motivo}')
+
+    def criar_staging(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS produtos_importacao ('
+                'linha bigint, sku varchar(64), nome varchar(255), slug varchar(255), '
+                'descricao_curta varchar(255), descricao text, categoria_id bigint, '
+                'preco numeric(10, 2), preco_promocional numeric(10, 2), preco_custo numeric(10, 2), '
+                'estoque integer, estoque_minimo integer, '
+                'ativo boolean, em_destaque boolean, disponivel boolean, '
+                'meta_description varchar(160), meta_keywords varchar(255)'
+                ') ON COMMIT DELETE ROWS'
+            )
+
+    @transaction.atomic
+    def gravar_lote(self, lote):
+        """COPY do lote para a staging e upsert em Produto, em uma transação"""
+        with connection.cursor() as cursor:
+            self.alocar_slugs(cursor, lote)
+
+            buffer = io.StringIO()
+            escritor = csv.writer(buffer)
+            for linha in lote:
+                escritor.writerow(NULO if valor is None else valor for valor in linha)
+            buffer.seek(0)
+            cursor.copy_expert(
+                f'COPY produtos_importacao ({", ".join(COLUNAS)}) FROM STDIN WITH (FORMAT csv, NULL \'{NULO}\')',
+                buffer
+            )
+
+            colunas = [coluna for coluna in COLUNAS if coluna != 'linha']
+            atualizacoes = ', '.join(f'{campo} = EXCLUDED.{campo}' for campo in CAMPOS_ATUALIZADOS)
+            atuais = ', '.join(f'p.{campo}' for campo in CAMPOS_ATUALIZADOS)
+            novos = ', '.join(f'EXCLUDED.{campo}' for campo in CAMPOS_ATUALIZADOS)
+            # DISTINCT ON: o mesmo SKU repetido no lote vale pela última ocorrência.
+            # Linhas idênticas às do banco não são regravadas (reimportar o mesmo arquivo é barato)
+            cursor.execute(
+                f'INSERT INTO {self.tabela} AS p ({", ".join(colunas)}, visualizacoes, vendas, {", ".join(Produto.CAMPOS_TENDENCIA)}, '
+                f'criado_em, atualizado_em) '
+                f'SELECT DISTINCT ON (sku) {", ".join(colunas)}, 0, 0, 0, 0, 0, now(), now() '
+                f'FROM produtos_importacao ORDER BY sku, linha DESC '
+                f'ON CONFLICT (sku) DO UPDATE SET {atualizacoes}, atualizado_em = EXCLUDED.atualizado_em '
+                f'WHERE ({atuais}) IS DISTINCT FROM ({novos}) '
+                f'RETURNING id, (xmax = 0)'
+            )
+            afetados = cursor.fetchall()
+            inseridos = sum(inserido for _, inserido in afetados)
+            # Preços atualizados de produtos com programação entram no histórico
+            registrar_alteracoes([produto_id for produto_id, inserido in afetados if not inserido])
+            self.totais['inseridas'] += inseridos
+            self.totais['atualizadas'] += len(afetados) - inseridos
+            self.totais['inalteradas'] += len({linha[1] for linha in lote}) - len(afetados)
+
+    def alocar_slugs(self, cursor, lote):
+        """
+        Define slugs únicos para os SKUs novos do lote com duas queries, em vez
+        do exists() por tentativa do Produto.save(). Segue o mesmo padrão
+        (`base`, `base-1`, `base-2`...). SKUs existentes mantêm o slug atual.
+        """
+        skus = list({linha[1] for linha in lote})
+        cursor.execute(f'SELECT sku FROM {self.tabela} WHERE sku = ANY(%s)', [skus])
+        existentes = {sku for (sku,) in cursor.fetchall()}
+
+        bases = list({linha[3] for linha in lote if linha[1] not in existentes})
+        ultimo = {}
+        if bases:
+            # Maior sufixo numérico já usado para cada base (0 = só a base existe).
+            # ~>=~ / ~<~ comparam byte a byte e usam o índice varchar_pattern_ops
+            # do slug: o intervalo ['base-', 'base.') contém todos os 'base-*'
+            cursor.execute(
+                f'SELECT b.base, x.sufixo FROM unnest(%s::text[]) AS b(base) '
+                f'CROSS JOIN LATERAL ('
+                f'SELECT MAX(CASE WHEN p.slug = b.base THEN 0 '
+                f'ELSE substring(p.slug FROM length(b.base) + 2)::numeric END) AS sufixo '
+                f'FROM {self.tabela} AS p WHERE p.slug = b.base OR ('
+                f'p.slug ~>=~ (b.base || \'-\') AND p.slug ~<~ (b.base || \'.\') '
+                f'AND substring(p.slug FROM length(b.base) + 2) ~ \'^[0-9]+$\')'
+                f') AS x WHERE x.sufixo IS NOT NULL',
+                [bases]
+            )
+            ultimo = {base: int(sufixo) for base, sufixo in cursor.fetchall()}
+
+        # Os do banco ficam até `ultimo[base]`; os do lote podem vir de outra base
+        # ("Cabo USB" -> cabo-usb-1 e "Cabo USB 1" -> cabo-usb-1)
+        ocupados = set()
+        alocados = {}
+        for indice, linha in enumerate(lote):
+            sku, base = linha[1], linha[3]
+            if sku in existentes:
+                # Valor ignorado pelo ON CONFLICT (slug não é atualizado)
+                slug = base
+            elif sku in alocados:
+                slug = alocados[sku]
+            else:
+                sufixo = ultimo[base] + 1 if base in ultimo else 0
+                while (slug := f'{base}-{sufixo}' if sufixo else base) in ocupados:
+                    sufixo += 1
+                ultimo[base] = sufixo
+                ocupados.add(slug)
+            alocados.setdefault(sku, slug)
+            lote[indice] = linha[:3] + (slug,) + linha[4:]
+
+    def progresso(self, inicio):
+        duracao = time.perf_counter() - inicio
+        self.stdout.write(
+            f'  {self.totais["lidas"]} linhas | {self.totais["lidas"] / max(duracao, 1e-9):.0f} linhas/s | '
+            f'rejeitadas: {self.totais["rejeitadas"]}'
+        )
+        sys.stdout.flush()
+
+
+def texto(valor):
+    if valor is None:
+        return ''
+    return str(valor).strip()
+
+
+def decimal(valor, campo):
+    valor = texto(valor).replace(',', '.') if isinstance(valor, str) else valor
+    if valor in (None, ''):
+        return None
+    try:
+        numero = Decimal(str(valor)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise LinhaRejeitada(f'{campo} inválido: {valor}')
+    if numero.is_nan() or abs(numero) >= Decimal('1e8'):
+        raise LinhaRejeitada(f'{campo} fora do intervalo: {valor}')
+    return numero
+
+
+def inteiro(valor, campo, padrao):
+    valor = texto(valor)
+    if not valor:
+        return padrao
+    if not re.fullmatch(r'-?\d+', valor) or abs(int(valor)) > 2**31 - 1:
+        raise LinhaRejeitada(f'{campo} inválido: {valor}')
+    return int(valor)
+
+
+def booleano(valor, campo, padrao):
+    if isinstance(valor, bool):
+        return valor
+    valor = texto(valor).lower()
+    if not valor:
+        return padrao
+    if valor in VERDADEIROS:
+        return True
+    if valor in FALSOS:
+        return False
+    raise LinhaRejeitada(f'{campo} inválido: {valor}')
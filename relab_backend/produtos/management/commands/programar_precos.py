@@ -0,0 +1,75 @@
+# produtos/management/commands/programar_precos.py
+
+import csv
+import time
+from datetime import datetime
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from produtos.management.commands.importar_produtos import LinhaRejeitada, decimal, texto
+from produtos.precos import programar
+
+
+class Command(BaseCommand):
+    help = 'Programa os preços de uma campanha a partir de um CSV (sku, preco, preco_promocional)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='CSV com as colunas sku, preco (opcional) e preco_promocional')
+        parser.add_argument('--campanha', required=True, help='Nome da campanha (usado para encerrá-la)')
+        parser.add_argument('--inicio', required=True, help='Início (AAAA-MM-DD HH:MM, no fuso do site)')
+        parser.add_argument('--fim', help='Fim (AAAA-MM-DD HH:MM); sem fim o preço fica até ser substituído')
+        parser.add_argument('--delimitador', default=',', help='Delimitador do CSV')
+
+    def handle(self, *args, **options):
+        caminho = Path(options['arquivo'])
+        if not caminho.exists():
+            raise CommandError(f'Arquivo não encontrado: {caminho}')
+
+        inicio = data_hora(options['inicio'], '--inicio')
+        fim = data_hora(options['fim'], '--fim') if options['fim'] else None
+        if fim is not None and fim <= inicio:
+            raise CommandError('--fim deve ser depois de --inicio')
+
+        linhas = []
+        rejeitadas = 0
+        with open(caminho, newline='', encoding='utf-8-sig') as arquivo:
+            leitor = csv.DictReader(arquivo, delimiter=options['delimitador'])
+            for dados in leitor:
+                try:
+                    linhas.append(self.converter(leitor.line_num, dados))
+                except LinhaRejeitada as erro:
+                    rejeitadas += 1
+                    if rejeitadas <= 10:
+                        self.stderr.write(f'⚠️  linha {leitor.line_num}: {erro}')
+
+        self.stdout.write(self.style.HTTP_INFO(f'📦 Programando {len(linhas)} preço(s) de "{options["campanha"]}"...'))
+        tempo = time.perf_counter()
+        gravados, ignorados = programar(linhas, options['campanha'], inicio, fim)
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {gravados} preço(s) programado(s) em {time.perf_counter() - tempo:.1f}s | '
+            f'SKUs não encontrados: {ignorados} | rejeitadas: {rejeitadas}'
+        ))
+        self.stdout.write('   Os preços entram em vigor na próxima execução de aplicar_precos')
+
+    def converter(self, numero, dados):
+        sku = texto(dados.get('sku'))
+        if not sku:
+            raise LinhaRejeitada('sku obrigatório')
+        preco = decimal(dados.get('preco'), 'preco')
+        promocional = decimal(dados.get('preco_promocional'), 'preco_promocional')
+        if (preco is not None and preco <= 0) or (promocional is not None and promocional <= 0):
+            raise LinhaRejeitada('preços devem ser maiores que zero')
+        if preco is None and promocional is None:
+            raise LinhaRejeitada('informe preco e/ou preco_promocional')
+        return numero, sku[:64], preco, promocional
+
+
+def data_hora(valor, opcao):
+    try:
+        momento = datetime.fromisoformat(valor)
+    except ValueError:
+        raise CommandError(f'{opcao} deve estar no formato AAAA-MM-DD HH:MM')
+    if timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    return momento
@@ -0,0 +1,88 @@
+# produtos/management/commands/verificar_catalogo_colunar.py
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from produtos import colunar
+from produtos.filters import ProdutoFilter
+from produtos.models import Categoria, Produto
+
+
+class Command(BaseCommand):
+    help = 'Compara o catálogo em memória (produtos/colunar.py) com o banco e com as consultas do ORM'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--esperar',
+            type=float,
+            default=0,
+            help='Segundos entre a leitura completa e a atualização incremental conferida',
+        )
+        parser.add_argument('--consultas', type=int, default=30, help='Listagens sorteadas comparadas com o ORM')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        catalogo = colunar.Catalogo.carregar()
+        self.stdout.write(self.style.HTTP_INFO(
+            f'📦 {len(catalogo)} produtos em {time.perf_counter() - inicio:.2f}s '
+            f'({catalogo.memoria / 1024 / 1024:.1f} MB)'
+        ))
+        if options['esperar']:
+            time.sleep(options['esperar'])
+            inicio = time.perf_counter()
+            catalogo = catalogo.atualizado()
+            self.stdout.write(f'   Atualização incremental: {time.perf_counter() - inicio:.3f}s ({len(catalogo)} produtos)')
+
+        faltando, sobrando, diferentes = colunar.divergencias(catalogo)
+        for nome, ids in [('faltando', faltando), ('sobrando', sobrando), ('com colunas diferentes', diferentes)]:
+            if ids:
+                self.stdout.write(self.style.WARNING(
+                    f'⚠️  {len(ids)} produto(s) {nome}: {", ".join(map(str, ids[:20]))}{" ..." if len(ids) > 20 else ""}'
+                ))
+
+        erros = sum(self.comparar(catalogo, consulta) for consulta in self.sortear(options['consultas']))
+        if faltando or sobrando or diferentes or erros:
+            self.stdout.write(self.style.ERROR(f'❌ Snapshot divergente ({erros} consulta(s) diferente(s) do ORM)'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'✓ Snapshot igual ao banco e {options["consultas"]} consulta(s) iguais ao ORM'))
+
+    def sortear(self, quantidade):
+        """Parâmetros de listagem sorteados (filtros, ordenação e página)"""
+        rng = random.Random(42)
+        categorias = list(Categoria.objects.values_list('id', 'slug'))
+        for _ in range(quantidade):
+            parametros = {}
+            if categorias and rng.random() < 0.4:
+                categoria_id, slug = rng.choice(categorias)
+                parametros['categoria' if rng.random() < 0.5 else 'categoria_slug'] = categoria_id if rng.random() < 0.5 else slug
+            if rng.random() < 0.3:
+                parametros['preco_min'] = rng.choice(['0', '10', '49.99', '100.005'])
+            if rng.random() < 0.3:
+                parametros['preco_max'] = rng.choice(['50', '99.90', '500', '1000.001'])
+            for filtro in ['em_promocao', 'em_destaque', 'em_estoque']:
+                if rng.random() < 0.2:
+                    parametros[filtro] = rng.choice(['true', 'false'])
+            campo = rng.choice(['criado_em', 'preco_final', 'vendas'])
+            yield parametros, f'{rng.choice(["", "-"])}{campo}', rng.choice([0, 0, 1, 5])
+
+    def comparar(self, catalogo, consulta, tamanho=20):
+        parametros, ordenacao, pagina = consulta
+        base = Produto.objects.filter(ativo=True, disponivel=True)
+        filterset = ProdutoFilter({chave: str(valor) for chave, valor in parametros.items()}, queryset=base)
+        if not filterset.is_valid():
+            return 0
+        filtros, campo, decrescente = colunar.consulta(filterset.form.cleaned_data, [ordenacao])
+        posicoes = catalogo.consultar(filtros, campo, decrescente)
+        fatia = slice(pagina * tamanho, (pagina + 1) * tamanho)
+        ids = catalogo.colunas['id'][posicoes[fatia]].tolist()
+
+        sinal = '-' if decrescente else ''
+        queryset = filterset.qs.order_by(f'{sinal}{campo}', f'{sinal}id')
+        total, ids_orm = queryset.count(), list(queryset.values_list('id', flat=True)[fatia])
+        if len(posicoes) == total and ids == ids_orm:
+            return 0
+        self.stdout.write(self.style.WARNING(
+            f'⚠️  {parametros} ordering={ordenacao} página {pagina}: {len(posicoes)} x {total} (ORM)'
+        ))
+        return 1
@@ -0,0 +1,37 @@
+# produtos/management/commands/verificar_contadores.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from produtos.contadores import corrigir, divergencias
+
+
+class Command(BaseCommand):
+    help = 'Compara os contadores de produtos das categorias com uma contagem completa (e corrige com --corrigir)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corrigir', action='store_true', help='Regrava os contadores divergentes')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        diferentes = divergencias()
+        for categoria_id, nome, gravados, reais in diferentes[:20]:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️  #{categoria_id} {nome}: ativos/disponíveis/em estoque '
+                f'{"/".join(map(str, gravados))} (real: {"/".join(map(str, reais))})'
+            ))
+        if len(diferentes) > 20:
+            self.stdout.write(self.style.WARNING(f'   ... e mais {len(diferentes) - 20} categoria(s)'))
+
+        if not diferentes:
+            self.stdout.write(self.style.SUCCESS(f'✓ Contadores corretos ({time.perf_counter() - inicio:.2f}s)'))
+            return
+
+        if not options['corrigir']:
+            self.stdout.write(self.style.ERROR(f'❌ {len(diferentes)} categoria(s) divergente(s); use --corrigir'))
+            return
+
+        corrigidas = corrigir()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {len(corrigidas)} categoria(s) corrigida(s) em {time.perf_counter() - inicio:.2f}s'
+        ))
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.1 on 2026-10-18 02:28
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import produtos.models
+from django.contrib.postgres.operations import UnaccentExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0001_initial'),
+    ]
+
+    operations = [
+        UnaccentExtension(),
+        # unaccent() é STABLE; colunas geradas e índices exigem uma função IMMUTABLE
+        migrations.RunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION produtos_unaccent(text) RETURNS text
+                LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+                AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$;
+            """,
+            reverse_sql="DROP FUNCTION IF EXISTS produtos_unaccent(text);",
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='busca',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector(produtos.models.Unaccent('nome'), config='portuguese', weight='A'), '||', django.contrib.postgres.search.SearchVector(produtos.models.Unaccent('descricao_curta'), config='portuguese', weight='B'), django.contrib.postgres.search.SearchConfig('portuguese')), '||', django.contrib.postgres.search.SearchVector(produtos.models.Unaccent('meta_keywords'), config='portuguese', weight='C'), django.contrib.postgres.search.SearchConfig('portuguese')), '||', django.contrib.postgres.search.SearchVector(produtos.models.Unaccent('descricao'), config='portuguese', weight='D'), django.contrib.postgres.search.SearchConfig('portuguese')), output_field=django.contrib.postgres.search.SearchVectorField(), verbose_name='Documento de busca'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['busca'], name='produtos_pr_busca_gin'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-18 02:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0002_busca_textual'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(('ativo', True), ('disponivel', True)), fields=['-criado_em', '-id'], name='produtos_pr_vitrine_recentes'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(('ativo', True), ('disponivel', True)), fields=['preco', 'id'], name='produtos_pr_vitrine_preco'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(('ativo', True), ('disponivel', True)), fields=['-vendas', '-id'], name='produtos_pr_vitrine_vendas'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(('ativo', True), ('disponivel', True)), fields=['categoria', '-criado_em', '-id'], name='produtos_pr_categoria_recentes'),
+        ),
+    ]
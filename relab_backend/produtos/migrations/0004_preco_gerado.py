@@ -0,0 +1,48 @@
+# Generated by Django 5.0.1 on 2026-10-18 02:37
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+import django.db.models.functions.math
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0003_paginacao_cursor'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='produto',
+            name='produtos_pr_vitrine_preco',
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='desconto_percentual',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(preco_promocional__lt=models.F('preco'), then=django.db.models.functions.math.Round(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('preco'), '-', models.F('preco_promocional')), '*', models.Value(100)), '/', models.F('preco')), 2)), default=models.Value(Decimal('0.00'))), output_field=models.DecimalField(decimal_places=2, max_digits=5), verbose_name='Desconto (%)'),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='em_promocao',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(preco_promocional__lt=models.F('preco'), then=models.Value(True)), default=models.Value(False)), output_field=models.BooleanField(), verbose_name='Em Promoção'),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='preco_final',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.comparison.Coalesce(django.db.models.functions.comparison.NullIf('preco_promocional', models.Value(0)), 'preco'), help_text='Preço promocional se existir, senão o preço normal', output_field=models.DecimalField(decimal_places=2, max_digits=10), verbose_name='Preço Final'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(('ativo', True), ('disponivel', True)), fields=['preco_final', 'id'], name='produtos_pr_vitrine_preco'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(('ativo', True), ('disponivel', True), ('em_promocao', True)), fields=['-desconto_percentual', '-id'], name='produtos_pr_vitrine_desconto'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(('ativo', True), ('disponivel', True), ('em_promocao', True)), fields=['-criado_em', '-id'], name='produtos_pr_vitrine_promocoes'),
+        ),
+    ]
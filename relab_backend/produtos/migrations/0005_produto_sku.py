@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 02:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0004_preco_gerado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produto',
+            name='sku',
+            field=models.CharField(blank=True, help_text='Código do produto no fornecedor (chave da importação em massa)', max_length=64, null=True, unique=True, verbose_name='SKU'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-18 02:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0005_produto_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagemproduto',
+            name='imagem_derivados',
+            field=models.JSONField(blank=True, db_default=models.Value({}, models.JSONField()), default=dict, editable=False, verbose_name='Derivados da imagem'),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='imagem_derivados',
+            field=models.JSONField(blank=True, db_default=models.Value({}, models.JSONField()), default=dict, editable=False, help_text='Miniaturas WebP/JPEG geradas a partir da imagem (ver produtos/imagens.py)', verbose_name='Derivados da imagem'),
+        ),
+    ]
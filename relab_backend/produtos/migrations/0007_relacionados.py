@@ -0,0 +1,66 @@
+# Generated by Django 5.0.1 on 2026-10-18 03:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0006_imagem_derivados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarcaProcessamento',
+            fields=[
+                ('nome', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('valor', models.BigIntegerField(default=0)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Marca de processamento',
+                'verbose_name_plural': 'Marcas de processamento',
+            },
+        ),
+        migrations.CreateModel(
+            name='CoocorrenciaProduto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pedidos', models.IntegerField(default=0)),
+                ('produto_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='produtos.produto')),
+                ('produto_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='produtos.produto')),
+            ],
+            options={
+                'verbose_name': 'Coocorrência de produtos',
+                'verbose_name_plural': 'Coocorrências de produtos',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProdutoRelacionado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Score')),
+                ('pedidos', models.IntegerField(verbose_name='Pedidos em comum')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='relacionados', to='produtos.produto', verbose_name='Produto')),
+                ('relacionado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='relacionado_de', to='produtos.produto', verbose_name='Relacionado')),
+            ],
+            options={
+                'verbose_name': 'Produto relacionado',
+                'verbose_name_plural': 'Produtos relacionados',
+                'ordering': ['produto', '-score'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='coocorrenciaproduto',
+            constraint=models.UniqueConstraint(fields=('produto_a', 'produto_b'), name='produtos_coocorrencia_par'),
+        ),
+        migrations.AddIndex(
+            model_name='produtorelacionado',
+            index=models.Index(fields=['produto', '-score'], name='produtos_relacionado_top'),
+        ),
+        migrations.AddConstraint(
+            model_name='produtorelacionado',
+            constraint=models.UniqueConstraint(fields=('produto', 'relacionado'), name='produtos_relacionado_par'),
+        ),
+    ]
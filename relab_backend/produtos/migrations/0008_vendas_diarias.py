@@ -0,0 +1,36 @@
+# Generated by Django 5.0.1 on 2026-10-18 03:05
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0007_relacionados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(verbose_name='Data')),
+                ('unidades', models.IntegerField(default=0, verbose_name='Unidades')),
+                ('receita', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Receita')),
+                ('pedidos', models.IntegerField(default=0, verbose_name='Pedidos')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vendas_diarias', to='produtos.produto', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Venda diária',
+                'verbose_name_plural': 'Vendas diárias',
+                'ordering': ['-data', '-unidades'],
+                'indexes': [models.Index(fields=['data', 'produto'], include=('unidades',), name='produtos_venda_diaria_janela')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='vendadiaria',
+            constraint=models.UniqueConstraint(fields=('produto', 'data'), name='produtos_venda_diaria_dia'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-18 03:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0008_vendas_diarias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produto',
+            name='tendencia',
+            field=models.FloatField(db_default=models.Value(0), default=0, editable=False, verbose_name='Tendência'),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='tendencia_vendas',
+            field=models.IntegerField(db_default=models.Value(0), default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='tendencia_visualizacoes',
+            field=models.IntegerField(db_default=models.Value(0), default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(('ativo', True), ('disponivel', True), ('tendencia__gt', 0)), fields=['-tendencia', '-id'], name='produtos_pr_vitrine_tendencia'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-18 03:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0009_tendencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecoProduto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('preco', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Preço')),
+                ('preco_promocional', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Preço Promocional')),
+                ('valido_de', models.DateTimeField(verbose_name='Válido de')),
+                ('valido_ate', models.DateTimeField(blank=True, null=True, verbose_name='Válido até')),
+                ('campanha', models.CharField(blank=True, help_text='Vazio no preço base e nas alterações feitas direto no produto', max_length=100, verbose_name='Campanha')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precos', to='produtos.produto', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Preço programado',
+                'verbose_name_plural': 'Preços programados',
+                'ordering': ['produto', '-valido_de'],
+                'indexes': [models.Index(fields=['produto', '-valido_de', '-id'], name='produtos_preco_vigente'), models.Index(fields=['valido_de'], name='produtos_preco_inicio'), models.Index(fields=['valido_ate'], name='produtos_preco_fim'), models.Index(fields=['criado_em'], name='produtos_preco_criado'), models.Index(fields=['campanha'], name='produtos_preco_campanha')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='precoproduto',
+            constraint=models.CheckConstraint(check=models.Q(('valido_ate__isnull', True), ('valido_ate__gt', models.F('valido_de')), _connector='OR'), name='produtos_preco_intervalo'),
+        ),
+    ]
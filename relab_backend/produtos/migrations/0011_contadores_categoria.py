@@ -0,0 +1,116 @@
+# Generated by Django 5.0.1 on 2026-10-18 03:18
+
+from django.db import migrations, models
+
+# Contribuição de cada linha de produto aos contadores da categoria
+LINHAS = """
+    SELECT categoria_id,
+           {sinal}ativo::int AS ativos,
+           {sinal}(ativo AND disponivel)::int AS disponiveis,
+           {sinal}(ativo AND disponivel AND estoque > 0)::int AS em_estoque
+    FROM {tabela}
+"""
+
+
+def somar(*tabelas):
+    """Soma as diferenças por categoria (em ordem de id, para não haver deadlock entre transações)"""
+    linhas = ' UNION ALL '.join(LINHAS.format(sinal=sinal, tabela=tabela) for sinal, tabela in tabelas)
+    return f"""
+        FOR delta IN
+            SELECT categoria_id, SUM(ativos) AS ativos, SUM(disponiveis) AS disponiveis, SUM(em_estoque) AS em_estoque
+            FROM ({linhas}) AS linhas
+            WHERE categoria_id IS NOT NULL
+            GROUP BY categoria_id
+            HAVING SUM(ativos) <> 0 OR SUM(disponiveis) <> 0 OR SUM(em_estoque) <> 0
+            ORDER BY categoria_id
+        LOOP
+            UPDATE produtos_categoria SET
+                produtos_ativos = produtos_ativos + delta.ativos,
+                produtos_disponiveis = produtos_disponiveis + delta.disponiveis,
+                produtos_em_estoque = produtos_em_estoque + delta.em_estoque
+            WHERE id = delta.categoria_id;
+        END LOOP;
+    """
+
+
+# Triggers de statement com transition tables: um UPDATE de 50 mil produtos
+# faz uma soma por categoria, não 50 mil UPDATEs em produtos_categoria
+FUNCAO = f"""
+    CREATE OR REPLACE FUNCTION produtos_contadores_categoria() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        delta record;
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            {somar(('', 'novos'))}
+        ELSIF TG_OP = 'DELETE' THEN
+            {somar(('-', 'velhos'))}
+        ELSE
+            {somar(('', 'novos'), ('-', 'velhos'))}
+        END IF;
+        RETURN NULL;
+    END
+    $$;
+
+    CREATE TRIGGER produtos_contadores_insert AFTER INSERT ON produtos_produto
+        REFERENCING NEW TABLE AS novos
+        FOR EACH STATEMENT EXECUTE FUNCTION produtos_contadores_categoria();
+    CREATE TRIGGER produtos_contadores_update AFTER UPDATE ON produtos_produto
+        REFERENCING OLD TABLE AS velhos NEW TABLE AS novos
+        FOR EACH STATEMENT EXECUTE FUNCTION produtos_contadores_categoria();
+    CREATE TRIGGER produtos_contadores_delete AFTER DELETE ON produtos_produto
+        REFERENCING OLD TABLE AS velhos
+        FOR EACH STATEMENT EXECUTE FUNCTION produtos_contadores_categoria();
+"""
+
+REMOVER = """
+    DROP TRIGGER IF EXISTS produtos_contadores_insert ON produtos_produto;
+    DROP TRIGGER IF EXISTS produtos_contadores_update ON produtos_produto;
+    DROP TRIGGER IF EXISTS produtos_contadores_delete ON produtos_produto;
+    DROP FUNCTION IF EXISTS produtos_contadores_categoria();
+"""
+
+# Valores iniciais (a tabela fica bloqueada para escrita até o fim da migração)
+PREENCHER = """
+    LOCK TABLE produtos_produto IN SHARE MODE;
+    UPDATE produtos_categoria c SET
+        produtos_ativos = r.ativos,
+        produtos_disponiveis = r.disponiveis,
+        produtos_em_estoque = r.em_estoque
+    FROM (
+        SELECT categoria_id,
+               COUNT(*) FILTER (WHERE ativo) AS ativos,
+               COUNT(*) FILTER (WHERE ativo AND disponivel) AS disponiveis,
+               COUNT(*) FILTER (WHERE ativo AND disponivel AND estoque > 0) AS em_estoque
+        FROM produtos_produto
+        WHERE categoria_id IS NOT NULL
+        GROUP BY categoria_id
+    ) AS r
+    WHERE r.categoria_id = c.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0010_precos_programados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoria',
+            name='produtos_ativos',
+            field=models.IntegerField(db_default=models.Value(0), default=0, editable=False, verbose_name='Produtos ativos'),
+        ),
+        migrations.AddField(
+            model_name='categoria',
+            name='produtos_disponiveis',
+            field=models.IntegerField(db_default=models.Value(0), default=0, editable=False, help_text='Ativos e disponíveis', verbose_name='Produtos disponíveis'),
+        ),
+        migrations.AddField(
+            model_name='categoria',
+            name='produtos_em_estoque',
+            field=models.IntegerField(db_default=models.Value(0), default=0, editable=False, help_text='Ativos, disponíveis e com estoque', verbose_name='Produtos em estoque'),
+        ),
+        migrations.RunSQL(sql=FUNCAO + PREENCHER, reverse_sql=REMOVER),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.1 on 2026-10-18 03:27
+
+from django.db import migrations, models
+
+# Colunas lidas pelo catálogo em memória (preco_final e em_promocao vêm de preco/preco_promocional).
+# UPDATEs que não as tocam (visualizações, tendência, imagens) não disparam o trigger.
+COLUNAS = 'preco, preco_promocional, estoque, ativo, disponivel, em_destaque, categoria_id, vendas, criado_em'
+
+# Cada linha gravada recebe o id da transação: o catálogo relê as linhas com
+# versao_catalogo >= xmin do snapshot da leitura anterior (ver produtos/colunar.py)
+FUNCAO = f"""
+    CREATE OR REPLACE FUNCTION produtos_versao_catalogo() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.versao_catalogo := pg_current_xact_id()::text::bigint;
+        RETURN NEW;
+    END
+    $$;
+
+    CREATE TRIGGER produtos_versao_catalogo BEFORE INSERT OR UPDATE OF {COLUNAS} ON produtos_produto
+        FOR EACH ROW EXECUTE FUNCTION produtos_versao_catalogo();
+"""
+
+REMOVER = """
+    DROP TRIGGER IF EXISTS produtos_versao_catalogo ON produtos_produto;
+    DROP FUNCTION IF EXISTS produtos_versao_catalogo();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0011_contadores_categoria'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produto',
+            name='versao_catalogo',
+            field=models.BigIntegerField(db_default=models.Value(0), db_index=True, default=0, editable=False),
+        ),
+        migrations.RunSQL(sql=FUNCAO, reverse_sql=REMOVER),
+    ]
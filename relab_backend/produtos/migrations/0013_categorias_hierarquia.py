@@ -0,0 +1,30 @@
+# Generated by Django 5.0.1 on 2026-10-18 03:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0012_catalogo_colunar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoria',
+            name='caminho',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='Caminho'),
+        ),
+        migrations.AddField(
+            model_name='categoria',
+            name='pai',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='subcategorias', to='produtos.categoria', verbose_name='Categoria pai'),
+        ),
+        # As categorias existentes viram raízes
+        migrations.RunSQL(sql="UPDATE produtos_categoria SET caminho = id || '/'", reverse_sql=migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='categoria',
+            index=models.Index(fields=['caminho'], name='produtos_ca_caminho', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.1 on 2026-10-18 03:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0013_categorias_hierarquia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.PositiveIntegerField(verbose_name='Quantidade')),
+                ('dono_tipo', models.CharField(choices=[('carrinho', 'Carrinho'), ('pedido', 'Pedido')], max_length=10, verbose_name='Tipo do dono')),
+                ('dono_id', models.BigIntegerField(verbose_name='Dono')),
+                ('expira_em', models.DateTimeField(verbose_name='Expira em')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='produtos.produto', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Reserva de estoque',
+                'verbose_name_plural': 'Reservas de estoque',
+                'indexes': [models.Index(condition=models.Q(('dono_tipo', 'carrinho')), fields=['produto', 'expira_em'], include=('quantidade', 'dono_id'), name='produtos_reserva_ativa'), models.Index(fields=['expira_em'], name='produtos_reserva_expira')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reservaestoque',
+            constraint=models.UniqueConstraint(fields=('dono_tipo', 'dono_id', 'produto'), name='produtos_reserva_dono'),
+        ),
+    ]
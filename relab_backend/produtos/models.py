@@ -1,12 +1,62 @@
-from django.db import models
+import re
+
+from django.core.exceptions import ValidationError
+from django.db import connection, models, transaction
+from django.utils import timezone
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, SearchVectorField
+from django.db.models.functions import Coalesce, NullIf, Round
 from decimal import Decimal
 
+from .visualizacoes import contador as contador_visualizacoes
+
+
+# Configuração de texto do PostgreSQL usada pela busca
+CONFIG_BUSCA = 'portuguese'
+
+
+class Unaccent(models.Func):
+    """
+    Remove acentos no banco (wrapper IMMUTABLE de unaccent, criado na migração
+    0002, necessário para uso em colunas geradas)
+    """
+    function = 'produtos_unaccent'
+    output_field = models.TextField()
+
+
+def documento_busca():
+    """Documento de busca ponderado: nome > descricao_curta > meta_keywords > descricao"""
+    pesos = [
+        ('nome', 'A'),
+        ('descricao_curta', 'B'),
+        ('meta_keywords', 'C'),
+        ('descricao', 'D'),
+    ]
+    vetores = [
+        SearchVector(Unaccent(campo), config=CONFIG_BUSCA, weight=peso)
+        for campo, peso in pesos
+    ]
+    documento = vetores[0]
+    for vetor in vetores[1:]:
+        documento = documento + vetor
+    return documento
+
 
 class Categoria(models.Model):
     nome = models.CharField(max_length=100, unique=True, verbose_name="Nome")
     slug = models.SlugField(max_length=100, unique=True, verbose_name="Slug")
+    pai = models.ForeignKey(
+        'self',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='subcategorias',
+        verbose_name="Categoria pai"
+    )
+    # Ids da raiz até a categoria, ex.: "6/12/31/" (mantido pelo save(); subárvore = prefixo)
+    caminho = models.CharField(max_length=255, default='', editable=False, verbose_name="Caminho")
     descricao = models.TextField(blank=True, verbose_name="Descrição")
     imagem = models.ImageField(upload_to='categorias/', null=True, blank=True, verbose_name="Imagem")
     ativo = models.BooleanField(default=True, verbose_name="Ativo")
@@ -14,30 +64,155 @@ class Categoria(models.Model):
     criado_em = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
     atualizado_em = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
 
+    # Contadores de produtos mantidos por triggers em produtos_produto (ver produtos/contadores.py)
+    produtos_ativos = models.IntegerField(default=0, db_default=0, editable=False, verbose_name="Produtos ativos")
+    produtos_disponiveis = models.IntegerField(
+        default=0,
+        db_default=0,
+        editable=False,
+        verbose_name="Produtos disponíveis",
+        help_text="Ativos e disponíveis"
+    )
+    produtos_em_estoque = models.IntegerField(
+        default=0,
+        db_default=0,
+        editable=False,
+        verbose_name="Produtos em estoque",
+        help_text="Ativos, disponíveis e com estoque"
+    )
+
+    CAMPOS_CONTADORES = ['produtos_ativos', 'produtos_disponiveis', 'produtos_em_estoque']
+
     def save(self, *args, **kwargs):
         # Gera slug automaticamente se não existir
         if not self.slug:
             self.slug = slugify(self.nome)
-        super().save(*args, **kwargs)
+
+        # Os contadores e o caminho são do banco: um UPDATE não pode gravar os valores lidos antes
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in [*self.CAMPOS_CONTADORES, 'caminho']
+            ]
+
+        self.validar_pai(self.pai)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.atualizar_caminho()
+
+    def clean(self):
+        super().clean()
+        self.validar_pai(self.pai)
+
+    def validar_pai(self, pai):
+        """A categoria não pode ficar dentro dela mesma ou de uma subcategoria"""
+        if pai is None or self.pk is None:
+            return
+        caminho = Categoria.objects.filter(pk=self.pk).values_list('caminho', flat=True).first()
+        if caminho and Categoria.objects.filter(pk=pai.pk, caminho__startswith=caminho).exists():
+            raise ValidationError({'pai': 'A categoria não pode ficar dentro dela mesma ou de uma subcategoria.'})
+
+    def atualizar_caminho(self):
+        """Grava o caminho a partir do pai e, se a categoria mudou de lugar, o das descendentes"""
+        tabela = self._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH atual AS (SELECT caminho FROM {tabela} WHERE id = %s FOR UPDATE),
+                     novo AS (SELECT COALESCE((SELECT caminho FROM {tabela} WHERE id = %s), '') || %s || '/' AS caminho)
+                UPDATE {tabela} c SET caminho = novo.caminho || substr(c.caminho, length(atual.caminho) + 1)
+                FROM atual, novo
+                WHERE novo.caminho <> atual.caminho
+                  AND (c.id = %s OR (atual.caminho <> '' AND c.caminho LIKE atual.caminho || '%%'))
+                """,
+                [self.pk, self.pai_id, self.pk, self.pk]
+            )
+        self.caminho = Categoria.objects.filter(pk=self.pk).values_list('caminho', flat=True).get()
+
+    @property
+    def nivel(self):
+        """Profundidade na árvore (0 = raiz)"""
+        return max(self.caminho.count('/') - 1, 0)
 
     @property
     def total_produtos(self):
-        """Retorna o total de produtos ativos na categoria"""
-        return self.produtos.filter(ativo=True, disponivel=True).count()
+        """Retorna o total de produtos ativos e disponíveis na categoria"""
+        return self.produtos_disponiveis
 
     class Meta:
         verbose_name = "Categoria"
         verbose_name_plural = "Categorias"
         ordering = ['ordem', 'nome']
+        indexes = [
+            # Subárvore por prefixo (caminho LIKE '6/12/%') com qualquer collation
+            models.Index(fields=['caminho'], name='produtos_ca_caminho', opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return self.nome
 
 
+class ProdutoQuerySet(models.QuerySet):
+
+    def buscar(self, termo):
+        """
+        Busca textual sobre o documento `busca` (índice GIN).
+        Cada palavra do termo casa por prefixo ("note" encontra "notebook")
+        e o resultado é anotado com `relevancia`.
+        """
+        palavras = re.findall(r'\w+', termo or '')
+        if not palavras:
+            return self.none()
+
+        consulta = SearchQuery(
+            Unaccent(models.Value(' & '.join(f'{palavra}:*' for palavra in palavras))),
+            config=CONFIG_BUSCA,
+            search_type='raw'
+        )
+        return self.filter(busca=consulta).annotate(
+            relevancia=SearchRank(models.F('busca'), consulta)
+        )
+
+    def na_categoria(self, caminho):
+        """Produtos da categoria com esse caminho e das subcategorias (JOIN pelo prefixo do caminho)"""
+        return self.filter(categoria__caminho__startswith=caminho)
+
+    def com_estoque_disponivel(self, carrinho_id=None):
+        """
+        Anota `estoque_disponivel`: estoque menos as reservas ativas de
+        carrinhos (exceto as do próprio `carrinho_id`). Uma soma por produto
+        sobre o índice parcial de ReservaEstoque.
+        """
+        reservado = ReservaEstoque.objects.ativas().filter(
+            dono_tipo=ReservaEstoque.CARRINHO, produto=models.OuterRef('pk')
+        )
+        if carrinho_id is not None:
+            reservado = reservado.exclude(dono_id=carrinho_id)
+        reservado = reservado.order_by().values('produto').annotate(total=models.Sum('quantidade')).values('total')
+        return self.annotate(
+            estoque_disponivel=models.F('estoque') - Coalesce(models.Subquery(reservado), 0)
+        )
+
+
+class ProdutoManager(models.Manager.from_queryset(ProdutoQuerySet)):
+
+    def get_queryset(self):
+        # O documento de busca só é usado no WHERE/ORDER BY, nunca precisa ser carregado
+        return super().get_queryset().defer('busca')
+
+
 class Produto(models.Model):
     # Informações básicas
     nome = models.CharField(max_length=255, verbose_name="Nome")
     slug = models.SlugField(max_length=255, unique=True, blank=True, verbose_name="Slug")
+    sku = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name="SKU",
+        help_text="Código do produto no fornecedor (chave da importação em massa)"
+    )
     descricao_curta = models.CharField(
         max_length=255,
         blank=True,
@@ -108,6 +283,14 @@ class Produto(models.Model):
         blank=True,
         verbose_name="Imagem"
     )
+    imagem_derivados = models.JSONField(
+        default=dict,
+        db_default=models.Value({}, models.JSONField()),
+        blank=True,
+        editable=False,
+        verbose_name="Derivados da imagem",
+        help_text="Miniaturas WebP/JPEG geradas a partir da imagem (ver produtos/imagens.py)"
+    )
 
     # SEO
     meta_description = models.CharField(
@@ -127,10 +310,62 @@ class Produto(models.Model):
     visualizacoes = models.IntegerField(default=0, editable=False, verbose_name="Visualizações")
     vendas = models.IntegerField(default=0, editable=False, verbose_name="Vendas")
 
+    # Tendência: visualizações e vendas recentes com decaimento exponencial (ver produtos/tendencia.py)
+    tendencia = models.FloatField(default=0, db_default=0, editable=False, verbose_name="Tendência")
+    # Contadores na última atualização da tendência (o que passar disso é evento novo)
+    tendencia_visualizacoes = models.IntegerField(default=0, db_default=0, editable=False)
+    tendencia_vendas = models.IntegerField(default=0, db_default=0, editable=False)
+
+    # Transação que alterou por último as colunas do catálogo em memória (trigger, ver produtos/colunar.py)
+    versao_catalogo = models.BigIntegerField(default=0, db_default=0, db_index=True, editable=False)
+
     # Timestamps
     criado_em = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
     atualizado_em = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
 
+    # Preço efetivo e promoção (colunas geradas pelo PostgreSQL, filtráveis e ordenáveis)
+    preco_final = models.GeneratedField(
+        expression=Coalesce(NullIf('preco_promocional', models.Value(0)), 'preco'),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        db_persist=True,
+        verbose_name="Preço Final",
+        help_text="Preço promocional se existir, senão o preço normal"
+    )
+    em_promocao = models.GeneratedField(
+        expression=models.Case(
+            models.When(preco_promocional__lt=models.F('preco'), then=models.Value(True)),
+            default=models.Value(False)
+        ),
+        output_field=models.BooleanField(),
+        db_persist=True,
+        verbose_name="Em Promoção"
+    )
+    desconto_percentual = models.GeneratedField(
+        expression=models.Case(
+            models.When(
+                preco_promocional__lt=models.F('preco'),
+                then=Round((models.F('preco') - models.F('preco_promocional')) * 100 / models.F('preco'), 2)
+            ),
+            default=models.Value(Decimal('0.00'))
+        ),
+        output_field=models.DecimalField(max_digits=5, decimal_places=2),
+        db_persist=True,
+        verbose_name="Desconto (%)"
+    )
+
+    # Busca textual (coluna gerada pelo PostgreSQL, atualizada em qualquer INSERT/UPDATE)
+    busca = models.GeneratedField(
+        expression=documento_busca(),
+        output_field=SearchVectorField(),
+        db_persist=True,
+        verbose_name="Documento de busca"
+    )
+
+    objects = ProdutoManager()
+
+    CAMPOS_PRECO_GERADOS = ['preco_final', 'em_promocao', 'desconto_percentual']
+    CAMPOS_TENDENCIA = ['tendencia', 'tendencia_visualizacoes', 'tendencia_vendas']
+
     def save(self, *args, **kwargs):
         """Gera slug automaticamente baseado no nome se não existir"""
         if not self.slug:
@@ -145,12 +380,45 @@ class Produto(models.Model):
 
             self.slug = slug
 
+        atualizando = self.pk is not None and not self._state.adding
+        if atualizando and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # Com `busca` adiada (ProdutoManager), o Django 5.0 a buscaria só para o pre_save
+            # de uma coluna gerada que nem entra no UPDATE
+            adiados = self.get_deferred_fields()
+            if adiados:
+                kwargs['update_fields'] = [
+                    campo.attname for campo in self._meta.concrete_fields
+                    if not campo.primary_key and not campo.generated and campo.attname not in adiados
+                ]
+        precos = self._precos()
         super().save(*args, **kwargs)
 
-    @property
-    def preco_final(self):
-        """Retorna o preço promocional se existir, senão o preço normal"""
-        return self.preco_promocional if self.preco_promocional else self.preco
+        # Em UPDATE o PostgreSQL recalcula as colunas geradas, mas a instância mantém os valores antigos
+        update_fields = kwargs.get('update_fields')
+        preco_alterado = precos != getattr(self, '_precos_carregados', None)
+        if atualizando and preco_alterado and (
+            update_fields is None or {'preco', 'preco_promocional'} & set(update_fields)
+        ):
+            self.refresh_from_db(fields=self.CAMPOS_PRECO_GERADOS)
+            # Preço alterado direto no produto entra no histórico (se o produto tiver programação)
+            from .precos import registrar_alteracoes
+            registrar_alteracoes([self.pk])
+        self._precos_carregados = precos
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        produto = super().from_db(db, field_names, values)
+        # Preços como vieram do banco: save() só recarrega as colunas geradas se mudarem
+        produto._precos_carregados = produto._precos()
+        return produto
+
+    def _precos(self):
+        """(preco, preco_promocional) carregados, sem buscar campos adiados"""
+        return self.__dict__.get('preco', models.DEFERRED), self.__dict__.get('preco_promocional', models.DEFERRED)
+
+    def incrementar_visualizacoes(self):
+        """Registra uma visualização (gravada em lote, ver produtos/visualizacoes.py)"""
+        contador_visualizacoes.registrar(self.pk)
 
     @property
     def tem_estoque(self):
@@ -162,19 +430,6 @@ class Produto(models.Model):
         """Verifica se o estoque está abaixo do mínimo"""
         return self.estoque <= self.estoque_minimo
 
-    @property
-    def em_promocao(self):
-        """Verifica se o produto está em promoção"""
-        return self.preco_promocional is not None and self.preco_promocional < self.preco
-
-    @property
-    def desconto_percentual(self):
-        """Calcula o percentual de desconto"""
-        if not self.em_promocao:
-            return 0
-        desconto = ((self.preco - self.preco_promocional) / self.preco) * 100
-        return round(desconto, 2)
-
     @property
     def disponivel_venda(self):
         """Verifica se o produto está disponível para venda"""
@@ -188,6 +443,43 @@ class Produto(models.Model):
             models.Index(fields=['slug']),
             models.Index(fields=['ativo', 'disponivel']),
             models.Index(fields=['-criado_em']),
+            GinIndex(fields=['busca'], name='produtos_pr_busca_gin'),
+            # Índices da paginação por cursor (ordenação + desempate por id) na vitrine
+            models.Index(
+                fields=['-criado_em', '-id'],
+                name='produtos_pr_vitrine_recentes',
+                condition=models.Q(ativo=True, disponivel=True)
+            ),
+            models.Index(
+                fields=['preco_final', 'id'],
+                name='produtos_pr_vitrine_preco',
+                condition=models.Q(ativo=True, disponivel=True)
+            ),
+            models.Index(
+                fields=['-desconto_percentual', '-id'],
+                name='produtos_pr_vitrine_desconto',
+                condition=models.Q(ativo=True, disponivel=True, em_promocao=True)
+            ),
+            models.Index(
+                fields=['-criado_em', '-id'],
+                name='produtos_pr_vitrine_promocoes',
+                condition=models.Q(ativo=True, disponivel=True, em_promocao=True)
+            ),
+            models.Index(
+                fields=['-vendas', '-id'],
+                name='produtos_pr_vitrine_vendas',
+                condition=models.Q(ativo=True, disponivel=True)
+            ),
+            models.Index(
+                fields=['-tendencia', '-id'],
+                name='produtos_pr_vitrine_tendencia',
+                condition=models.Q(ativo=True, disponivel=True, tendencia__gt=0)
+            ),
+            models.Index(
+                fields=['categoria', '-criado_em', '-id'],
+                name='produtos_pr_categoria_recentes',
+                condition=models.Q(ativo=True, disponivel=True)
+            ),
         ]
 
     def __str__(self):
@@ -203,6 +495,13 @@ class ImagemProduto(models.Model):
         verbose_name="Produto"
     )
     imagem = models.ImageField(upload_to='produtos/%Y/%m/galeria/', verbose_name="Imagem")
+    imagem_derivados = models.JSONField(
+        default=dict,
+        db_default=models.Value({}, models.JSONField()),
+        blank=True,
+        editable=False,
+        verbose_name="Derivados da imagem"
+    )
     ordem = models.IntegerField(default=0, verbose_name="Ordem")
     criado_em = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
 
@@ -212,4 +511,241 @@ class ImagemProduto(models.Model):
         verbose_name_plural = "Imagens dos Produtos"
 
     def __str__(self):
-        return f"Imagem de {self.produto.nome}"
\ No newline at end of file
+        return f"Imagem de {self.produto.nome}"
+
+class CoocorrenciaProduto(models.Model):
+    """
+    Em quantos pedidos os dois produtos foram comprados juntos (produto_a <= produto_b).
+    Na diagonal (produto_a == produto_b), em quantos pedidos o produto aparece.
+    Mantida de forma incremental pelo comando calcular_relacionados.
+    """
+    produto_a = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='+')
+    produto_b = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='+')
+    pedidos = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Coocorrência de produtos"
+        verbose_name_plural = "Coocorrências de produtos"
+        constraints = [
+            models.UniqueConstraint(fields=['produto_a', 'produto_b'], name='produtos_coocorrencia_par'),
+        ]
+
+
+class ProdutoRelacionado(models.Model):
+    """Produtos mais comprados junto com cada produto (top-K gerado por calcular_relacionados)"""
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.CASCADE,
+        related_name='relacionados',
+        verbose_name="Produto"
+    )
+    relacionado = models.ForeignKey(
+        Produto,
+        on_delete=models.CASCADE,
+        related_name='relacionado_de',
+        verbose_name="Relacionado"
+    )
+    # Similaridade de cosseno entre os pedidos dos dois produtos (0 a 1)
+    score = models.FloatField(verbose_name="Score")
+    pedidos = models.IntegerField(verbose_name="Pedidos em comum")
+
+    class Meta:
+        ordering = ['produto', '-score']
+        verbose_name = "Produto relacionado"
+        verbose_name_plural = "Produtos relacionados"
+        constraints = [
+            models.UniqueConstraint(fields=['produto', 'relacionado'], name='produtos_relacionado_par'),
+        ]
+        indexes = [
+            models.Index(fields=['produto', '-score'], name='produtos_relacionado_top'),
+        ]
+
+    def __str__(self):
+        return f"{self.produto_id} -> {self.relacionado_id} ({self.score:.3f})"
+
+
+class VendaDiaria(models.Model):
+    """
+    Vendas de cada produto por dia do pedido (itens de pedidos não cancelados).
+    Mantida pelo comando atualizar_vendas; base dos rankings de mais vendidos.
+    """
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.CASCADE,
+        related_name='vendas_diarias',
+        verbose_name="Produto"
+    )
+    data = models.DateField(verbose_name="Data")
+    unidades = models.IntegerField(default=0, verbose_name="Unidades")
+    receita = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), verbose_name="Receita")
+    pedidos = models.IntegerField(default=0, verbose_name="Pedidos")
+
+    class Meta:
+        ordering = ['-data', '-unidades']
+        verbose_name = "Venda diária"
+        verbose_name_plural = "Vendas diárias"
+        constraints = [
+            models.UniqueConstraint(fields=['produto', 'data'], name='produtos_venda_diaria_dia'),
+        ]
+        indexes = [
+            # Ranking por janela: só o índice é lido (data, produto, unidades)
+            models.Index(fields=['data', 'produto'], include=['unidades'], name='produtos_venda_diaria_janela'),
+        ]
+
+    def __str__(self):
+        return f"{self.produto_id} em {self.data:%d/%m/%Y}: {self.unidades}"
+
+
+class PrecoProdutoQuerySet(models.QuerySet):
+
+    def no_periodo(self, inicio, fim):
+        """Preços que valeram em algum momento de [inicio, fim)"""
+        return self.filter(
+            models.Q(valido_ate__isnull=True) | models.Q(valido_ate__gt=inicio),
+            valido_de__lt=fim
+        )
+
+
+class PrecoProduto(models.Model):
+    """
+    Programação e histórico de preços. Cada linha vale em [valido_de, valido_ate)
+    (sem fim: até ser substituída); se mais de uma cobre o mesmo instante, vale
+    a de valido_de mais recente. O comando aplicar_precos grava em Produto o
+    preço vigente quando uma linha começa ou termina (ver produtos/precos.py).
+    """
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.CASCADE,
+        related_name='precos',
+        verbose_name="Produto"
+    )
+    preco = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Preço")
+    preco_promocional = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name="Preço Promocional"
+    )
+    valido_de = models.DateTimeField(verbose_name="Válido de")
+    valido_ate = models.DateTimeField(null=True, blank=True, verbose_name="Válido até")
+    campanha = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name="Campanha",
+        help_text="Vazio no preço base e nas alterações feitas direto no produto"
+    )
+    criado_em = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+
+    objects = PrecoProdutoQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['produto', '-valido_de']
+        verbose_name = "Preço programado"
+        verbose_name_plural = "Preços programados"
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(valido_ate__isnull=True) | models.Q(valido_ate__gt=models.F('valido_de')),
+                name='produtos_preco_intervalo'
+            ),
+        ]
+        indexes = [
+            # Preço vigente (DISTINCT ON produto ... valido_de DESC) e histórico por produto
+            models.Index(fields=['produto', '-valido_de', '-id'], name='produtos_preco_vigente'),
+            # Linhas que começam, terminam ou foram criadas desde a última aplicação
+            models.Index(fields=['valido_de'], name='produtos_preco_inicio'),
+            models.Index(fields=['valido_ate'], name='produtos_preco_fim'),
+            models.Index(fields=['criado_em'], name='produtos_preco_criado'),
+            models.Index(fields=['campanha'], name='produtos_preco_campanha'),
+        ]
+
+    def __str__(self):
+        return f"{self.produto_id}: {self.preco} / {self.preco_promocional} a partir de {self.valido_de:%d/%m/%Y %H:%M}"
+
+
+class ReservaEstoqueQuerySet(models.QuerySet):
+
+    def ativas(self):
+        return self.filter(expira_em__gt=timezone.now())
+
+    def expiradas(self):
+        return self.filter(expira_em__lte=timezone.now())
+
+    def liberar(self, dono_tipo, donos):
+        """Apaga as reservas de vários donos do mesmo tipo num único DELETE"""
+        return self.filter(dono_tipo=dono_tipo, dono_id__in=list(donos)).delete()[0]
+
+    def apagar_expiradas(self, dono_tipo, lote):
+        """Apaga até `lote` reservas vencidas num DELETE curto, pulando as travadas por outra transação"""
+        ids = self.expiradas().filter(dono_tipo=dono_tipo).select_for_update(skip_locked=True).values('id')[:lote]
+        return self.filter(id__in=ids).delete()[0]
+
+
+class ReservaEstoque(models.Model):
+    """
+    Unidades seguradas por tempo limitado para um carrinho ou um pedido.
+
+    - Carrinho: o estoque ainda não saiu do produto. Enquanto ativa, a reserva
+      é descontada do estoque disponível para os outros carrinhos e checkouts
+      (ProdutoQuerySet.com_estoque_disponivel) e é renovada a cada alteração
+      do carrinho.
+    - Pedido aguardando pagamento: o checkout já baixou o estoque; a reserva é
+      o prazo do pagamento. Vencida, o comando varrer_reservas cancela o
+      pedido e devolve as unidades (ver pedidos/reservas.py).
+    """
+    CARRINHO = 'carrinho'
+    PEDIDO = 'pedido'
+    DONO_CHOICES = [
+        (CARRINHO, 'Carrinho'),
+        (PEDIDO, 'Pedido'),
+    ]
+
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.CASCADE,
+        related_name='reservas',
+        verbose_name="Produto"
+    )
+    quantidade = models.PositiveIntegerField(verbose_name="Quantidade")
+    # Dono genérico (id de Carrinho ou de Pedido): produtos não depende dos apps que reservam
+    dono_tipo = models.CharField(max_length=10, choices=DONO_CHOICES, verbose_name="Tipo do dono")
+    dono_id = models.BigIntegerField(verbose_name="Dono")
+    expira_em = models.DateTimeField(verbose_name="Expira em")
+    criado_em = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+
+    objects = ReservaEstoqueQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Reserva de estoque"
+        verbose_name_plural = "Reservas de estoque"
+        constraints = [
+            models.UniqueConstraint(fields=['dono_tipo', 'dono_id', 'produto'], name='produtos_reserva_dono'),
+        ]
+        indexes = [
+            # Soma das reservas ativas de carrinhos por produto (estoque disponível), só pelo índice
+            models.Index(
+                fields=['produto', 'expira_em'],
+                include=['quantidade', 'dono_id'],
+                condition=models.Q(dono_tipo='carrinho'),
+                name='produtos_reserva_ativa',
+            ),
+            # Varredura das reservas vencidas
+            models.Index(fields=['expira_em'], name='produtos_reserva_expira'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantidade}x {self.produto_id} para {self.dono_tipo} {self.dono_id} até {self.expira_em:%d/%m/%Y %H:%M}"
+
+
+class MarcaProcessamento(models.Model):
+    """Marca d'água dos jobs em lote: último registro já processado por cada um"""
+    nome = models.CharField(max_length=50, primary_key=True)
+    valor = models.BigIntegerField(default=0)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Marca de processamento"
+        verbose_name_plural = "Marcas de processamento"
+
+    def __str__(self):
+        return f"{self.nome}: {self.valor}"
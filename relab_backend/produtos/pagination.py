@@ -0,0 +1,226 @@
+# produtos/pagination.py
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import F, Field, Func, Value
+from django.db.models.lookups import GreaterThan, LessThan
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class Row(Func):
+    """ROW(a, b, ...) para comparações de tupla que usam índices compostos"""
+    function = 'ROW'
+    output_field = Field()
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginação por cursor (keyset) sobre a ordenação ativa do queryset.
+
+    A posição é a tupla de valores da última linha exibida, e a próxima página
+    é buscada com `WHERE (campo, id) < (valor, id)`, que usa o índice composto
+    correspondente. Não executa COUNT(*) nem OFFSET, então qualquer página
+    custa o mesmo que a primeira.
+
+    O `id` é adicionado como desempate na mesma direção do primeiro campo
+    (ex.: -criado_em -> -criado_em, -id), para que a comparação de tupla
+    continue usando um único índice.
+    """
+    page_size = PageNumberPagination.page_size
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Cursor inválido.'
+    invalid_ordering_message = 'Ordenação não suportada na paginação por cursor.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = remove_query_param(request.build_absolute_uri(), 'page')
+
+        self.anotacoes = set(queryset.query.annotations)
+        campos = self.get_ordering(queryset)
+        self.campos = campos
+        self.descendente = campos[0].startswith('-')
+
+        valores, anterior = self.decode_cursor(request, queryset, campos)
+
+        nomes = [campo.lstrip('-') for campo in campos]
+        ordem = campos if not anterior else [self._inverter(campo) for campo in campos]
+        queryset = queryset.order_by(*ordem)
+
+        if valores is not None:
+            # Avança (ou recua) a partir da tupla do cursor
+            lookup = GreaterThan if self.descendente == anterior else LessThan
+            queryset = queryset.filter(lookup(
+                Row(*[F(nome) for nome in nomes]),
+                Row(*[Value(valor) for valor in valores])
+            ))
+
+        resultados = list(queryset[:self.page_size + 1])
+        tem_mais = len(resultados) > self.page_size
+        resultados = resultados[:self.page_size]
+
+        if anterior:
+            resultados.reverse()
+            self.tem_anterior = tem_mais
+            self.tem_proxima = True
+        else:
+            self.tem_anterior = valores is not None
+            self.tem_proxima = tem_mais
+
+        self.page = resultados
+        return resultados
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.tem_proxima or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], anterior=False)
+
+    def get_previous_link(self):
+        if not self.tem_anterior or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], anterior=True)
+
+    def get_ordering(self, queryset):
+        """
+        Campos da ordenação ativa (+ desempate por id).
+        Só aceita campos locais não nulos, todos na mesma direção.
+        """
+        query = queryset.query
+        campos = list(query.order_by) or (
+            list(query.get_meta().ordering) if query.default_ordering else []
+        )
+        campos = [campo for campo in campos if isinstance(campo, str)]
+        if not campos:
+            campos = ['-id']
+
+        campos = ['-id' if campo == '-pk' else 'id' if campo == 'pk' else campo for campo in campos]
+        descendente = campos[0].startswith('-')
+        if any(campo.startswith('-') != descendente for campo in campos):
+            raise ValidationError({'ordering': self.invalid_ordering_message})
+
+        for campo in campos:
+            self._campo_modelo(queryset, campo.lstrip('-'))
+
+        if 'id' not in [campo.lstrip('-') for campo in campos]:
+            campos.append('-id' if descendente else 'id')
+        return campos
+
+    def _campo_modelo(self, queryset, nome):
+        """Retorna o field (ou anotação) usado na ordenação, validando-o"""
+        if nome in queryset.query.annotations:
+            return queryset.query.annotations[nome].output_field
+        try:
+            campo = queryset.model._meta.get_field(nome)
+        except FieldDoesNotExist:
+            raise ValidationError({'ordering': self.invalid_ordering_message})
+        if campo.null or not campo.concrete or campo.is_relation and not campo.many_to_one:
+            raise ValidationError({'ordering': self.invalid_ordering_message})
+        return campo
+
+    def _inverter(self, campo):
+        return campo[1:] if campo.startswith('-') else f'-{campo}'
+
+    def _valor(self, objeto, nome):
+        if isinstance(objeto, dict):
+            # Linhas de values() (serialização compilada)
+            return objeto[nome]
+        if nome in self.anotacoes:
+            return getattr(objeto, nome)
+        return getattr(objeto, objeto._meta.get_field(nome).attname)
+
+    def decode_cursor(self, request, queryset, campos):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            dados = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            if dados['o'] != campos or len(dados['v']) != len(campos):
+                raise ValueError
+            valores = [
+                self._campo_modelo(queryset, campo.lstrip('-')).to_python(valor)
+                for campo, valor in zip(campos, dados['v'])
+            ]
+            return valores, bool(dados['r'])
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            # base64, JSON ou valores adulterados: erro do cliente, como um filtro inválido
+            raise ValidationError({self.cursor_query_param: [self.invalid_cursor_message]})
+
+    def encode_cursor(self, objeto, anterior):
+        valores = []
+        for campo in self.campos:
+            valor = self._valor(objeto, campo.lstrip('-'))
+            valores.append(valor.isoformat() if hasattr(valor, 'isoformat') else str(valor))
+
+        dados = json.dumps({'o': self.campos, 'v': valores, 'r': int(anterior)}, separators=(',', ':'))
+        encoded = urlsafe_b64encode(dados.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+class PaginacaoHibrida(PageNumberPagination):
+    """
+    PageNumberPagination por padrão; `?paginacao=cursor` (ou `?cursor=...`)
+    ativa a paginação por cursor, sem COUNT(*) nem OFFSET.
+    """
+    mode_query_param = 'paginacao'
+
+    def usa_cursor(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or KeysetPagination.cursor_query_param in request.query_params
+        )
+
+    def chave_pagina(self, request):
+        """
+        (página, tamanho) normalizados, para chaves de cache; None no modo
+        cursor (qualquer cursor é válido, então não dá para limitar as chaves)
+        """
+        if self.usa_cursor(request):
+            return None
+        pagina = request.query_params.get(self.page_query_param, '1').strip()
+        return (int(pagina) if pagina.isdigit() else pagina), self.get_page_size(request)
+
+    def resposta_da_pagina(self, request, count, results):
+        """
+        Resposta de uma página já calculada (guardada em cache com o `count`):
+        next/previous montados a partir desta requisição, sem consultar o banco
+        """
+        paginator = self.django_paginator_class(range(count), self.get_page_size(request))
+        self.request = request
+        self.page = paginator.page(self.get_page_number(request, paginator))
+        self.keyset = None
+        return self.get_paginated_response(results)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.usa_cursor(request):
+            self.keyset = KeysetPagination()
+            self.keyset.page_size = self.page_size
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
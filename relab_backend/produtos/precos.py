@@ -0,0 +1,212 @@
+# produtos/precos.py
+"""
+Preços programados (campanhas) e histórico de preços (PrecoProduto).
+
+Uma campanha é gravada de uma vez (COPY + INSERT ... SELECT pelo SKU) e o
+comando aplicar_precos, rodando a cada minuto, grava em Produto o preço
+vigente dos produtos em que alguma linha começou, terminou ou foi criada
+desde a execução anterior: um único UPDATE para todos, sem save() por linha.
+
+Na primeira programação de um produto o preço atual vira a linha base (sem
+fim), para onde ele volta quando a campanha termina. Alterações feitas direto
+no produto (admin, API, importação) entram como uma linha nova sem fim, então
+valem por cima de uma campanha em andamento e continuam depois dela.
+"""
+import csv
+import io
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import MarcaProcessamento, PrecoProduto, Produto
+
+MARCA = 'precos:aplicado_em'
+
+NULO = '\\N'
+
+COLUNAS = 'produto_id, preco, preco_promocional, valido_de, valido_ate, campanha, criado_em'
+
+# Linha de maior valido_de entre as que cobrem o instante, por produto
+VIGENTES = """
+    SELECT DISTINCT ON (pp.produto_id) pp.produto_id, pp.preco, pp.preco_promocional
+    FROM {precos} pp
+    WHERE pp.produto_id IN ({afetados})
+      AND pp.valido_de <= %s AND (pp.valido_ate IS NULL OR pp.valido_ate > %s)
+    ORDER BY pp.produto_id, pp.valido_de DESC, pp.id DESC
+"""
+
+
+def _tabelas():
+    return PrecoProduto._meta.db_table, Produto._meta.db_table
+
+
+def programar(linhas, campanha, inicio, fim=None):
+    """
+    Grava a campanha a partir de (linha, sku, preco, preco_promocional); preco
+    None mantém o preço atual do produto e o SKU repetido vale pela última linha.
+    Retorna (preços gravados, SKUs não encontrados).
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for linha in linhas:
+        escritor.writerow(NULO if valor is None else valor for valor in linha)
+    buffer.seek(0)
+
+    precos, produtos = _tabelas()
+    agora = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS precos_programacao '
+            '(linha bigint, sku varchar(64), preco numeric(10, 2), preco_promocional numeric(10, 2)) '
+            'ON COMMIT DELETE ROWS'
+        )
+        cursor.copy_expert(f"COPY precos_programacao FROM STDIN WITH (FORMAT csv, NULL '{NULO}')", buffer)
+
+        # Preço base dos produtos que ainda não tinham programação
+        cursor.execute(
+            f"""
+            INSERT INTO {precos} ({COLUNAS})
+            SELECT p.id, p.preco, p.preco_promocional, LEAST(p.criado_em, %s), NULL, '', %s
+            FROM {produtos} p
+            WHERE p.sku IN (SELECT sku FROM precos_programacao)
+              AND NOT EXISTS (SELECT 1 FROM {precos} x WHERE x.produto_id = p.id)
+            """,
+            [inicio, agora]
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {precos} ({COLUNAS})
+            SELECT DISTINCT ON (p.id) p.id, COALESCE(t.preco, p.preco), t.preco_promocional, %s, %s, %s, %s
+            FROM precos_programacao t
+            JOIN {produtos} p ON p.sku = t.sku
+            ORDER BY p.id, t.linha DESC
+            """,
+            [inicio, fim, campanha, agora]
+        )
+        gravados = cursor.rowcount
+        cursor.execute(
+            f'SELECT COUNT(DISTINCT sku) FROM precos_programacao t '
+            f'WHERE NOT EXISTS (SELECT 1 FROM {produtos} p WHERE p.sku = t.sku)'
+        )
+        ignorados = cursor.fetchone()[0]
+    return gravados, ignorados
+
+
+def _gravar_vigentes(cursor, afetados, parametros, agora):
+    """UPDATE de Produto com o preço vigente dos produtos de `afetados` (subquery); retorna os ids alterados"""
+    precos, produtos = _tabelas()
+    vigentes = VIGENTES.format(precos=precos, afetados=afetados)
+    cursor.execute(
+        f"""
+        UPDATE {produtos} p SET
+            preco = v.preco,
+            preco_promocional = v.preco_promocional,
+            atualizado_em = %s
+        FROM ({vigentes}) AS v
+        WHERE p.id = v.produto_id
+          AND (p.preco, p.preco_promocional) IS DISTINCT FROM (v.preco, v.preco_promocional)
+        RETURNING p.id
+        """,
+        [agora, *parametros, agora, agora]
+    )
+    return [produto_id for (produto_id,) in cursor.fetchall()]
+
+
+def aplicar(sobreposicao=timedelta(minutes=5)):
+    """
+    Aplica as linhas que começaram, terminaram ou foram criadas desde a última
+    execução (revendo os últimos minutos, para inserções que ainda não tinham
+    feito commit). Retorna os ids dos produtos alterados.
+    """
+    precos, _ = _tabelas()
+    agora = timezone.now()
+    with transaction.atomic():
+        marca = (
+            MarcaProcessamento.objects.select_for_update()
+            .filter(nome=MARCA).values_list('valor', flat=True).first()
+        ) or 0
+        desde = datetime.fromtimestamp(marca, tz=dt_timezone.utc) - sobreposicao
+
+        with connection.cursor() as cursor:
+            alterados = _gravar_vigentes(
+                cursor,
+                f"""
+                SELECT produto_id FROM {precos} WHERE valido_de > %s AND valido_de <= %s
+                UNION SELECT produto_id FROM {precos} WHERE valido_ate > %s AND valido_ate <= %s
+                UNION SELECT produto_id FROM {precos} WHERE criado_em > %s
+                """,
+                [desde, agora, desde, agora, desde],
+                agora
+            )
+
+        MarcaProcessamento.objects.update_or_create(nome=MARCA, defaults={'valor': int(agora.timestamp())})
+    return alterados
+
+
+def recalcular(produto_ids):
+    """Grava o preço vigente agora dos produtos em `produto_ids`; retorna os ids alterados"""
+    if not produto_ids:
+        return []
+    with transaction.atomic(), connection.cursor() as cursor:
+        return _gravar_vigentes(cursor, 'SELECT unnest(%s::bigint[])', [list(produto_ids)], timezone.now())
+
+
+def encerrar_campanha(campanha):
+    """
+    Encerra agora a campanha: linhas em andamento terminam, as que não
+    começaram são apagadas. Retorna (linhas afetadas, ids dos produtos alterados).
+    """
+    precos, _ = _tabelas()
+    agora = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {precos} WHERE campanha = %s AND valido_de >= %s RETURNING produto_id',
+            [campanha, agora]
+        )
+        produto_ids = [produto_id for (produto_id,) in cursor.fetchall()]
+        cursor.execute(
+            f"""
+            UPDATE {precos} SET valido_ate = %s
+            WHERE campanha = %s AND valido_de < %s AND (valido_ate IS NULL OR valido_ate > %s)
+            RETURNING produto_id
+            """,
+            [agora, campanha, agora, agora]
+        )
+        produto_ids += [produto_id for (produto_id,) in cursor.fetchall()]
+        return len(produto_ids), recalcular(produto_ids)
+
+
+def registrar_alteracoes(produto_ids):
+    """
+    Produtos com programação cujo preço foi alterado fora dela ganham uma
+    linha sem fim com o preço atual. A comparação é com o que já está aplicado
+    (linhas vigentes na última execução de aplicar_precos e alterações diretas
+    posteriores): um save() entre o início de uma campanha e a próxima
+    aplicação não a sobrescreve.
+    """
+    if not produto_ids:
+        return 0
+    precos, produtos = _tabelas()
+    agora = timezone.now()
+    marca = MarcaProcessamento.objects.filter(nome=MARCA).values_list('valor', flat=True).first()
+    aplicado_em = datetime.fromtimestamp(marca, tz=dt_timezone.utc) if marca else agora
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {precos} ({COLUNAS})
+            SELECT p.id, p.preco, p.preco_promocional, %s, NULL, '', %s
+            FROM {produtos} p
+            JOIN (
+                SELECT DISTINCT ON (pp.produto_id) pp.produto_id, pp.preco, pp.preco_promocional
+                FROM {precos} pp
+                WHERE pp.produto_id = ANY(%s)
+                  AND (pp.valido_de <= %s OR (pp.campanha = '' AND pp.valido_de <= %s))
+                  AND (pp.valido_ate IS NULL OR pp.valido_ate > %s)
+                ORDER BY pp.produto_id, pp.valido_de DESC, pp.id DESC
+            ) AS v ON v.produto_id = p.id
+            WHERE (p.preco, p.preco_promocional) IS DISTINCT FROM (v.preco, v.preco_promocional)
+            """,
+            [agora, agora, list(produto_ids), aplicado_em, agora, aplicado_em]
+        )
+        return cursor.rowcount
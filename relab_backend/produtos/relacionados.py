@@ -0,0 +1,251 @@
+# produtos/relacionados.py
+"""
+"Comprados juntos": recomendações item a item a partir dos pedidos.
+
+1. Os itens dos pedidos novos (id acima da marca d'água) são lidos em lotes de
+   pedidos inteiros. Cada lote vira uma matriz esparsa pedidos x produtos (B)
+   e B.T @ B dá, de uma vez, em quantos pedidos cada par aparece junto. Os
+   pares são somados em CoocorrenciaProduto e a marca avança na mesma
+   transação; a memória fica limitada ao tamanho do lote.
+2. Para os produtos afetados (os do lote e os vizinhos deles, cujo score
+   depende da contagem que mudou), o score é o cosseno
+   pedidos(a, b) / sqrt(pedidos(a) * pedidos(b)) e os K maiores vão para
+   ProdutoRelacionado, servido por /produtos/{id}/relacionados/.
+
+Pedido cancelado depois de somado sai das contagens na execução seguinte: a
+cada execução, os pedidos já somados (id até a marca) com cancelado_em na
+janela desde a execução anterior são subtraídos. A janela e a contagem usam
+o mesmo limite, então cada pedido entra e sai no máximo uma vez.
+"""
+import io
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db import connection, transaction
+from django.utils import timezone
+from scipy import sparse
+
+from .models import CoocorrenciaProduto, MarcaProcessamento, ProdutoRelacionado
+
+MARCA = 'relacionados:pedido'
+# Timestamp (segundos) do limite da última execução: fim da janela de cancelamentos já descontados
+MARCA_CANCELADOS = 'relacionados:cancelados'
+
+
+def ler_marca(nome=MARCA):
+    return MarcaProcessamento.objects.filter(nome=nome).values_list('valor', flat=True).first() or 0
+
+
+def calcular_limite(atraso=timedelta(minutes=10)):
+    """
+    Pedidos criados (e cancelamentos feitos) até aqui entram nesta execução;
+    os mais novos ficam para a próxima (uma transação com id menor ainda pode
+    estar aberta). Arredondado ao segundo, que é como fica na marca.
+    """
+    return datetime.fromtimestamp(int((timezone.now() - atraso).timestamp()), tz=dt_timezone.utc)
+
+
+def contar_pares(pedidos, produtos):
+    """
+    Pares (a, b, n), a <= b, com n = pedidos em que a e b aparecem juntos
+    (na diagonal, pedidos com o produto).
+    """
+    pedido_ids, linhas = np.unique(pedidos, return_inverse=True)
+    produto_ids, colunas = np.unique(produtos, return_inverse=True)
+    incidencia = sparse.csr_matrix(
+        (np.ones(len(linhas), dtype=np.int32), (linhas, colunas)),
+        shape=(len(pedido_ids), len(produto_ids))
+    )
+    # O mesmo produto em duas linhas do pedido conta uma vez
+    incidencia.sum_duplicates()
+    incidencia.data[:] = 1
+
+    pares = sparse.triu(incidencia.T @ incidencia).tocoo()
+    return produto_ids[pares.row], produto_ids[pares.col], pares.data
+
+
+def descontar_cancelados(limite):
+    """
+    Subtrai de CoocorrenciaProduto os pedidos já somados (id até a marca) e
+    cancelados entre o limite da execução anterior e `limite`. Roda antes de
+    processar_pedidos com o mesmo limite. Na primeira execução não há janela
+    anterior: o histórico só é corrigido com --completo.
+
+    Retorna (pedidos descontados, produtos tocados).
+    """
+    tocados = np.empty(0, dtype=np.int64)
+    with transaction.atomic():
+        desde = ler_marca(MARCA_CANCELADOS)
+        pedidos = 0
+        if desde:
+            with connection.cursor() as cursor:
+                # atualizado_em >= cancelado_em (gravados juntos): filtro indexado antes do de cancelado_em
+                cursor.execute(
+                    """
+                    SELECT i.pedido_id, i.produto_id
+                    FROM pedidos_itempedido i
+                    JOIN pedidos_pedido p ON p.id = i.pedido_id
+                    WHERE p.id <= %s AND p.status = 'cancelado'
+                      AND p.atualizado_em > %s AND p.cancelado_em > %s AND p.cancelado_em <= %s
+                    """,
+                    [ler_marca(), *[datetime.fromtimestamp(desde, tz=dt_timezone.utc)] * 2, limite]
+                )
+                itens = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+
+            if len(itens):
+                a, b, n = contar_pares(itens[:, 0], itens[:, 1])
+                somar_coocorrencias(a, b, -n)
+                CoocorrenciaProduto.objects.filter(pedidos__lte=0).delete()
+                pedidos = len(np.unique(itens[:, 0]))
+                tocados = np.unique(itens[:, 1])
+
+        MarcaProcessamento.objects.update_or_create(
+            nome=MARCA_CANCELADOS, defaults={'valor': int(limite.timestamp())}
+        )
+    return pedidos, tocados
+
+
+def processar_pedidos(limite, lote_pedidos=20000):
+    """
+    Soma em CoocorrenciaProduto os pedidos acima da marca d'água criados até
+    `limite` (calcular_limite), um lote por transação. Não contam os
+    cancelados até `limite`; os cancelados depois dele são somados agora e
+    descontados na janela seguinte (descontar_cancelados).
+
+    Gera (pedidos, itens, produtos tocados no lote) a cada lote.
+    """
+    while True:
+        with transaction.atomic():
+            marca = ler_marca()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT id, criado_em <= %s FROM pedidos_pedido WHERE id > %s ORDER BY id LIMIT %s',
+                    [limite, marca, lote_pedidos]
+                )
+                ids = []
+                for pedido_id, antigo in cursor.fetchall():
+                    if not antigo:
+                        # A marca não pode passar de um pedido recente
+                        break
+                    ids.append(pedido_id)
+                if not ids:
+                    return
+
+                cursor.execute(
+                    """
+                    SELECT i.pedido_id, i.produto_id
+                    FROM pedidos_itempedido i
+                    JOIN pedidos_pedido p ON p.id = i.pedido_id
+                    WHERE i.pedido_id BETWEEN %s AND %s
+                      AND NOT (p.status = 'cancelado' AND (p.cancelado_em IS NULL OR p.cancelado_em <= %s))
+                    """,
+                    [ids[0], ids[-1], limite]
+                )
+                itens = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+
+            tocados = np.empty(0, dtype=np.int64)
+            if len(itens):
+                a, b, n = contar_pares(itens[:, 0], itens[:, 1])
+                somar_coocorrencias(a, b, n)
+                tocados = np.unique(itens[:, 1])
+
+            MarcaProcessamento.objects.update_or_create(nome=MARCA, defaults={'valor': ids[-1]})
+        yield len(ids), len(itens), tocados
+
+
+def somar_coocorrencias(a, b, n):
+    """Upsert (soma) dos pares via COPY em tabela temporária; n negativo subtrai"""
+    buffer = io.StringIO()
+    np.savetxt(buffer, np.column_stack([a, b, n]), fmt='%d', delimiter='\t')
+    buffer.seek(0)
+
+    tabela = CoocorrenciaProduto._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS coocorrencias_lote '
+            '(produto_a_id bigint, produto_b_id bigint, pedidos integer) ON COMMIT DELETE ROWS'
+        )
+        cursor.copy_expert('COPY coocorrencias_lote FROM STDIN', buffer)
+        cursor.execute(
+            f"""
+            INSERT INTO {tabela} (produto_a_id, produto_b_id, pedidos)
+            SELECT produto_a_id, produto_b_id, pedidos FROM coocorrencias_lote
+            ON CONFLICT (produto_a_id, produto_b_id)
+            DO UPDATE SET pedidos = {tabela}.pedidos + EXCLUDED.pedidos
+            """
+        )
+
+
+def vizinhos(produto_ids):
+    """Produtos com algum pedido em comum com os de `produto_ids` (inclusive eles)"""
+    tabela = CoocorrenciaProduto._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT produto_b_id FROM {tabela} WHERE produto_a_id = ANY(%s)
+            UNION
+            SELECT produto_a_id FROM {tabela} WHERE produto_b_id = ANY(%s)
+            """,
+            [list(map(int, produto_ids))] * 2
+        )
+        return np.array([linha[0] for linha in cursor.fetchall()], dtype=np.int64)
+
+
+def recalcular_top_k(produto_ids, k=12, minimo=2, lote=5000):
+    """Recalcula ProdutoRelacionado dos produtos em `produto_ids`; retorna as linhas gravadas"""
+    gravadas = 0
+    produto_ids = np.unique(np.asarray(produto_ids, dtype=np.int64))
+    for inicio in range(0, len(produto_ids), lote):
+        gravadas += _recalcular_lote(produto_ids[inicio:inicio + lote], k, minimo)
+    return gravadas
+
+
+def _recalcular_lote(origens, k, minimo):
+    tabela = CoocorrenciaProduto._meta.db_table
+    ids = list(map(int, origens))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT produto_a_id, produto_b_id, pedidos FROM {tabela}
+            WHERE (produto_a_id = ANY(%s) OR produto_b_id = ANY(%s))
+              AND produto_a_id <> produto_b_id AND pedidos >= %s
+            """,
+            [ids, ids, minimo]
+        )
+        pares = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 3)
+
+    # Pares guardados com a < b: cada um vale para os dois lados
+    origem = np.concatenate([pares[:, 0], pares[:, 1]])
+    destino = np.concatenate([pares[:, 1], pares[:, 0]])
+    juntos = np.concatenate([pares[:, 2], pares[:, 2]])
+    manter = np.isin(origem, origens)
+    origem, destino, juntos = origem[manter], destino[manter], juntos[manter]
+
+    if len(origem):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT produto_a_id, pedidos FROM {tabela} WHERE produto_a_id = produto_b_id AND produto_a_id = ANY(%s)',
+                [list(map(int, np.union1d(origem, destino)))]
+            )
+            diagonal = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+        diagonal = diagonal[np.argsort(diagonal[:, 0])]
+        totais = diagonal[np.searchsorted(diagonal[:, 0], np.stack([origem, destino])), 1]
+        score = juntos / np.sqrt(totais[0] * totais[1])
+
+        # Top-K por origem: ordena por (origem, -score, destino) e fica com as K primeiras de cada grupo
+        ordem = np.lexsort((destino, -score, origem))
+        origem, destino, juntos, score = origem[ordem], destino[ordem], juntos[ordem], score[ordem]
+        inicio_grupo = np.searchsorted(origem, origem, side='left')
+        manter = np.arange(len(origem)) - inicio_grupo < k
+        origem, destino, juntos, score = origem[manter], destino[manter], juntos[manter], score[manter]
+
+    with transaction.atomic():
+        ProdutoRelacionado.objects.filter(produto_id__in=ids).delete()
+        ProdutoRelacionado.objects.bulk_create(
+            [
+                ProdutoRelacionado(produto_id=a, relacionado_id=b, score=round(float(s), 6), pedidos=n)
+                for a, b, n, s in zip(origem.tolist(), destino.tolist(), juntos.tolist(), score.tolist())
+            ],
+            batch_size=5000
+        )
+    return len(origem)
@@ -0,0 +1,49 @@
+# produtos/renderers.py
+import re
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+from .serializacao import ativa
+
+# Floats que o json do Python escreve com expoente (abaixo de 1e-4 ou a partir de 1e16) e o
+# orjson não escreve igual: 1e16 (1e+16), 1e-7 (1e-07) ou 0.00001 (1e-05)
+EXPOENTE = re.compile(rb'(?:^|[:,\[])-?(?:\d+(?:\.\d+)?e[+-]?\d+|0\.0000\d+)(?=$|[,\]}])')
+
+
+class OrjsonRenderer(JSONRenderer):
+    """
+    JSONRenderer com orjson, byte a byte igual ao do DRF (JSON compacto, sem
+    escapar acentos, \\u2028/\\u2029 escapados).
+
+    Decimal vira float e datetime/date/time seguem o formato do JSONEncoder do
+    DRF (os DateTimeField dos serializers já chegam formatados com o
+    DATETIME_FORMAT das settings). Com indentação, configuração diferente do
+    padrão ou algo que o orjson não serializa igual (inteiros muito grandes,
+    chaves não-string, floats escritos com expoente), usa o renderer do DRF;
+    um trecho de texto que pareça um expoente também cai no do DRF, só mais
+    lento. Exceção: NaN e infinito saem como null, onde o DRF (STRICT_JSON)
+    levantaria ValueError.
+    """
+    opcoes = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    encoder = encoders.JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or self.ensure_ascii or not self.compact or not ativa():
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder.default, option=self.opcoes)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if EXPOENTE.search(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
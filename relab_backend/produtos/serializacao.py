@@ -0,0 +1,225 @@
+# produtos/serializacao.py
+"""
+Serialização compilada das listagens (ProdutoListSerializer, CategoriaListSerializer).
+
+Nas listagens, construir instâncias do modelo e passar cada valor pelo
+`to_representation` de cada campo do DRF custa mais CPU que a própria query.
+Aqui o serializer é "compilado" uma vez: cada campo vira uma coluna de
+`values()` e uma função que gera o valor já pronto para o JSON, e as linhas
+viram dicts direto, sem instâncias nem campos do DRF no caminho.
+
+A saída é idêntica à do serializer (mesmas chaves, ordem e valores), junto
+com o OrjsonRenderer (ver renderers.py). Campos que não são colunas
+(properties) declaram as colunas em `Meta.dependencias` e a função em
+`Meta.compilados`; um campo que não dá para compilar levanta
+ImproperlyConfigured na primeira requisição.
+
+SERIALIZACAO_COMPILADA=False volta para o serializer do DRF.
+"""
+import decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from rest_framework import serializers
+from rest_framework.fields import empty
+from rest_framework.settings import api_settings
+
+from .campos import colunas_ordenacao
+from .serializers import SrcsetField
+
+# Valor de campo omitido da saída (SkipField no DRF)
+PULAR = object()
+
+# Campos cujo to_representation devolve o próprio valor vindo do banco
+_DIRETOS = {
+    serializers.ReadOnlyField.to_representation,
+    serializers.CharField.to_representation,
+    serializers.IntegerField.to_representation,
+    serializers.BooleanField.to_representation,
+}
+
+
+class SerializadorCompilado:
+    """Versão compilada de um ModelSerializer de listagem (ver `compilar`)"""
+
+    def __init__(self, serializer_class):
+        meta = serializer_class.Meta
+        self.modelo = meta.model
+        self.nome = serializer_class.__name__
+        dependencias = getattr(meta, 'dependencias', {})
+        compilados = getattr(meta, 'compilados', {})
+
+        # (nome, colunas, função(linha, request))
+        self.campos = []
+        for nome, campo in serializer_class(context={}).fields.items():
+            if nome in compilados:
+                funcao = compilados[nome]
+                self.campos.append((nome, dependencias.get(nome, []), lambda linha, request, f=funcao: f(linha)))
+            else:
+                self.campos.append((nome, *self._compilar_campo(nome, campo)))
+
+    def colunas(self, campos=None):
+        colunas = [self.modelo._meta.pk.attname]
+        for nome, dependencias, _ in self._selecionados(campos):
+            colunas.extend(coluna for coluna in dependencias if coluna not in colunas)
+        return colunas
+
+    def linhas(self, queryset, campos=None):
+        """values() com as colunas dos campos (e da ordenação, lida pela paginação por cursor)"""
+        colunas = self.colunas(campos)
+        extras = [coluna for coluna in colunas_ordenacao(queryset) if coluna not in colunas]
+        return queryset.values(*colunas, *extras)
+
+    def serializar(self, linhas, request=None, campos=None):
+        selecionados = [(nome, funcao) for nome, _, funcao in self._selecionados(campos)]
+        resultado = []
+        for linha in linhas:
+            item = {}
+            for nome, funcao in selecionados:
+                valor = funcao(linha, request)
+                if valor is not PULAR:
+                    item[nome] = valor
+            resultado.append(item)
+        return resultado
+
+    def _selecionados(self, campos):
+        if campos is None:
+            return self.campos
+        return [campo for campo in self.campos if campo[0] in campos]
+
+    def _compilar_campo(self, nome, campo):
+        """(colunas, função) equivalentes a campo.get_attribute() + to_representation()"""
+        caminho, nulaveis = self._caminho(nome, campo)
+        if nulaveis:
+            # FK nula no meio do caminho: o DRF usa o default, None ou omite o campo
+            if campo.default is not empty:
+                ausente = campo.get_default
+            elif campo.allow_null:
+                ausente = lambda: None
+            elif not campo.required:
+                ausente = lambda: PULAR
+            else:
+                raise ImproperlyConfigured(f'{self.nome}.{nome}: relação nula em campo obrigatório')
+        converter = self._conversor(nome, campo, caminho)
+
+        def funcao(linha, request):
+            if nulaveis and any(linha[fk] is None for fk in nulaveis):
+                return ausente()
+            valor = linha[caminho]
+            if valor is None:
+                return None
+            return converter(valor, request)
+
+        return [caminho, *nulaveis], funcao
+
+    def _caminho(self, nome, campo):
+        """Coluna de values() do `source` do campo e as FKs nulas que o precedem"""
+        if isinstance(campo, serializers.BaseSerializer) or campo.source == '*':
+            raise ImproperlyConfigured(f'{self.nome}.{nome}: campo não compilável ({campo.source})')
+
+        modelo, caminho, nulaveis = self.modelo, [], []
+        for indice, atributo in enumerate(campo.source_attrs):
+            try:
+                field = modelo._meta.get_field(atributo)
+            except FieldDoesNotExist:
+                raise ImproperlyConfigured(
+                    f'{self.nome}.{nome}: "{atributo}" não é coluna; declare-o em Meta.compilados'
+                )
+            ultimo = indice == len(campo.source_attrs) - 1
+            if not field.concrete or (field.is_relation and not field.many_to_one and not field.one_to_one):
+                raise ImproperlyConfigured(f'{self.nome}.{nome}: "{atributo}" não é coluna')
+            if field.is_relation and ultimo and not isinstance(campo, serializers.PrimaryKeyRelatedField):
+                raise ImproperlyConfigured(f'{self.nome}.{nome}: relação sem PrimaryKeyRelatedField')
+
+            caminho.append(atributo)
+            if field.is_relation and not ultimo:
+                if field.null:
+                    nulaveis.append('__'.join(caminho))
+                modelo = field.related_model
+        return '__'.join(caminho), nulaveis
+
+    def _conversor(self, nome, campo, caminho):
+        if isinstance(campo, SrcsetField):
+            return SrcsetField.representar
+
+        if isinstance(campo, serializers.FileField):
+            modelo_campo = self._field(caminho)
+            use_url = getattr(campo, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+
+            def arquivo(valor, request, storage=modelo_campo.storage):
+                if not valor:
+                    return None
+                if not use_url:
+                    return valor
+                url = storage.url(valor)
+                return request.build_absolute_uri(url) if request is not None else url
+            return arquivo
+
+        if isinstance(campo, serializers.PrimaryKeyRelatedField):
+            if campo.pk_field is not None:
+                raise ImproperlyConfigured(f'{self.nome}.{nome}: pk_field não suportado')
+            return lambda valor, request: valor
+
+        if isinstance(campo, serializers.DecimalField) and type(campo).to_representation is serializers.DecimalField.to_representation:
+            coerce = getattr(campo, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+            if not coerce or campo.localize or campo.decimal_places is None:
+                return lambda valor, request: campo.to_representation(valor)
+            # Mesmo quantize do DecimalField, com o contexto montado uma vez
+            contexto = decimal.getcontext().copy()
+            if campo.max_digits is not None:
+                contexto.prec = campo.max_digits
+            casas = decimal.Decimal('.1') ** campo.decimal_places
+            rounding = campo.rounding
+
+            def decimal_texto(valor, request):
+                if not isinstance(valor, decimal.Decimal):
+                    valor = decimal.Decimal(str(valor).strip())
+                return '{:f}'.format(valor.quantize(casas, rounding=rounding, context=contexto))
+            return decimal_texto
+
+        if type(campo).to_representation in _DIRETOS:
+            return lambda valor, request: valor
+
+        # Demais campos (datas com DATETIME_FORMAT, choices...): o próprio to_representation
+        return lambda valor, request: campo.to_representation(valor)
+
+    def _field(self, caminho):
+        modelo = self.modelo
+        atributos = caminho.split('__')
+        for atributo in atributos[:-1]:
+            modelo = modelo._meta.get_field(atributo).related_model
+        return modelo._meta.get_field(atributos[-1])
+
+
+@lru_cache(maxsize=None)
+def compilar(serializer_class):
+    """SerializadorCompilado de `serializer_class` (compilado uma vez por processo)"""
+    return SerializadorCompilado(serializer_class)
+
+
+def ativa():
+    return getattr(settings, 'SERIALIZACAO_COMPILADA', True)
+
+
+class SerializacaoCompiladaViewMixin:
+    """
+    ViewSet com listagens pela serialização compilada:
+
+        queryset = self.preparar_lista(queryset, ProdutoListSerializer, context)
+        page = self.paginate_queryset(queryset)
+        data = self.serializar_lista(page, ProdutoListSerializer, context)
+
+    Com SERIALIZACAO_COMPILADA=False, equivale a `serializer_class(page, many=True, context=context).data`.
+    """
+
+    def preparar_lista(self, queryset, serializer_class, context=None):
+        if not ativa():
+            return queryset
+        return compilar(serializer_class).linhas(queryset, (context or {}).get('campos'))
+
+    def serializar_lista(self, itens, serializer_class, context=None):
+        context = context or {}
+        if not ativa():
+            return serializer_class(itens, many=True, context=context).data
+        return compilar(serializer_class).serializar(itens, context.get('request'), context.get('campos'))
@@ -1,21 +1,83 @@
 # produtos/serializers.py
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
 from rest_framework import serializers
-from .models import Categoria, Produto, ImagemProduto
+from .campos import CamposDinamicosMixin
+from .imagens import FORMATOS, srcset
+from .models import Categoria, Produto, ImagemProduto, PrecoProduto
+
+
+class SrcsetField(serializers.Field):
+    """
+    Derivados da imagem como mapa formato -> srcset, ex.:
+    {"webp": "/media/derivados/.../160w.webp 160w, ...", "jpeg": "..."}
+    Vazio enquanto os derivados não foram gerados (use `imagem` como fallback).
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'imagem_derivados')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, derivados):
+        return self.representar(derivados, self.context.get('request'))
+
+    @staticmethod
+    def representar(derivados, request=None):
+        """Também usado pela serialização compilada (produtos/serializacao.py)"""
+        if not derivados or not derivados.get('formatos'):
+            return {}
+
+        url = None
+        if request is not None:
+            # Mesmo critério do ImageField do DRF: URLs absolutas quando há request
+            url = lambda caminho: request.build_absolute_uri(default_storage.url(caminho))
+        return {formato: srcset(derivados, formato, url) for formato in FORMATOS}
+
+
+class DescontoPercentualField(serializers.ReadOnlyField):
+    """Coluna decimal (0.00 sem promoção); sem promoção a API responde o inteiro 0, como sempre"""
+
+    def to_representation(self, valor):
+        return valor or 0
 
 
 class ImagemProdutoSerializer(serializers.ModelSerializer):
+    imagem_srcset = SrcsetField()
+
     class Meta:
         model = ImagemProduto
-        fields = ['id', 'imagem', 'ordem']
+        fields = ['id', 'imagem', 'imagem_srcset', 'ordem']
+
+
+class PrecoProdutoSerializer(serializers.ModelSerializer):
+    """Período de preço do histórico (ver produtos/precos.py)"""
+
+    class Meta:
+        model = PrecoProduto
+        fields = ['preco', 'preco_promocional', 'valido_de', 'valido_ate', 'campanha']
+
+
+def validar_pai(categoria, pai):
+    """Categoria.validar_pai com o erro no formato do DRF"""
+    if categoria is not None:
+        try:
+            categoria.validar_pai(pai)
+        except DjangoValidationError as erro:
+            raise serializers.ValidationError(erro.message_dict['pai'])
+    return pai
 
 
 class CategoriaListSerializer(serializers.ModelSerializer):
-    """Serializer simplificado para listagens"""
-    total_produtos = serializers.ReadOnlyField()
+    """Serializer simplificado para listagens (contadores lidos da própria categoria)"""
+    total_produtos = serializers.IntegerField(source='produtos_disponiveis', read_only=True)
 
     class Meta:
         model = Categoria
-        fields = ['id', 'nome', 'slug', 'imagem', 'total_produtos']
+        fields = ['id', 'nome', 'slug', 'pai', 'imagem', 'total_produtos', 'produtos_em_estoque']
+
+    def validate_pai(self, pai):
+        return validar_pai(self.instance, pai)
 
 
 class CategoriaDetailSerializer(serializers.ModelSerializer):
@@ -26,14 +88,19 @@ class CategoriaDetailSerializer(serializers.ModelSerializer):
         model = Categoria
         fields = '__all__'
 
+    def validate_pai(self, pai):
+        return validar_pai(self.instance, pai)
+
 
-class ProdutoListSerializer(serializers.ModelSerializer):
+class ProdutoListSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer otimizado para listagens"""
     categoria_nome = serializers.CharField(source='categoria.nome', read_only=True)
+    # Colunas geradas no banco (ver Produto.preco_final)
     preco_final = serializers.ReadOnlyField()
     em_promocao = serializers.ReadOnlyField()
-    desconto_percentual = serializers.ReadOnlyField()
+    desconto_percentual = DescontoPercentualField()
     disponivel_venda = serializers.ReadOnlyField()
+    imagem_srcset = SrcsetField()
 
     class Meta:
         model = Produto
@@ -43,26 +110,36 @@ class ProdutoListSerializer(serializers.ModelSerializer):
             'preco', 'preco_promocional', 'preco_final',
             'em_promocao', 'desconto_percentual',
             'estoque', 'disponivel_venda',
-            'imagem', 'em_destaque'
+            'imagem', 'imagem_srcset', 'em_destaque'
         ]
+        # Colunas lidas pelas properties (para o .only() de ?fields=)
+        dependencias = {'disponivel_venda': ['ativo', 'disponivel', 'estoque']}
+        # Properties na serialização compilada (produtos/serializacao.py), a partir das colunas acima
+        compilados = {'disponivel_venda': lambda linha: linha['ativo'] and linha['disponivel'] and linha['estoque'] > 0}
 
 
-class ProdutoDetailSerializer(serializers.ModelSerializer):
+class ProdutoDetailSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer completo para detalhes do produto"""
     categoria_nome = serializers.CharField(source='categoria.nome', read_only=True)
     categoria_slug = serializers.CharField(source='categoria.slug', read_only=True)
     imagens = ImagemProdutoSerializer(many=True, read_only=True)
 
-    # Campos calculados
+    # Campos calculados (preço e promoção vêm de colunas geradas no banco)
     preco_final = serializers.ReadOnlyField()
     em_promocao = serializers.ReadOnlyField()
-    desconto_percentual = serializers.ReadOnlyField()
+    desconto_percentual = DescontoPercentualField()
     estoque_baixo = serializers.ReadOnlyField()
     disponivel_venda = serializers.ReadOnlyField()
+    imagem_srcset = SrcsetField()
 
     class Meta:
         model = Produto
-        fields = '__all__'
+        exclude = ['busca', 'imagem_derivados', *Produto.CAMPOS_TENDENCIA]
+        expansiveis = ['imagens']
+        dependencias = {
+            'estoque_baixo': ['estoque', 'estoque_minimo'],
+            'disponivel_venda': ['ativo', 'disponivel', 'estoque'],
+        }
 
 
 class ProdutoCreateUpdateSerializer(serializers.ModelSerializer):
@@ -70,7 +147,10 @@ class ProdutoCreateUpdateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Produto
-        exclude = ['visualizacoes', 'vendas']
+        exclude = [
+            'visualizacoes', 'vendas', 'busca', 'imagem_derivados',
+            *Produto.CAMPOS_PRECO_GERADOS, *Produto.CAMPOS_TENDENCIA
+        ]
 
     def validate(self, data):
         # Validação: preço promocional deve ser menor que preço normal
@@ -0,0 +1,39 @@
+# produtos/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidar_colecoes
+from .imagens import agendar_derivados
+from .models import Categoria, ImagemProduto, Produto
+
+
+@receiver([post_save, post_delete], sender=Produto)
+@receiver([post_save, post_delete], sender=Categoria)
+@receiver([post_save, post_delete], sender=ImagemProduto)
+def invalidar_cache_catalogo(sender, **kwargs):
+    """
+    Qualquer alteração no catálogo invalida as coleções da vitrine, depois do
+    commit: antes dele, uma requisição recalcularia com as linhas antigas e as
+    gravaria na versão nova.
+
+    Escritas em massa (update(), bulk_create, COPY) não disparam post_save:
+    quem as faz (ações do admin, importar_produtos, aplicar_precos...) chama
+    invalidar_colecoes() por conta própria. atualizar_derivados usa update()
+    justamente para não agendar de novo a geração das miniaturas.
+    """
+    transaction.on_commit(invalidar_colecoes)
+
+
+@receiver(post_save, sender=Produto)
+@receiver(post_save, sender=ImagemProduto)
+def gerar_derivados_imagem(sender, instance, **kwargs):
+    """Imagem nova ou trocada: gera as miniaturas depois do commit, fora da requisição"""
+    if not instance.imagem:
+        if instance.imagem_derivados:
+            sender.objects.filter(pk=instance.pk).update(imagem_derivados={})
+            instance.imagem_derivados = {}
+        return
+
+    if instance.imagem.name != instance.imagem_derivados.get('origem'):
+        transaction.on_commit(lambda: agendar_derivados(sender, instance.pk))
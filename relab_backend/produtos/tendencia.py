@@ -0,0 +1,115 @@
+# produtos/tendencia.py
+"""
+Tendência dos produtos: visualizações e vendas recentes com decaimento
+exponencial (meia-vida TENDENCIA_MEIA_VIDA_HORAS).
+
+    tendencia = tendencia_anterior * 0.5 ** (horas_desde_a_ultima / meia_vida)
+                + PESO_VISUALIZACAO * visualizações novas
+                + PESO_VENDA * unidades vendidas novas
+
+Os eventos novos são a diferença entre os contadores que o detalhe do produto
+(`visualizacoes`, gravado em lote) e o checkout (`vendas`) já mantêm e os
+valores guardados na última atualização (`tendencia_visualizacoes`,
+`tendencia_vendas`). O comando atualizar_tendencia aplica tudo com um único
+UPDATE; /produtos/trending/ lê a coluna pelo índice parcial.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import MarcaProcessamento, Produto
+
+MARCA = 'tendencia:atualizado_em'
+
+PESO_VISUALIZACAO = 1.0
+PESO_VENDA = 10.0
+
+# Abaixo disso o produto sai da tendência (zera e deixa de ser regravado)
+MINIMO = 0.01
+
+
+def meia_vida_horas():
+    return float(getattr(settings, 'TENDENCIA_MEIA_VIDA_HORAS', 24))
+
+
+def atualizar():
+    """Aplica o decaimento desde a última execução e soma os eventos novos. Retorna os produtos alterados"""
+    agora = timezone.now()
+    with transaction.atomic():
+        marca = (
+            MarcaProcessamento.objects.select_for_update()
+            .filter(nome=MARCA).values_list('valor', flat=True).first()
+        )
+        if marca is None:
+            # Primeira execução: sem histórico de visualizações, parte das vendas
+            return backfill()
+
+        horas = max(agora.timestamp() - marca, 0) / 3600
+        fator = 0.5 ** (horas / meia_vida_horas())
+
+        tabela = Produto._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {tabela} SET
+                    tendencia = CASE WHEN novo.valor < %s THEN 0 ELSE novo.valor END,
+                    tendencia_visualizacoes = visualizacoes,
+                    tendencia_vendas = vendas
+                FROM (
+                    SELECT id,
+                           tendencia * %s
+                           + %s * GREATEST(visualizacoes - tendencia_visualizacoes, 0)
+                           + %s * GREATEST(vendas - tendencia_vendas, 0) AS valor
+                    FROM {tabela}
+                    WHERE tendencia > 0
+                       OR visualizacoes <> tendencia_visualizacoes
+                       OR vendas <> tendencia_vendas
+                ) AS novo
+                WHERE {tabela}.id = novo.id
+                """,
+                [MINIMO, fator, PESO_VISUALIZACAO, PESO_VENDA]
+            )
+            alterados = cursor.rowcount
+
+        MarcaProcessamento.objects.filter(nome=MARCA).update(valor=int(agora.timestamp()))
+    return alterados
+
+
+def backfill():
+    """
+    Recalcula a tendência a partir do histórico de ItemPedido (vendas de pedidos
+    não cancelados, cada uma com o decaimento desde a data do pedido).
+    Visualizações não têm histórico: os contadores atuais viram a base.
+    """
+    from .vendas import STATUS_SEM_VENDA
+
+    agora = timezone.now()
+    tabela = Produto._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {tabela} AS p SET
+                tendencia = CASE WHEN COALESCE(h.valor, 0) < %s THEN 0 ELSE h.valor END,
+                tendencia_visualizacoes = p.visualizacoes,
+                tendencia_vendas = p.vendas
+            FROM {tabela} AS base
+            LEFT JOIN (
+                SELECT i.produto_id,
+                       SUM(%s * i.quantidade * power(0.5, EXTRACT(EPOCH FROM (%s - pe.criado_em)) / 3600 / %s)) AS valor
+                FROM pedidos_itempedido i
+                JOIN pedidos_pedido pe ON pe.id = i.pedido_id
+                WHERE pe.status <> ALL(%s)
+                  AND pe.criado_em > %s::timestamptz - %s * interval '1 hour'
+                GROUP BY i.produto_id
+            ) AS h ON h.produto_id = base.id
+            WHERE p.id = base.id
+            """,
+            [
+                MINIMO, PESO_VENDA, agora, meia_vida_horas(), STATUS_SEM_VENDA,
+                # Vendas com mais de 30 meias-vidas pesam menos de um bilionésimo
+                agora, meia_vida_horas() * 30,
+            ]
+        )
+        alterados = cursor.rowcount
+        MarcaProcessamento.objects.update_or_create(nome=MARCA, defaults={'valor': int(agora.timestamp())})
+    return alterados
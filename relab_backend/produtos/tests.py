@@ -1,3 +1,835 @@
-from django.test import TestCase
+import csv
+import gzip
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from pedidos.models import ItemPedido, Pedido
+from usuarios.models import Endereco
+
+from .cache import invalidar_colecoes, versao_colecoes
+from . import colunar, contadores, feed, precos, relacionados, tendencia, visualizacoes
+from .vendas import ranking
+from .models import Categoria, CoocorrenciaProduto, MarcaProcessamento, PrecoProduto, Produto, VendaDiaria
+from .renderers import OrjsonRenderer
+from .visualizacoes import ContadorVisualizacoes
+
+
+class InvalidacaoColecoesTests(TestCase):
+    """A versão das coleções só muda depois do commit da alteração"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_versao_muda_so_no_commit(self):
+        produto = Produto.objects.create(nome='Produto', preco=Decimal('10.00'), estoque=5)
+        antes = versao_colecoes()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                produto.nome = 'Produto renomeado'
+                produto.save()
+                self.assertEqual(versao_colecoes(), antes)
+
+        self.assertGreater(versao_colecoes(), antes)
+
+
+class PromocoesCacheTests(APITestCase):
+    """A cache de /promocoes/ varia só com o que o paginador lê"""
+
+    def setUp(self):
+        cache.clear()
+        Produto.objects.create(
+            nome='Em promoção', preco=Decimal('100.00'), preco_promocional=Decimal('80.00'), estoque=5
+        )
+
+    def test_parametros_ignorados_nao_criam_entradas(self):
+        url = '/api/v1/produtos/promocoes/'
+        primeira = self.client.get(url, {'page': '1'})
+        self.assertEqual(primeira.status_code, 200)
+
+        with self.assertNumQueries(0):
+            for parametros in ({}, {'page': '01', 'lixo': 'x'}, {'lixo': 'y', 'page': '1', 'outro': 'z'}):
+                response = self.client.get(url, parametros)
+                self.assertEqual(response.data['results'], primeira.data['results'])
+
+    def test_links_sao_de_quem_pediu(self):
+        for i in range(20):
+            Produto.objects.create(
+                nome=f'Promoção {i}', preco=Decimal('100.00'), preco_promocional=Decimal('80.00'), estoque=5
+            )
+        url = '/api/v1/produtos/promocoes/'
+        primeira = self.client.get(url, {'lixo': 'x'})
+        self.assertEqual(primeira.data['next'], 'http://testserver/api/v1/produtos/promocoes/?lixo=x&page=2')
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'outro': 'z', 'page': '1'}, secure=True)
+        self.assertEqual(response.data['count'], 21)
+        self.assertEqual(response.data['results'], primeira.data['results'])
+        self.assertEqual(response.data['next'], 'https://testserver/api/v1/produtos/promocoes/?outro=z&page=2')
+        self.assertIsNone(response.data['previous'])
+
+        ultima = self.client.get(url, {'page': 'last'})
+        self.assertEqual(len(ultima.data['results']), 1)
+        self.assertIsNone(ultima.data['next'])
+        self.assertEqual(ultima.data['previous'], 'http://testserver/api/v1/produtos/promocoes/')
+        self.assertEqual(self.client.get(url, {'page': '3'}).status_code, 404)
+
+    def test_modo_cursor_nao_usa_cache(self):
+        url = '/api/v1/produtos/promocoes/'
+        self.client.get(url, {'paginacao': 'cursor'})
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'paginacao': 'cursor'})
+        self.assertEqual(len(response.data['results']), 1)
+
+
+class CamposDinamicosTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.produto = Produto.objects.create(nome='Produto campos', preco=Decimal('10.00'), estoque=2)
+
+    def test_detalhe_expande_imagens_por_padrao(self):
+        url = f'/api/v1/produtos/{self.produto.id}/'
+        self.assertIn('imagens', self.client.get(url).data)
+        self.assertNotIn('imagens', self.client.get(f'{url}?expand=').data)
+        self.assertEqual(set(self.client.get(f'{url}?fields=id,nome').data), {'id', 'nome'})
+
+    def test_campos_desconhecidos(self):
+        response = self.client.get('/api/v1/produtos/?fields=nome,custo&expand=fornecedor')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {
+            'fields': ['Campo(s) inválido(s): custo'],
+            'expand': ['Campo(s) inválido(s): fornecedor'],
+        })
+
+
+class PaginacaoCursorTests(APITestCase):
+    URL = '/api/v1/produtos/?paginacao=cursor&ordering=preco'
+
+    @classmethod
+    def setUpTestData(cls):
+        # Todos com o mesmo preço: a ordem entre eles sai só do desempate por id
+        cls.ids = [
+            Produto.objects.create(nome=f'Empate {i}', preco=Decimal('10.00'), estoque=1).id for i in range(45)
+        ]
+
+    def ids_da_pagina(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [produto['id'] for produto in response.data['results']], response.data
+
+    def test_empates_percorridos_uma_vez_e_em_ordem(self):
+        vistos, url = [], self.URL
+        while url:
+            ids, dados = self.ids_da_pagina(url)
+            vistos += ids
+            url = dados['next']
+        self.assertEqual(vistos, self.ids)
+
+    def test_proximo_cursor_estavel(self):
+        primeira, dados = self.ids_da_pagina(self.URL)
+        segunda, _ = self.ids_da_pagina(dados['next'])
+
+        # Um produto novo com o mesmo preço vai para o fim, sem deslocar as páginas já abertas
+        Produto.objects.create(nome='Empate novo', preco=Decimal('10.00'), estoque=1)
+        self.assertEqual(self.ids_da_pagina(dados['next'])[0], segunda)
+        _, dados_segunda = self.ids_da_pagina(dados['next'])
+        self.assertEqual(self.ids_da_pagina(dados_segunda['previous'])[0], primeira)
+
+    def test_cursor_invalido(self):
+        for cursor in ('lixo', 'eyJvIjpbIi1pZCJdLCJ2IjpbIngiXSwiciI6MH0='):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f'{self.URL}&cursor={cursor}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data, {'cursor': ['Cursor inválido.']})
+
+
+@override_settings(FACETAS_FAIXAS_PRECO=[50, 100])
+class FacetasTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ferramentas = Categoria.objects.create(nome='Ferramentas')
+        cls.jardim = Categoria.objects.create(nome='Jardim')
+        for categoria, preco, destaque, estoque in [
+            (cls.ferramentas, '30.00', True, 5),
+            (cls.ferramentas, '80.00', False, 0),
+            (cls.jardim, '120.00', True, 2),
+            (cls.jardim, '40.00', False, 1),
+        ]:
+            Produto.objects.create(
+                nome=f'{categoria.nome} {preco}', categoria=categoria, preco=Decimal(preco),
+                em_destaque=destaque, estoque=estoque
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def facetas(self, parametros):
+        response = self.client.get('/api/v1/produtos/facetas/', parametros)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def resumo(self, facetas):
+        return (
+            facetas['total'],
+            {categoria['nome']: categoria['total'] for categoria in facetas['categorias']},
+            [faixa['total'] for faixa in facetas['faixas_preco']],
+        )
+
+    def test_contagens_respeitam_os_outros_filtros(self):
+        self.assertEqual(self.resumo(self.facetas({})), (4, {'Ferramentas': 2, 'Jardim': 2}, [2, 1, 1]))
+
+        destaque = self.facetas({'em_destaque': 'true'})
+        self.assertEqual(self.resumo(destaque), (2, {'Ferramentas': 1, 'Jardim': 1}, [1, 0, 1]))
+        self.assertEqual(destaque['em_estoque'], 2)
+
+        ferramentas_em_estoque = self.facetas({'categoria': self.ferramentas.id, 'em_estoque': 'true'})
+        self.assertEqual(self.resumo(ferramentas_em_estoque), (1, {'Ferramentas': 1}, [1, 0, 0]))
+        self.assertEqual(ferramentas_em_estoque['em_destaque'], 1)
+
+        # Faixa de preço filtrada: as categorias contam só o que está dentro dela
+        self.assertEqual(self.resumo(self.facetas({'preco_min': '50'})), (2, {'Ferramentas': 1, 'Jardim': 1}, [0, 1, 1]))
+
+
+class SerializacaoCompiladaTests(APITestCase):
+    """Serialização compilada + orjson: os mesmos bytes do serializer do DRF + json"""
+
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nome='Eletrônicos')
+        derivados = {'origem': 'produtos/a.jpg', 'hash': 'ab' * 10, 'formatos': {
+            'webp': {'160': 'derivados/ab/a/160w.webp', '320': 'derivados/ab/a/320w.webp'},
+            'jpeg': {'160': 'derivados/ab/a/160w.jpg', '320': 'derivados/ab/a/320w.jpg'},
+        }}
+        Produto.objects.create(
+            nome='Em promoção', categoria=categoria, preco=Decimal('199.90'),
+            preco_promocional=Decimal('149.90'), estoque=3,
+            imagem='produtos/a.jpg', imagem_derivados=derivados,
+        )
+        Produto.objects.create(nome='Sem categoria \u2028 "aspas"', preco=Decimal('10.00'), estoque=0)
+        Produto.objects.create(
+            nome='Só original', categoria=categoria, preco=Decimal('0.01'), estoque=1, imagem='produtos/b.jpg'
+        )
+
+    def corpos(self, url):
+        corpos = []
+        for compilada in (False, True):
+            with override_settings(SERIALIZACAO_COMPILADA=compilada):
+                invalidar_colecoes()
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                corpos.append(response.content)
+        return corpos
+
+    def test_listagens_identicas(self):
+        for url in ('/api/v1/produtos/', '/api/v1/produtos/?paginacao=cursor', '/api/v1/produtos/promocoes/'):
+            with self.subTest(url=url):
+                drf, compilada = self.corpos(url)
+                self.assertEqual(compilada, drf)
+                self.assertIn(b'imagem_srcset', compilada)
+
+    def test_floats_nativos(self):
+        # Cada valor sozinho: um que caia no renderer do DRF não pode esconder os outros
+        for valor in (0.1, 1e-05, -2.5e-07, 0.0001, 1e15, 1e16, 1.5e300, Decimal('1E+20'), Decimal('0.00001')):
+            with self.subTest(valor=valor):
+                dados = {'valor': valor, 'lista': [valor]}
+                self.assertEqual(OrjsonRenderer().render(dados), JSONRenderer().render(dados))
+
+
+class ContadorVisualizacoesTests(TestCase):
+    """Visualizações acumuladas em memória e gravadas num único UPDATE por flush"""
+
+    def setUp(self):
+        self.produtos = [Produto.objects.create(nome=f'Produto {i}', preco=Decimal('10.00')) for i in range(2)]
+        # Intervalo longo: a thread não grava sozinha durante o teste
+        self.contador = ContadorVisualizacoes(intervalo=3600)
+
+    def visualizacoes(self):
+        return [produto.visualizacoes for produto in Produto.objects.order_by('id')]
+
+    def test_acumula_e_grava_em_lote(self):
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.contador.registrar(self.produtos[0].id)
+            self.contador.registrar(self.produtos[1].id, quantidade=5)
+        self.assertEqual(self.visualizacoes(), [0, 0])
+        self.assertTrue(self.contador.thread.is_alive())
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.contador.flush(), 8)
+        self.assertEqual(self.visualizacoes(), [3, 5])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.contador.flush(), 0)
+
+    def test_intervalo_zero_grava_na_hora(self):
+        contador = ContadorVisualizacoes(intervalo=0)
+        contador.registrar(self.produtos[0].id)
+        self.assertEqual(self.visualizacoes(), [1, 0])
+        self.assertIsNone(contador.thread)
+
+    def test_instancias_nao_registram_hooks(self):
+        with mock.patch('atexit.register') as atexit_register, mock.patch('os.register_at_fork') as at_fork:
+            ContadorVisualizacoes(intervalo=0)
+        atexit_register.assert_not_called()
+        at_fork.assert_not_called()
+
+    def test_fork_zera_o_estado_no_filho(self):
+        self.contador.registrar(self.produtos[0].id)
+        # O hook de fork é do contador do módulo
+        with mock.patch.object(visualizacoes, 'contador', self.contador), self.contador.lock:
+            # Fork com a trava tomada (como se a thread de flush estivesse gravando)
+            pid = os.fork()
+            if pid == 0:
+                filho = self.contador
+                ok = filho.thread is None and not filho.pendentes and filho.lock.acquire(blocking=False)
+                os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        # O pai segue com a própria thread e os próprios pendentes
+        self.assertTrue(self.contador.thread.is_alive())
+        self.assertEqual(self.contador.flush(), 1)
+
+
+class ProdutoSaveTests(TestCase):
+
+    def test_save_nao_carrega_a_busca_adiada(self):
+        Produto.objects.create(nome='Produto', preco=Decimal('100.00'), estoque=1)
+        produto = Produto.objects.get()
+        produto.nome = 'Renomeado'
+        with CaptureQueriesContext(connection) as queries:
+            produto.save()
+        selects_busca = [query['sql'] for query in queries if query['sql'].startswith('SELECT') and 'busca' in query['sql']]
+        self.assertEqual(selects_busca, [])
+        self.assertNotIn('busca', produto.__dict__)
+        # A busca continua sendo recalculada pelo banco
+        self.assertTrue(Produto.objects.filter(pk=produto.pk).buscar('renomeado').exists())
+
+
+class PrecoGeradoTests(APITestCase):
+    """Colunas geradas de preço: formato da resposta e recarga no save()"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_desconto_sem_promocao_e_inteiro(self):
+        Produto.objects.create(nome='Sem promoção', preco=Decimal('100.00'), estoque=1)
+        Produto.objects.create(nome='Com promoção', preco=Decimal('100.00'), preco_promocional=Decimal('75.00'), estoque=1)
+        for compilada in (False, True):
+            with self.subTest(compilada=compilada), override_settings(SERIALIZACAO_COMPILADA=compilada):
+                corpo = self.client.get('/api/v1/produtos/', {'ordering': 'nome'}).content
+                self.assertIn(b'"nome":"Sem promo\xc3\xa7\xc3\xa3o"', corpo)
+                self.assertIn(b'"desconto_percentual":0,', corpo)
+                self.assertIn(b'"desconto_percentual":25.0,', corpo)
+
+    def test_save_so_recarrega_quando_o_preco_muda(self):
+        Produto.objects.create(nome='Produto', preco=Decimal('100.00'), estoque=1)
+        produto = Produto.objects.get()
+
+        produto.nome = 'Renomeado'
+        with self.assertNumQueries(1):
+            produto.save()
+
+        produto.preco_promocional = Decimal('80.00')
+        produto.save()
+        self.assertEqual(produto.preco_final, Decimal('80.00'))
+        self.assertTrue(produto.em_promocao)
+
+        with self.assertNumQueries(1):
+            produto.save()
+
+        # Instância com preço adiado: o save não lê o preço só para comparar
+        produto = Produto.objects.only('id', 'nome').get()
+        produto.nome = 'Só o nome'
+        with CaptureQueriesContext(connection) as queries:
+            produto.save()
+        self.assertFalse([query['sql'] for query in queries if 'preco' in query['sql']])
+        self.assertNotIn('preco', produto.__dict__)
+
+
+class PrecosProgramadosTests(TestCase):
+    """Campanha aplicada por aplicar_precos e o preço base de volta ao encerrar"""
+
+    def setUp(self):
+        self.produto = Produto.objects.create(nome='Produto', sku='SKU-1', preco=Decimal('100.00'), estoque=1)
+        agora = timezone.now()
+        gravados = precos.programar(
+            [(1, 'SKU-1', None, Decimal('80.00')), (2, 'INEXISTENTE', Decimal('1.00'), None)],
+            'campanha', agora - timedelta(minutes=1), agora + timedelta(hours=1)
+        )
+        self.assertEqual(gravados, (1, 1))
+
+    def precos_atuais(self):
+        produto = Produto.objects.get(pk=self.produto.pk)
+        return produto.preco, produto.preco_promocional, produto.preco_final
+
+    def test_troca_e_volta_do_preco(self):
+        self.assertEqual(precos.aplicar(), [self.produto.pk])
+        self.assertEqual(self.precos_atuais(), (Decimal('100.00'), Decimal('80.00'), Decimal('80.00')))
+        # Nada novo desde a última execução
+        self.assertEqual(precos.aplicar(), [])
+
+        self.assertEqual(precos.encerrar_campanha('campanha'), (1, [self.produto.pk]))
+        self.assertEqual(self.precos_atuais(), (Decimal('100.00'), None, Decimal('100.00')))
+
+    def test_alteracao_direta_continua_depois_da_campanha(self):
+        precos.aplicar()
+        produto = Produto.objects.get(pk=self.produto.pk)
+        produto.preco_promocional = Decimal('70.00')
+        produto.save()
+        self.assertEqual(PrecoProduto.objects.filter(produto=produto, campanha='', valido_ate=None).count(), 2)
+        # Salvar de novo sem mudar o preço não grava outra linha
+        self.assertEqual(precos.registrar_alteracoes([produto.pk]), 0)
+
+        self.assertEqual(precos.encerrar_campanha('campanha'), (1, []))
+        self.assertEqual(self.precos_atuais(), (Decimal('100.00'), Decimal('70.00'), Decimal('70.00')))
+
+
+    def test_historico_com_data_impossivel(self):
+        precos.aplicar()
+        url = f'/api/v1/produtos/{self.produto.pk}/historico_precos/'
+        for parametros in ({'de': '2024-02-30T10:00'}, {'ate': '2024-02-30'}, {'ate': '9999-12-31'}, {'de': 'ontem'}):
+            with self.subTest(parametros=parametros):
+                response = self.client.get(url, parametros)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.json()), list(parametros))
+
+        response = self.client.get(url, {'de': '2024-02-29T10:00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+class ContadoresCategoriaTests(TestCase):
+    """Triggers da migração 0011: contadores iguais à contagem completa após cada escrita"""
+
+    def setUp(self):
+        self.eletronicos = Categoria.objects.create(nome='Eletrônicos')
+        self.livros = Categoria.objects.create(nome='Livros')
+
+    def contadores(self, categoria):
+        categoria.refresh_from_db(fields=Categoria.CAMPOS_CONTADORES)
+        self.assertEqual(contadores.divergencias(), [])
+        return categoria.produtos_ativos, categoria.produtos_disponiveis, categoria.produtos_em_estoque
+
+    def test_insert_update_delete(self):
+        produto = Produto.objects.create(nome='A', categoria=self.eletronicos, preco=Decimal('10.00'), estoque=2)
+        Produto.objects.create(nome='B', categoria=self.eletronicos, preco=Decimal('10.00'), estoque=0)
+        self.assertEqual(self.contadores(self.eletronicos), (2, 2, 1))
+
+        produto.categoria = self.livros
+        produto.save()
+        self.assertEqual(self.contadores(self.eletronicos), (1, 1, 0))
+        self.assertEqual(self.contadores(self.livros), (1, 1, 1))
+
+        produto.delete()
+        self.assertEqual(self.contadores(self.livros), (0, 0, 0))
+
+    def test_update_em_massa(self):
+        for i in range(3):
+            Produto.objects.create(nome=f'P{i}', categoria=self.eletronicos, preco=Decimal('10.00'), estoque=i)
+        self.assertEqual(self.contadores(self.eletronicos), (3, 3, 2))
+
+        Produto.objects.filter(estoque__gt=0).update(disponivel=False)
+        self.assertEqual(self.contadores(self.eletronicos), (3, 1, 0))
+
+        Produto.objects.update(categoria=self.livros, estoque=5, disponivel=True)
+        self.assertEqual(self.contadores(self.eletronicos), (0, 0, 0))
+        self.assertEqual(self.contadores(self.livros), (3, 3, 3))
+
+    def test_corrigir(self):
+        Produto.objects.create(nome='A', categoria=self.eletronicos, preco=Decimal('10.00'), estoque=1)
+        Categoria.objects.filter(pk=self.eletronicos.pk).update(produtos_ativos=7)
+        self.assertEqual(
+            contadores.divergencias(), [(self.eletronicos.pk, 'Eletrônicos', (7, 1, 1), (1, 1, 1))]
+        )
+        self.assertEqual(contadores.corrigir(), [self.eletronicos.pk])
+        self.assertEqual(self.contadores(self.eletronicos), (1, 1, 1))
+
+
+class CatalogoColunarTests(TransactionTestCase):
+    """Snapshot atualizado pelas versões (alterações) e pelos contadores (produtos apagados)"""
+
+    def setUp(self):
+        self.categoria = Categoria.objects.create(nome='Eletrônicos')
+        self.produtos = [
+            Produto.objects.create(
+                nome=f'Produto {i}', categoria=self.categoria if i % 2 else None, preco=Decimal('10.00'), estoque=i
+            )
+            for i in range(10)
+        ]
+        self.inativo = Produto.objects.create(nome='Inativo', preco=Decimal('10.00'), ativo=False)
+        self.catalogo = colunar.Catalogo.carregar()
+        self.assertEqual(len(self.catalogo), 10)
+
+    def ids(self, catalogo):
+        return catalogo.colunas['id'].tolist()
+
+    def test_sem_alteracoes_mantem_o_snapshot(self):
+        self.assertIs(self.catalogo.atualizado(), self.catalogo)
+
+    def test_update(self):
+        produto = self.produtos[1]
+        produto.preco_promocional = Decimal('5.00')
+        produto.save()
+        Produto.objects.filter(pk=self.produtos[2].pk).update(disponivel=False)
+        Produto.objects.filter(pk=self.inativo.pk).update(ativo=True)
+
+        catalogo = self.catalogo.atualizado()
+        self.assertEqual(colunar.divergencias(catalogo), ([], [], []))
+        self.assertNotIn(self.produtos[2].pk, self.ids(catalogo))
+        self.assertIn(self.inativo.pk, self.ids(catalogo))
+        posicao = self.ids(catalogo).index(produto.pk)
+        self.assertEqual(catalogo.colunas['preco_final'][posicao], 500)
+        self.assertTrue(catalogo.colunas['flags'][posicao] & colunar.PROMOCAO)
+
+    def test_delete(self):
+        # Apagar não deixa versão: quem tira do snapshot é a conferência dos contadores
+        apagados = [self.produtos[3].pk, self.produtos[4].pk]
+        Produto.objects.filter(pk__in=apagados).delete()
+
+        catalogo = self.catalogo.atualizado()
+        self.assertEqual(colunar.divergencias(catalogo), ([], [], []))
+        self.assertEqual(len(catalogo), 8)
+        self.assertFalse(set(apagados) & set(self.ids(catalogo)))
+
+
+class ImportarProdutosTests(TestCase):
+
+    def importar(self, conteudo):
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, 'produtos.csv')
+            with open(caminho, 'w', encoding='utf-8') as arquivo:
+                arquivo.write(conteudo)
+            call_command('importar_produtos', caminho, stdout=StringIO(), stderr=StringIO())
+
+    def test_slugs_do_lote_nao_colidem_entre_bases(self):
+        Produto.objects.create(nome='Cabo USB', sku='EXISTENTE', preco=Decimal('10.00'))
+        self.importar(
+            'sku,nome,preco\n'
+            'A,Cabo USB 2,10.00\n'
+            'B,Cabo USB,10.00\n'
+            'C,Cabo USB 1,10.00\n'
+            'D,Cabo USB,10.00\n'
+            'B,Cabo USB,12.00\n'
+        )
+        self.assertEqual(
+            dict(Produto.objects.values_list('sku', 'slug')),
+            {'EXISTENTE': 'cabo-usb', 'A': 'cabo-usb-2', 'B': 'cabo-usb-1', 'C': 'cabo-usb-1-1', 'D': 'cabo-usb-3'}
+        )
+        self.assertEqual(Produto.objects.get(sku='B').preco, Decimal('12.00'))
+
+
+class CategoriaArvoreTests(TestCase):
+    """Caminho materializado mantido pelo save() e subárvore por prefixo"""
+
+    def setUp(self):
+        self.raiz = Categoria.objects.create(nome='Informática')
+        self.filha = Categoria.objects.create(nome='Periféricos', pai=self.raiz)
+        self.neta = Categoria.objects.create(nome='Teclados', pai=self.filha)
+        self.outra = Categoria.objects.create(nome='Escritório')
+
+    def caminhos(self):
+        return dict(Categoria.objects.values_list('nome', 'caminho'))
+
+    def test_mover_subarvore_reescreve_descendentes(self):
+        self.assertEqual(self.neta.caminho, f'{self.raiz.pk}/{self.filha.pk}/{self.neta.pk}/')
+
+        self.filha.pai = self.outra
+        self.filha.save()
+        self.assertEqual(self.caminhos(), {
+            'Informática': f'{self.raiz.pk}/',
+            'Periféricos': f'{self.outra.pk}/{self.filha.pk}/',
+            'Teclados': f'{self.outra.pk}/{self.filha.pk}/{self.neta.pk}/',
+            'Escritório': f'{self.outra.pk}/',
+        })
+
+        # Virar raiz também leva as descendentes
+        self.filha.pai = None
+        self.filha.save()
+        self.assertEqual(self.caminhos()['Teclados'], f'{self.filha.pk}/{self.neta.pk}/')
+
+    def test_pai_dentro_da_propria_subarvore_e_recusado(self):
+        antes = self.caminhos()
+        for pai in (self.raiz, self.neta):
+            with self.subTest(pai=pai.nome):
+                self.raiz.pai = pai
+                with self.assertRaises(ValidationError):
+                    self.raiz.full_clean()
+                with self.assertRaises(ValidationError):
+                    self.raiz.save()
+        self.assertEqual(self.caminhos(), antes)
+
+    def test_mais_vendidos_da_categoria_inclui_subcategorias(self):
+        hoje = timezone.localdate()
+        vendidos = []
+        for categoria, unidades in ((self.neta, 5), (self.filha, 3), (self.outra, 9)):
+            produto = Produto.objects.create(nome=f'Produto {categoria.nome}', categoria=categoria, preco=Decimal('10.00'))
+            VendaDiaria.objects.create(produto=produto, data=hoje, unidades=unidades)
+            vendidos.append((produto.pk, unidades))
+
+        self.assertEqual(ranking(7, categoria=self.raiz.pk), vendidos[:2])
+        self.assertEqual(ranking(7, categoria=self.neta.pk), vendidos[:1])
+        self.assertEqual(ranking(7, categoria=0), [])
+
+
+class RelacionadosTests(TransactionTestCase):
+    """TransactionTestCase: a tabela temporária do COPY (ON COMMIT DELETE ROWS) só esvazia com commit de verdade"""
+
+    def setUp(self):
+        usuario = get_user_model().objects.create_user(
+            'comprador', 'comprador@relab.co', password=None, cpf='52998224725', telefone='11987654321'
+        )
+        self.endereco = Endereco.objects.create(
+            usuario=usuario, titulo='Casa', cep='01001000', logradouro='Praça da Sé',
+            numero='1', bairro='Sé', cidade='São Paulo', estado='SP',
+        )
+        self.produtos = [
+            Produto.objects.create(nome=f'Relacionado {i}', preco=Decimal('10.00'), estoque=10) for i in range(3)
+        ]
+
+    def pedido(self, *produtos, criado_em=None):
+        pedido = Pedido.objects.create(
+            usuario=self.endereco.usuario, endereco=self.endereco, forma_pagamento='pix', subtotal=Decimal('10.00')
+        )
+        for produto in produtos:
+            ItemPedido.objects.create(pedido=pedido, produto=produto, quantidade=1)
+        if criado_em:
+            Pedido.objects.filter(pk=pedido.pk).update(criado_em=criado_em)
+        return pedido
+
+    def cancelar(self, *pedidos):
+        Pedido.objects.filter(pk__in=[pedido.pk for pedido in pedidos]).update(
+            status='cancelado', cancelado_em=timezone.now()
+        )
+
+    def contagens(self):
+        ids = {produto.id: i for i, produto in enumerate(self.produtos)}
+        return {
+            (ids[a], ids[b]): n
+            for a, b, n in CoocorrenciaProduto.objects.values_list('produto_a_id', 'produto_b_id', 'pedidos')
+        }
+
+    def executar(self, limite):
+        cancelados, _ = relacionados.descontar_cancelados(limite)
+        list(relacionados.processar_pedidos(limite))
+        return cancelados
+
+    def test_contar_pares(self):
+        # Pedido 1 tem o produto 20 em duas linhas: conta uma vez
+        a, b, n = relacionados.contar_pares([1, 1, 1, 2, 2, 3], [10, 20, 20, 10, 30, 20])
+        self.assertEqual(
+            set(zip(a.tolist(), b.tolist(), n.tolist())),
+            {(10, 10, 2), (20, 20, 2), (30, 30, 1), (10, 20, 1), (10, 30, 1)}
+        )
+
+    def test_marca_para_no_primeiro_pedido_recente(self):
+        p0, p1, p2 = self.produtos
+        antigo = timezone.now() - timedelta(hours=1)
+        self.pedido(p0, p1, criado_em=antigo)
+        ultimo_antigo = self.pedido(p0, p1, p2, criado_em=antigo)
+        self.pedido(p1, p2)
+        # Mais antigo que o anterior, mas com id maior: também espera
+        self.pedido(p0, p2, criado_em=antigo)
+
+        self.executar(relacionados.calcular_limite(timedelta(minutes=10)))
+
+        self.assertEqual(relacionados.ler_marca(), ultimo_antigo.pk)
+        self.assertEqual(self.contagens(), {
+            (0, 0): 2, (1, 1): 2, (2, 2): 1, (0, 1): 2, (0, 2): 1, (1, 2): 1,
+        })
+
+    def test_cancelado_depois_de_somado_e_descontado_uma_vez(self):
+        p0, p1, p2 = self.produtos
+        antigo = timezone.now() - timedelta(hours=1)
+        self.pedido(p0, p1, criado_em=antigo)
+        somado = self.pedido(p0, p1, p2, criado_em=antigo)
+        nunca_somado = self.pedido(p1, p2)
+        self.executar(relacionados.calcular_limite(timedelta(minutes=1)))
+        self.assertEqual(self.contagens()[(0, 1)], 2)
+
+        self.cancelar(somado, nunca_somado)
+        limite = relacionados.calcular_limite(timedelta(minutes=-1))
+        self.assertEqual(self.executar(limite), 1)
+        self.assertEqual(relacionados.ler_marca(), nunca_somado.pk)
+        # Zerados somem; o pedido cancelado antes de somado não é descontado
+        self.assertEqual(self.contagens(), {(0, 0): 1, (1, 1): 1, (0, 1): 1})
+
+        # A janela seguinte começa no limite anterior: nada é descontado de novo
+        self.assertEqual(self.executar(limite + timedelta(minutes=1)), 0)
+        self.assertEqual(self.contagens(), {(0, 0): 1, (1, 1): 1, (0, 1): 1})
+
+
+class FeedTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ferramentas = Categoria.objects.create(nome='Ferramentas')
+        cls.jardim = Categoria.objects.create(nome='Jardim')
+        cls.chave = Produto.objects.create(
+            nome='Chave <Philips> & Fenda', sku='CHV-1', preco=Decimal('20.00'), estoque=3, categoria=cls.ferramentas
+        )
+        cls.regador = Produto.objects.create(
+            nome='Regador', preco=Decimal('35.00'), preco_promocional=Decimal('30.00'), estoque=0,
+            categoria=cls.jardim
+        )
+        Produto.objects.create(nome='Fora do feed', preco=Decimal('10.00'), estoque=1, ativo=False)
+
+    def baixar(self, formato, **extra):
+        response = self.client.get(f'/api/v1/produtos/feed/?formato={formato}', **extra)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        linhas = list(csv.DictReader(StringIO(self.baixar('csv').decode('utf-8'))))
+
+        self.assertEqual([linha['id'] for linha in linhas], ['CHV-1', str(self.regador.id)])
+        self.assertEqual(linhas[0]['title'], 'Chave <Philips> & Fenda')
+        self.assertEqual(linhas[0]['product_type'], 'Ferramentas')
+        self.assertEqual(linhas[1]['availability'], 'out_of_stock')
+        self.assertEqual(linhas[1]['price'], '35.00 BRL')
+
+    def test_xml_escapado_e_gzip(self):
+        conteudo = gzip.decompress(self.baixar('xml', HTTP_ACCEPT_ENCODING='gzip'))
+        g = '{http://base.google.com/ns/1.0}'
+        itens = ElementTree.fromstring(conteudo).findall('channel/item')
+
+        self.assertEqual([item.findtext(f'{g}title') for item in itens], ['Chave <Philips> & Fenda', 'Regador'])
+        self.assertEqual(itens[1].findtext(f'{g}sale_price'), '30.00 BRL')
+        self.assertIsNone(itens[0].find(f'{g}sale_price'))
+
+    def test_formato_desconhecido(self):
+        self.assertEqual(self.client.get('/api/v1/produtos/feed/?formato=pdf').status_code, 400)
+
+    def test_shards_regravados_quando_a_categoria_muda(self):
+        def gerar():
+            saida = StringIO()
+            call_command('gerar_feeds', formatos='csv', url_base='https://relab.co/', stdout=saida)
+            return saida.getvalue()
+
+        # Um produto por shard
+        with tempfile.TemporaryDirectory() as pasta, self.settings(MEDIA_ROOT=pasta, FEED_PRODUTOS_POR_SHARD=1):
+            self.assertIn('2 shard(s) regravado(s)', gerar())
+            self.assertIn('0 shard(s) regravado(s)', gerar())
+
+            self.ferramentas.nome = 'Ferramentas manuais'
+            self.ferramentas.save()
+            self.assertIn('1 shard(s) regravado(s)', gerar())
+            with open(os.path.join(pasta, 'feeds', 'produtos.csv.gz'), 'rb') as arquivo:
+                self.assertIn('Ferramentas manuais', gzip.decompress(arquivo.read()).decode('utf-8'))
+
+            # SET_NULL via update(): o produto não muda, mas o shard perde a categoria
+            self.jardim.delete()
+            self.assertIn('1 shard(s) regravado(s)', gerar())
+            self.assertEqual(feed.shards()[self.regador.id].categorizados, 0)
+
+
+@override_settings(IMAGENS_DERIVADOS_ASSINCRONO=False, IMAGENS_LARGURAS=[160, 320, 640])
+class DerivadosImagensTests(APITestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        configuracao = self.settings(MEDIA_ROOT=pasta.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def png(self):
+        # 400x200 com metade transparente
+        imagem = Image.new('RGBA', (400, 200), (200, 30, 30, 255))
+        imagem.paste((0, 0, 0, 0), (0, 0, 200, 200))
+        buffer = BytesIO()
+        imagem.save(buffer, format='PNG')
+        return SimpleUploadedFile('foto.png', buffer.getvalue(), content_type='image/png')
+
+    def criar(self, nome):
+        with self.captureOnCommitCallbacks(execute=True):
+            produto = Produto.objects.create(nome=nome, preco=Decimal('10.00'), estoque=1, imagem=self.png())
+        produto.refresh_from_db()
+        return produto
+
+    def abrir(self, caminho):
+        with default_storage.open(caminho, 'rb') as arquivo:
+            imagem = Image.open(BytesIO(arquivo.read()))
+            imagem.load()
+        return imagem
+
+    def test_upload_gera_derivados(self):
+        produto = self.criar('Com foto')
+        derivados = produto.imagem_derivados
+
+        self.assertEqual(derivados['origem'], produto.imagem.name)
+        # 640 é maior que o original: não amplia
+        for formato in ('webp', 'jpeg'):
+            self.assertEqual(set(derivados['formatos'][formato]), {'160', '320'})
+
+        webp = self.abrir(derivados['formatos']['webp']['320'])
+        self.assertEqual((webp.format, webp.size, webp.mode), ('WEBP', (320, 160), 'RGBA'))
+        # JPEG sem transparência: a metade transparente vira fundo branco
+        jpeg = self.abrir(derivados['formatos']['jpeg']['160'])
+        self.assertEqual((jpeg.format, jpeg.size, jpeg.mode), ('JPEG', (160, 80), 'RGB'))
+        self.assertGreater(min(jpeg.getpixel((10, 40))), 240)
+
+        srcset = self.client.get(f'/api/v1/produtos/{produto.id}/').data['imagem_srcset']['webp']
+        self.assertEqual(srcset.count('w, '), 1)
+        self.assertTrue(srcset.endswith('320w'))
+
+    def test_mesma_imagem_reaproveita_os_arquivos(self):
+        primeiro, segundo = self.criar('Primeiro'), self.criar('Segundo')
+        self.assertNotEqual(primeiro.imagem.name, segundo.imagem.name)
+        self.assertEqual(primeiro.imagem_derivados['formatos'], segundo.imagem_derivados['formatos'])
+
+        # Salvar de novo sem trocar a imagem não agenda outra geração
+        with self.captureOnCommitCallbacks() as callbacks:
+            segundo.save()
+        self.assertEqual(len(callbacks), 1)  # só a invalidação do cache
+
+
+@override_settings(TENDENCIA_MEIA_VIDA_HORAS=24)
+class TendenciaTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def produto(self, nome, **contadores):
+        produto = Produto.objects.create(nome=nome, preco=Decimal('10.00'), estoque=1)
+        Produto.objects.filter(pk=produto.pk).update(**contadores)
+        return produto
+
+    def test_decaimento_ordena_os_recentes_na_frente(self):
+        # Última atualização há duas meias-vidas: o acumulado antigo cai para 1/4
+        MarcaProcessamento.objects.create(
+            nome=tendencia.MARCA, valor=int((timezone.now() - timedelta(hours=48)).timestamp())
+        )
+        antigo = self.produto('Popular semana passada', tendencia=40)
+        visto = self.produto('Visto agora', visualizacoes=15)
+        vendido = self.produto('Vendido agora', vendas=2, visualizacoes=3, tendencia_visualizacoes=3)
+        esquecido = self.produto('Esquecido', tendencia=0.03)
+
+        self.assertEqual(tendencia.atualizar(), 4)
+
+        valores = dict(Produto.objects.values_list('id', 'tendencia'))
+        self.assertAlmostEqual(valores[antigo.id], 10, places=2)
+        self.assertEqual(valores[visto.id], 15)
+        self.assertEqual(valores[vendido.id], 20)
+        self.assertEqual(valores[esquecido.id], 0)
+
+        response = self.client.get('/api/v1/produtos/trending/')
+        self.assertEqual([produto['id'] for produto in response.data], [vendido.id, visto.id, antigo.id])
+
+        # Sem eventos novos, a próxima execução só decai (e não conta de novo os já somados)
+        tendencia.atualizar()
+        self.assertAlmostEqual(Produto.objects.get(pk=visto.pk).tendencia, 15, places=3)
@@ -1,13 +1,14 @@
 # produtos/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CategoriaViewSet, ProdutoViewSet
+from .views import CategoriaViewSet, ProdutoViewSet, feed_produtos
 
 router = DefaultRouter()
 router.register(r'categorias', CategoriaViewSet, basename='categoria')
 router.register(r'', ProdutoViewSet, basename='produto')
 
 urlpatterns = [
+    path('feed/', feed_produtos, name='produtos-feed'),
     path('', include(router.urls)),
 ]
 
@@ -20,4 +21,6 @@ urlpatterns = [
 # DELETE /api/v1/produtos/{id}/               - Deleta produto
 # GET    /api/v1/produtos/categorias/         - Lista categorias
 # POST   /api/v1/produtos/categorias/         - Cria categoria
-# GET    /api/v1/produtos/categorias/{id}/    - Detalhe da categoria
\ No newline at end of file
+# GET    /api/v1/produtos/categorias/{id}/    - Detalhe da categoria
+# GET    /api/v1/produtos/categorias/arvore/  - Árvore de categorias (subcategorias aninhadas)
+# GET    /api/v1/produtos/feed/?formato=      - Feed do catálogo (csv, xml ou jsonl)
\ No newline at end of file
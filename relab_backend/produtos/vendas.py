@@ -0,0 +1,118 @@
+# produtos/vendas.py
+"""
+Vendas diárias por produto (VendaDiaria) e rankings de mais vendidos.
+
+A tabela é mantida de forma incremental pelo comando atualizar_vendas: os
+dias (data local do pedido) que tiveram algum pedido criado ou alterado desde
+a última execução (`Pedido.atualizado_em`) são recalculados a partir de
+ItemPedido + Pedido.status. Recalcular o dia inteiro torna a operação
+idempotente, então a marca d'água pode voltar alguns minutos a cada execução
+para cobrir transações que ainda não tinham feito commit.
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Subquery, Sum
+from django.utils import timezone
+
+from .models import Categoria, MarcaProcessamento, VendaDiaria
+
+MARCA = 'vendas_diarias:atualizado_em'
+
+# Pedidos que não contam como venda
+STATUS_SEM_VENDA = ['cancelado', 'pagamento_rejeitado']
+
+JANELAS = (7, 30, 90)
+
+
+def dias_alterados(desde):
+    """Datas (no fuso do site) dos pedidos criados ou alterados depois de `desde`"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT DISTINCT (criado_em AT TIME ZONE %s)::date
+            FROM pedidos_pedido WHERE atualizado_em > %s
+            ORDER BY 1
+            """,
+            [settings.TIME_ZONE, desde]
+        )
+        return [linha[0] for linha in cursor.fetchall()]
+
+
+def recalcular_dias(dias):
+    """Regrava VendaDiaria das datas em `dias` (uma transação); retorna as linhas gravadas"""
+    if not dias:
+        return 0
+
+    # Intervalo em criado_em para usar o índice; a data local filtra os dias exatos
+    fuso = timezone.get_default_timezone()
+    inicio = datetime.combine(min(dias), time.min, tzinfo=fuso)
+    fim = datetime.combine(max(dias) + timedelta(days=1), time.min, tzinfo=fuso)
+
+    tabela = VendaDiaria._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {tabela} WHERE data = ANY(%s)', [list(dias)])
+        cursor.execute(
+            f"""
+            INSERT INTO {tabela} (produto_id, data, unidades, receita, pedidos)
+            SELECT i.produto_id, (p.criado_em AT TIME ZONE %s)::date,
+                   SUM(i.quantidade), SUM(i.subtotal), COUNT(DISTINCT p.id)
+            FROM pedidos_pedido p
+            JOIN pedidos_itempedido i ON i.pedido_id = p.id
+            WHERE p.criado_em >= %s AND p.criado_em < %s
+              AND (p.criado_em AT TIME ZONE %s)::date = ANY(%s)
+              AND p.status <> ALL(%s)
+            GROUP BY 1, 2
+            """,
+            [settings.TIME_ZONE, inicio, fim, settings.TIME_ZONE, list(dias), STATUS_SEM_VENDA]
+        )
+        return cursor.rowcount
+
+
+def atualizar(sobreposicao=timedelta(minutes=10), dias_por_lote=31, desde=None):
+    """
+    Recalcula os dias alterados desde a marca d'água (ou desde a data `desde`)
+    e avança a marca. Retorna (dias recalculados, linhas gravadas).
+    """
+    agora = timezone.now()
+    if desde is None:
+        marca = MarcaProcessamento.objects.filter(nome=MARCA).values_list('valor', flat=True).first() or 0
+        dias = dias_alterados(datetime.fromtimestamp(marca, tz=dt_timezone.utc))
+    else:
+        dias = [dia for dia in dias_alterados(datetime.fromtimestamp(0, tz=dt_timezone.utc)) if dia >= desde]
+        # Dias que não têm mais pedidos (ex.: pedidos apagados) saem da tabela
+        VendaDiaria.objects.filter(data__gte=desde).exclude(data__in=dias).delete()
+
+    linhas = 0
+    for inicio in range(0, len(dias), dias_por_lote):
+        linhas += recalcular_dias(dias[inicio:inicio + dias_por_lote])
+
+    # A próxima execução revê os últimos minutos (commits atrasados)
+    MarcaProcessamento.objects.update_or_create(
+        nome=MARCA, defaults={'valor': int((agora - sobreposicao).timestamp())}
+    )
+    return len(dias), linhas
+
+
+def ranking(dias, categoria=None, limite=10):
+    """
+    [(produto_id, unidades)] dos mais vendidos nos últimos `dias` dias (produtos
+    à venda), opcionalmente da categoria `categoria` (id) e das subcategorias
+    """
+    inicio = timezone.localdate() - timedelta(days=dias - 1)
+    vendas = VendaDiaria.objects.filter(
+        data__gte=inicio,
+        produto__ativo=True,
+        produto__disponivel=True
+    )
+    if categoria is not None:
+        # Subárvore pelo prefixo do caminho, como ProdutoFilter e /categorias/{id}/produtos/
+        caminho = Categoria.objects.filter(pk=categoria).values('caminho')[:1]
+        vendas = vendas.filter(produto__categoria__caminho__startswith=Subquery(caminho))
+    return list(
+        vendas.values('produto')
+        .annotate(total=Sum('unidades'))
+        .order_by('-total', 'produto')
+        .values_list('produto', 'total')[:limite]
+    )
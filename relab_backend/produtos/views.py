@@ -1,10 +1,21 @@
 # produtos/views.py
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAdminUser, AllowAny
+from rest_framework.renderers import BrowsableAPIRenderer
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Count, Avg
+from django_filters.utils import translate_validation
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+import itertools
+from datetime import datetime, time, timedelta
 from .models import Categoria, Produto, ImagemProduto
 from .serializers import (
     CategoriaListSerializer,
@@ -12,12 +23,22 @@ from .serializers import (
     ProdutoListSerializer,
     ProdutoDetailSerializer,
     ProdutoCreateUpdateSerializer,
-    ImagemProdutoSerializer
+    ImagemProdutoSerializer,
+    PrecoProdutoSerializer
 )
-from .filters import ProdutoFilter
-
-
-class CategoriaViewSet(viewsets.ModelViewSet):
+from .filters import ProdutoFilter, BuscaTextualFilter, OrdenacaoFilter, aplicar_apelidos
+from .pagination import PaginacaoHibrida
+from .cache import colecao_em_cache, chave_variacao
+from .categorias import arvore_json
+from .campos import CamposDinamicosViewMixin
+from .facetas import contar_facetas
+from .vendas import JANELAS, ranking
+from .renderers import OrjsonRenderer
+from .serializacao import SerializacaoCompiladaViewMixin
+from . import colunar, feed
+
+
+class CategoriaViewSet(SerializacaoCompiladaViewMixin, viewsets.ModelViewSet):
     """
     ViewSet para Categorias
     - GET: Público (qualquer um pode ver)
@@ -28,6 +49,8 @@ class CategoriaViewSet(viewsets.ModelViewSet):
     search_fields = ['nome', 'descricao']
     ordering_fields = ['nome', 'ordem', 'criado_em']
     ordering = ['ordem', 'nome']
+    pagination_class = PaginacaoHibrida
+    renderer_classes = [OrjsonRenderer, BrowsableAPIRenderer]
 
     # ✅ ADICIONAR ISSO
     permission_classes = [IsAuthenticatedOrReadOnly]  # Leitura pública, escrita autenticada
@@ -39,49 +62,70 @@ class CategoriaViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        queryset = queryset.annotate(
-            produtos_count=Count('produtos', filter=Q(produtos__ativo=True))
-        )
 
+        # Contadores mantidos pelo banco (ver produtos/contadores.py)
         if self.request.query_params.get('com_produtos') == 'true':
-            queryset = queryset.filter(produtos_count__gt=0)
+            queryset = queryset.filter(produtos_ativos__gt=0)
 
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        context = self.get_serializer_context()
+        queryset = self.preparar_lista(self.filter_queryset(self.get_queryset()), CategoriaListSerializer, context)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.serializar_lista(page, CategoriaListSerializer, context))
+
+        return Response(self.serializar_lista(queryset, CategoriaListSerializer, context))
+
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    def arvore(self, request):
+        """Endpoint público: categorias ativas aninhadas (JSON pronto em cache, ver produtos/categorias.py)"""
+        return HttpResponse(arvore_json(), content_type='application/json')
+
     @action(detail=True, methods=['get'])
     def produtos(self, request, pk=None):
-        """Retorna todos os produtos de uma categoria"""
+        """Retorna todos os produtos de uma categoria e das subcategorias"""
         categoria = self.get_object()
-        produtos = categoria.produtos.filter(ativo=True, disponivel=True)
+        produtos = Produto.objects.select_related('categoria').na_categoria(categoria.caminho).filter(
+            ativo=True,
+            disponivel=True
+        )
 
         ordenar = request.query_params.get('ordenar', '-criado_em')
-        produtos = produtos.order_by(ordenar)
+        produtos = self.preparar_lista(produtos.order_by(ordenar), ProdutoListSerializer)
 
         page = self.paginate_queryset(produtos)
         if page is not None:
-            serializer = ProdutoListSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            return self.get_paginated_response(self.serializar_lista(page, ProdutoListSerializer))
 
-        serializer = ProdutoListSerializer(produtos, many=True)
-        return Response(serializer.data)
+        return Response(self.serializar_lista(produtos, ProdutoListSerializer))
 
 
-class ProdutoViewSet(viewsets.ModelViewSet):
+class ProdutoViewSet(CamposDinamicosViewMixin, SerializacaoCompiladaViewMixin, viewsets.ModelViewSet):
     """
     ViewSet para Produtos
     - GET: Público
     - POST/PUT/DELETE: Apenas admin
+    - ?fields=/?expand= na listagem e no detalhe (ver produtos/campos.py)
+    - Listagens e coleções com a serialização compilada (ver produtos/serializacao.py)
     """
-    queryset = Produto.objects.select_related('categoria').prefetch_related('imagens')
+    queryset = Produto.objects.select_related('categoria')
     filter_backends = [
         DjangoFilterBackend,
-        filters.SearchFilter,
-        filters.OrderingFilter
+        OrdenacaoFilter,
+        BuscaTextualFilter  # Depois do OrderingFilter para poder ordenar por relevância
     ]
     filterset_class = ProdutoFilter
-    search_fields = ['nome', 'descricao', 'descricao_curta', 'meta_keywords']
-    ordering_fields = ['preco', 'nome', 'criado_em', 'visualizacoes', 'vendas']
+    ordering_fields = [
+        'preco', 'preco_final', 'desconto_percentual',
+        'nome', 'criado_em', 'visualizacoes', 'vendas'
+    ]
+    ordering_aliases = {'preco': 'preco_final'}  # Ordena pelo preço que o cliente paga
     ordering = ['-criado_em']
+    pagination_class = PaginacaoHibrida  # ?paginacao=cursor para paginação por keyset
+    renderer_classes = [OrjsonRenderer, BrowsableAPIRenderer]
 
     # ✅ ADICIONAR ISSO
     permission_classes = [IsAuthenticatedOrReadOnly]  # Leitura pública, escrita autenticada
@@ -95,10 +139,45 @@ class ProdutoViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        if self.action == 'list':
+        if self.action in ('list', 'facetas'):
             queryset = queryset.filter(ativo=True, disponivel=True)
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        context = self.get_serializer_context()
+        queryset = self.listar_colunar(request, context)
+        if queryset is None:
+            queryset = self.preparar_lista(self.filter_queryset(self.get_queryset()), ProdutoListSerializer, context)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.serializar_lista(page, ProdutoListSerializer, context))
+
+        return Response(self.serializar_lista(queryset, ProdutoListSerializer, context))
+
+    def listar_colunar(self, request, context):
+        """
+        Listagem pelo catálogo em memória (ver produtos/colunar.py): filtra,
+        conta e ordena no snapshot e busca no banco só os produtos da página.
+        None quando a consulta segue pelo ORM.
+        """
+        if not colunar.ativo() or self.paginator is None or self.paginator.usa_cursor(request):
+            return None
+        if request.query_params.get(BuscaTextualFilter.search_param, '').strip():
+            return None
+
+        queryset = self.get_queryset()
+        filterset = ProdutoFilter(request.query_params, queryset=queryset, request=request)
+        if not filterset.is_valid():
+            return None  # O ORM devolve os erros de validação
+        ordenacao = OrdenacaoFilter().get_ordering(request, queryset, self)
+        consulta = colunar.consulta(filterset.form.cleaned_data, ordenacao)
+        if consulta is None:
+            return None
+
+        buscar = lambda ids: self.preparar_lista(queryset.filter(id__in=ids), ProdutoListSerializer, context)
+        return colunar.catalogo().listar(*consulta, buscar=buscar)
+
     def retrieve(self, request, *args, **kwargs):
         """Override para incrementar visualizações"""
         instance = self.get_object()
@@ -109,50 +188,139 @@ class ProdutoViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def destaques(self, request):
         """Endpoint público: produtos em destaque"""
-        produtos = self.get_queryset().filter(
-            em_destaque=True,
-            ativo=True,
-            disponivel=True
-        )[:8]
-        serializer = ProdutoListSerializer(produtos, many=True)
-        return Response(serializer.data)
+        def calcular():
+            produtos = self.get_queryset().filter(
+                em_destaque=True,
+                ativo=True,
+                disponivel=True
+            )[:8]
+            return self.serializar_lista(self.preparar_lista(produtos, ProdutoListSerializer), ProdutoListSerializer)
+
+        return Response(colecao_em_cache('destaques', calcular))
 
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def promocoes(self, request):
         """Endpoint público: produtos em promoção"""
-        produtos = self.get_queryset().filter(
-            preco_promocional__isnull=False,
-            ativo=True,
-            disponivel=True
+        produtos = self.preparar_lista(
+            self.get_queryset().filter(em_promocao=True, ativo=True, disponivel=True).order_by('-criado_em'),
+            ProdutoListSerializer
         )
 
-        page = self.paginate_queryset(produtos)
-        if page is not None:
-            serializer = ProdutoListSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+        # Uma entrada por página (só o que o paginador lê); o modo cursor não passa pela cache
+        pagina = self.paginator.chave_pagina(request)
+        if pagina is None:
+            page = self.paginate_queryset(produtos)
+            return self.get_paginated_response(self.serializar_lista(page, ProdutoListSerializer))
 
-        serializer = ProdutoListSerializer(produtos, many=True)
-        return Response(serializer.data)
+        def calcular():
+            page = self.paginate_queryset(produtos)
+            return {
+                'count': self.paginator.page.paginator.count,
+                'results': self.serializar_lista(page, ProdutoListSerializer),
+            }
+
+        # Sem next/previous na cache: os links levam o host e a querystring de quem pediu
+        dados = colecao_em_cache('promocoes', calcular, chave_variacao(*pagina))
+        return self.paginator.resposta_da_pagina(request, dados['count'], dados['results'])
 
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def mais_vendidos(self, request):
-        """Endpoint público: produtos mais vendidos"""
-        produtos = self.get_queryset().filter(
-            ativo=True,
-            disponivel=True
-        ).order_by('-vendas')[:10]
-        serializer = ProdutoListSerializer(produtos, many=True)
-        return Response(serializer.data)
+        """
+        Endpoint público: produtos mais vendidos nos últimos ?dias= (7, 30 ou 90;
+        padrão 30), opcionalmente de uma ?categoria= (id). Lê as vendas diárias
+        (ver produtos/vendas.py).
+        """
+        erros = {}
+        dias = request.query_params.get('dias', '30')
+        if dias not in [str(janela) for janela in JANELAS]:
+            erros['dias'] = [f'Use uma das janelas: {", ".join(map(str, JANELAS))}.']
+        categoria = request.query_params.get('categoria') or None
+        if categoria is not None and not categoria.isdigit():
+            erros['categoria'] = ['Informe o id da categoria.']
+        if erros:
+            raise ValidationError(erros)
+
+        def calcular():
+            vendidos = ranking(int(dias), categoria=categoria, limite=10)
+            posicao = {produto_id: indice for indice, (produto_id, _) in enumerate(vendidos)}
+            produtos = self.get_queryset().filter(id__in=list(posicao))
+            dados = self.serializar_lista(self.preparar_lista(produtos, ProdutoListSerializer), ProdutoListSerializer)
+            return sorted(dados, key=lambda produto: posicao[produto['id']])
+
+        return Response(colecao_em_cache('mais_vendidos', calcular, chave_variacao(dias, categoria)))
+
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    def trending(self, request):
+        """Endpoint público: produtos em alta (visualizações e vendas recentes, ver produtos/tendencia.py)"""
+        def calcular():
+            produtos = self.get_queryset().filter(
+                ativo=True,
+                disponivel=True,
+                tendencia__gt=0
+            ).order_by('-tendencia', '-id')[:12]
+            return self.serializar_lista(self.preparar_lista(produtos, ProdutoListSerializer), ProdutoListSerializer)
+
+        return Response(colecao_em_cache('trending', calcular))
 
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def novidades(self, request):
         """Endpoint público: produtos mais recentes"""
-        produtos = self.get_queryset().filter(
-            ativo=True,
-            disponivel=True
-        ).order_by('-criado_em')[:12]
-        serializer = ProdutoListSerializer(produtos, many=True)
-        return Response(serializer.data)
+        def calcular():
+            produtos = self.get_queryset().filter(
+                ativo=True,
+                disponivel=True
+            ).order_by('-criado_em')[:12]
+            return self.serializar_lista(self.preparar_lista(produtos, ProdutoListSerializer), ProdutoListSerializer)
+
+        return Response(colecao_em_cache('novidades', calcular))
+
+    @action(detail=True, methods=['get'], permission_classes=[AllowAny])
+    def relacionados(self, request, pk=None):
+        """Endpoint público: produtos comprados junto com este (ver calcular_relacionados)"""
+        def calcular():
+            produto = get_object_or_404(Produto.objects.only('pk'), pk=pk)
+            produtos = self.get_queryset().filter(
+                relacionado_de__produto=produto,
+                ativo=True,
+                disponivel=True
+            ).order_by('-relacionado_de__score', 'id')
+            return self.serializar_lista(self.preparar_lista(produtos, ProdutoListSerializer), ProdutoListSerializer)
+
+        return Response(colecao_em_cache('relacionados', calcular, chave_variacao(pk)))
+
+    @action(detail=True, methods=['get'], permission_classes=[AllowAny])
+    def historico_precos(self, request, pk=None):
+        """
+        Endpoint público: preços que valeram entre ?de= e ?ate= (datas ou
+        datas/horas ISO; padrão: últimos 90 dias). Programações futuras não aparecem.
+        """
+        agora = timezone.now()
+        erros = {}
+        limites = {}
+        for parametro, padrao in [('de', agora - timedelta(days=90)), ('ate', agora)]:
+            valor = request.query_params.get(parametro)
+            if not valor:
+                limites[parametro] = padrao
+                continue
+            # Formato certo com data impossível (2024-02-30) levanta ValueError; 9999-12-31 + 1 dia, OverflowError
+            try:
+                momento = parse_datetime(valor) if 'T' in valor or ' ' in valor else None
+                if momento is None:
+                    data = parse_date(valor)
+                    # ?ate= com data inclui o dia inteiro
+                    momento = data and datetime.combine(data + timedelta(days=parametro == 'ate'), time.min)
+            except (ValueError, OverflowError):
+                momento = None
+            if momento is None:
+                erros[parametro] = ['Use AAAA-MM-DD ou AAAA-MM-DDTHH:MM.']
+                continue
+            limites[parametro] = timezone.make_aware(momento) if timezone.is_naive(momento) else momento
+        if erros:
+            raise ValidationError(erros)
+
+        produto = get_object_or_404(Produto.objects.only('pk'), pk=pk)
+        precos = produto.precos.no_periodo(limites['de'], min(limites['ate'], agora)).order_by('valido_de', 'id')
+        return Response(PrecoProdutoSerializer(precos, many=True).data)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
     def adicionar_imagem(self, request, pk=None):
@@ -173,25 +341,26 @@ class ProdutoViewSet(viewsets.ModelViewSet):
 
         q = request.query_params.get('q')
         if q:
-            queryset = queryset.filter(
-                Q(nome__icontains=q) |
-                Q(descricao__icontains=q) |
-                Q(descricao_curta__icontains=q)
-            )
+            queryset = queryset.buscar(q)
 
         preco_min = request.query_params.get('preco_min')
         preco_max = request.query_params.get('preco_max')
         if preco_min:
-            queryset = queryset.filter(preco__gte=preco_min)
+            queryset = queryset.filter(preco_final__gte=preco_min)
         if preco_max:
-            queryset = queryset.filter(preco__lte=preco_max)
+            queryset = queryset.filter(preco_final__lte=preco_max)
 
         categorias = request.query_params.getlist('categorias[]')
         if categorias:
             queryset = queryset.filter(categoria_id__in=categorias)
 
-        ordenar = request.query_params.get('ordenar', '-criado_em')
-        queryset = queryset.order_by(ordenar)
+        ordenar = request.query_params.get('ordenar')
+        if ordenar:
+            queryset = queryset.order_by(*aplicar_apelidos([ordenar], self.ordering_aliases))
+        elif q:
+            queryset = queryset.order_by('-relevancia', '-criado_em')
+        else:
+            queryset = queryset.order_by('-criado_em')
 
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -199,4 +368,66 @@ class ProdutoViewSet(viewsets.ModelViewSet):
             return self.get_paginated_response(serializer.data)
 
         serializer = ProdutoListSerializer(queryset, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    def facetas(self, request):
+        """
+        Endpoint público: contagens da barra de filtros (categorias, faixas de
+        preço, promoção, destaque e estoque). Aceita os mesmos filtros da
+        listagem (ProdutoFilter e ?search=).
+        """
+        filterset = ProdutoFilter(request.query_params, queryset=self.get_queryset(), request=request)
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+
+        termo = request.query_params.get(BuscaTextualFilter.search_param, '').strip()
+
+        def calcular():
+            queryset = BuscaTextualFilter().filter_queryset(request, filterset.qs, self)
+            return contar_facetas(queryset, settings.FACETAS_FAIXAS_PRECO)
+
+        # Mesma chave para filtros equivalentes (ordem, parâmetros vazios, 10 == 10.00...)
+        filtros = sorted(
+            (nome, str(valor.normalize()) if hasattr(valor, 'normalize') else str(valor))
+            for nome, valor in filterset.form.cleaned_data.items()
+            if valor not in (None, '')
+        )
+        variacao = chave_variacao(*filtros, ' '.join(termo.lower().split()))
+        return Response(colecao_em_cache('facetas', calcular, variacao))
+
+
+@require_GET
+def feed_produtos(request):
+    """
+    Feed público do catálogo (produtos ativos e disponíveis) em ?formato=csv,
+    xml (Google Shopping, padrão) ou jsonl. Em streaming, com gzip se o
+    cliente aceitar (ver produtos/feed.py).
+    """
+    formato = request.GET.get('formato', 'xml')
+    if formato not in ('csv', 'xml', 'jsonl'):
+        return JsonResponse({'formato': ['Use csv, xml ou jsonl.']}, status=400)
+
+    info = feed.FORMATOS[formato]
+    linhas = feed.gerar(formato, feed.produtos(), request.build_absolute_uri('/'))
+    return feed.resposta(request, linhas, info.content_type, f'produtos.{info.extensao}')
+
+
+@require_GET
+def sitemap_indice(request):
+    """Sitemap index: um sitemap por shard de produtos"""
+    url_shard = lambda shard: request.build_absolute_uri(reverse('sitemap-produtos', args=[shard]))
+    return feed.resposta(request, feed.indice_sitemap(feed.shards(), url_shard), 'application/xml')
+
+
+@require_GET
+def sitemap_produtos(request, shard):
+    """Sitemap das páginas dos produtos de um shard"""
+    if shard * feed.produtos_por_shard() >= 2**63:
+        raise Http404
+    linhas = iter(feed.produtos(shard))
+    primeiro = next(linhas, None)
+    if primeiro is None:
+        raise Http404
+    pedacos = feed.gerar('sitemap', itertools.chain([primeiro], linhas), request.build_absolute_uri('/'))
+    return feed.resposta(request, pedacos, 'application/xml')
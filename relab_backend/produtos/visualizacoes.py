@@ -0,0 +1,116 @@
+# produtos/visualizacoes.py
+"""
+Contador de visualizações com escrita em lote (write-behind).
+
+Cada visualização só incrementa um contador em memória. Uma thread do próprio
+processo grava os acumulados a cada VISUALIZACOES_INTERVALO_FLUSH segundos com
+um único `UPDATE ... FROM (VALUES ...)`, então a linha de um produto muito
+acessado é travada uma vez por intervalo, e não uma vez por requisição.
+
+No encerramento do processo (atexit) os pendentes são gravados; em uma queda
+abrupta perde-se no máximo um intervalo.
+
+A thread é de cada processo: um fork (workers do gunicorn com --preload, por
+exemplo) zera o estado no filho, que inicia a própria thread na primeira
+visualização. Os pendentes herdados continuam sendo do pai.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger(__name__)
+
+
+class ContadorVisualizacoes:
+
+    def __init__(self, intervalo):
+        # intervalo <= 0 grava cada visualização imediatamente (útil em testes)
+        self.intervalo = intervalo
+        self.pendentes = Counter()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def registrar(self, produto_id, quantidade=1):
+        """Acumula uma visualização do produto para a próxima gravação"""
+        if self.intervalo <= 0:
+            self.gravar({produto_id: quantidade})
+            return
+
+        with self.lock:
+            self.pendentes[produto_id] += quantidade
+            if self.thread is None:
+                self._iniciar()
+
+    def flush(self):
+        """Grava os acumulados no banco. Retorna quantas visualizações foram gravadas"""
+        with self.lock:
+            pendentes, self.pendentes = self.pendentes, Counter()
+
+        if not pendentes:
+            return 0
+
+        try:
+            self.gravar(pendentes)
+        except Exception:
+            # Devolve ao buffer para a próxima tentativa
+            with self.lock:
+                self.pendentes.update(pendentes)
+            raise
+
+        return sum(pendentes.values())
+
+    def gravar(self, contagens):
+        """Um único UPDATE para todos os produtos, em ordem de id (evita deadlocks entre processos)"""
+        from .models import Produto
+
+        itens = sorted(contagens.items())
+        valores = ', '.join(['(%s::bigint, %s::integer)'] * len(itens))
+        parametros = [valor for item in itens for valor in item]
+        tabela = connection.ops.quote_name(Produto._meta.db_table)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {tabela} AS p '
+                f'SET visualizacoes = p.visualizacoes + v.quantidade '
+                f'FROM (VALUES {valores}) AS v(id, quantidade) '
+                f'WHERE p.id = v.id',
+                parametros
+            )
+
+    def _iniciar(self):
+        self.thread = threading.Thread(target=self._loop, name='flush-visualizacoes', daemon=True)
+        self.thread.start()
+
+    def _apos_fork(self):
+        """No filho só existe a thread que chamou fork(): a de flush e a trava ficaram com o pai"""
+        self.pendentes = Counter()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def _loop(self):
+        while True:
+            time.sleep(self.intervalo)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Falha ao gravar visualizações; nova tentativa no próximo intervalo')
+
+    def _flush_final(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Falha ao gravar visualizações pendentes no encerramento')
+
+
+contador = ContadorVisualizacoes(getattr(settings, 'VISUALIZACOES_INTERVALO_FLUSH', 10))
+
+# Registrados uma vez por processo (não dá para desfazer): valem para o `contador` do módulo
+atexit.register(lambda: contador._flush_final())
+os.register_at_fork(after_in_child=lambda: contador._apos_fork())
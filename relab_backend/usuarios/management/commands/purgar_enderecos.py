@@ -0,0 +1,38 @@
+# usuarios/management/commands/purgar_enderecos.py
+
+from datetime import timedelta
+
+from django.utils import timezone
+from pedidos.models import Pedido
+from usuarios.models import Endereco
+from usuarios.purga import ComandoPurga
+
+# Endereços excluídos pelo usuário (ativo = false) que nenhum pedido usa;
+# os que têm pedido ficam, pelo histórico de entrega (Pedido.endereco é PROTECT)
+APAGAR = """
+    WITH enderecos AS (
+        DELETE FROM {enderecos} endereco
+        WHERE endereco.id >= %(de)s AND endereco.id < %(ate)s
+          AND NOT endereco.ativo AND endereco.atualizado_em < %(limite)s
+          AND NOT EXISTS (SELECT 1 FROM {pedidos} pedido WHERE pedido.endereco_id = endereco.id)
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM enderecos
+"""
+
+
+class Command(ComandoPurga):
+    help = 'Apaga, em faixas de id, os endereços inativos sem nenhum pedido'
+    modelo = Endereco
+    sql = APAGAR
+    rotulos = ('endereço(s)',)
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--dias', type=int, default=30, help='Dias desde a exclusão para o endereço ser apagado')
+
+    def tabelas(self):
+        return {'enderecos': Endereco._meta.db_table, 'pedidos': Pedido._meta.db_table}
+
+    def parametros(self, options):
+        return {'limite': timezone.now() - timedelta(days=options['dias'])}
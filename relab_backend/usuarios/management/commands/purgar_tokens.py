@@ -0,0 +1,37 @@
+# usuarios/management/commands/purgar_tokens.py
+
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from usuarios.purga import ComandoPurga
+
+# Refresh tokens vencidos da faixa e a entrada deles na blacklist (em lotes,
+# ao contrário do flushexpiredtokens do simplejwt, que apaga tudo de uma vez)
+APAGAR = """
+    WITH alvo AS (
+        SELECT id FROM {emitidos}
+        WHERE id >= %(de)s AND id < %(ate)s AND expires_at <= %(agora)s
+    ),
+    bloqueados AS (
+        DELETE FROM {bloqueados} WHERE token_id IN (SELECT id FROM alvo) RETURNING 1
+    ),
+    emitidos AS (
+        DELETE FROM {emitidos} WHERE id IN (SELECT id FROM alvo) RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM emitidos), (SELECT COUNT(*) FROM bloqueados)
+"""
+
+
+class Command(ComandoPurga):
+    help = 'Apaga, em faixas de id, os refresh tokens expirados (emitidos e na blacklist)'
+    modelo = OutstandingToken
+    sql = APAGAR
+    rotulos = ('token(s) expirado(s)', 'entrada(s) da blacklist')
+
+    def tabelas(self):
+        return {
+            'emitidos': OutstandingToken._meta.db_table,
+            'bloqueados': BlacklistedToken._meta.db_table,
+        }
+
+    def parametros(self, options):
+        return {'agora': timezone.now()}
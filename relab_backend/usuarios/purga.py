@@ -0,0 +1,61 @@
+# usuarios/purga.py
+"""
+Base dos comandos de purga (purgar_carrinhos, purgar_tokens, purgar_enderecos).
+
+A tabela é percorrida em faixas de chave primária ([de, de + lote)), do menor
+ao maior id existente no início: cada faixa é um único statement em
+autocommit, que só trava as linhas da faixa e gera WAL limitado, com
+--pausa segundos entre elas para a réplica e o autovacuum acompanharem.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max, Min
+
+
+class ComandoPurga(BaseCommand):
+    # Tabela percorrida por faixas de id
+    modelo = None
+    # DELETE(s) de uma faixa (%(de)s, %(ate)s); o SELECT final devolve uma contagem por rótulo
+    sql = None
+    rotulos = ()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help='Largura de cada faixa de ids')
+        parser.add_argument('--pausa', type=float, default=0.1, help='Segundos de espera entre faixas')
+
+    def tabelas(self):
+        """Placeholders de `sql` ({tabela} -> db_table)"""
+        return {}
+
+    def parametros(self, options):
+        return {}
+
+    def handle(self, *args, **options):
+        lote, pausa = options['lote'], options['pausa']
+        inicio = time.perf_counter()
+        faixa = self.modelo.objects.aggregate(menor=Min('pk'), maior=Max('pk'))
+        totais = [0] * len(self.rotulos)
+        faixas = 0
+
+        if faixa['menor'] is not None:
+            sql = self.sql.format(**self.tabelas())
+            parametros = self.parametros(options)
+            for de in range(faixa['menor'], faixa['maior'] + 1, lote):
+                if faixas:
+                    time.sleep(pausa)
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, {**parametros, 'de': de, 'ate': de + lote})
+                    apagados = cursor.fetchone()
+                faixas += 1
+                totais = [total + n for total, n in zip(totais, apagados)]
+                if options['verbosity'] > 1 and any(apagados):
+                    self.stdout.write(f'  ids {de}..{de + lote - 1}: ' + self.resumo(apagados))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Apagados: {self.resumo(totais)} em {time.perf_counter() - inicio:.1f}s ({faixas} faixa(s))'
+        ))
+
+    def resumo(self, contagens):
+        return ', '.join(f'{n} {rotulo}' for n, rotulo in zip(contagens, self.rotulos))
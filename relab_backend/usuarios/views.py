@@ -23,7 +23,11 @@ class CustomTokenObtainPairView(TokenObtainPairView):
         response = super().post(request, *args, **kwargs)
 
         if response.status_code == status.HTTP_200_OK:
+            from carrinho.visitante import CarrinhoVisitante
+
             user = Usuario.objects.get(email=request.data.get('email'))
+            # Carrinho montado antes do login (cabeçalho X-Carrinho) passa para o usuário
+            CarrinhoVisitante.da_requisicao(request).mesclar(user)
             response.data['user'] = {
                 'id': user.id,
                 'email': user.email,